@@ -3,51 +3,24 @@ import {
   ComposedChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer
 } from 'recharts';
 
-const EngagementComparison = ({ allComments }) => {
+const EngagementComparison = ({ aggregates }) => {
   // Colores
   const COLORS = {
     success: '#10b981',
     blue: '#3b82f6'
   };
 
-  // Definición de tipos de toxicidad
-  const TOXICITY_TYPES = [
-    'toxic', 'hatespeech', 'abusive', 'threat', 
-    'provocative', 'obscene', 'racist', 'nationalist',
-    'sexist', 'homophobic', 'religious_hate', 'radicalism'
-  ];
-
-  // Función helper para calcular toxicidad general
-  const isToxicGeneral = (comment) => {
-    return TOXICITY_TYPES.some(type => comment[`is_${type}`]);
-  };
-
-  // Cálculos
+  // Cálculos: likes medios de comentarios tóxicos vs limpios, agregados en el servidor
   const engagementData = useMemo(() => {
-    if (!allComments.length) return [];
-
-    // Correlación engagement vs toxicidad
-    const engagementAnalysis = allComments.reduce((acc, comment) => {
-      const isToxic = isToxicGeneral(comment);
-      const category = isToxic ? 'toxic' : 'clean';
-      
-      if (!acc[category]) {
-        acc[category] = { totalLikes: 0, count: 0 };
-      }
-      
-      acc[category].totalLikes += (comment.total_likes_comment || 0);
-      acc[category].count += 1;
-      
-      return acc;
-    }, {});
+    const engagement = aggregates?.engagement || [];
 
     // Datos para el gráfico
-    return Object.entries(engagementAnalysis).map(([category, data]) => ({
+    return engagement.map(({ category, avg_likes, total_comments }) => ({
       category: category === 'toxic' ? 'Toxic Comments' : 'Clean Comments',
-      avgLikes: data.count > 0 ? parseFloat((data.totalLikes / data.count).toFixed(1)) : 0,
-      totalComments: data.count
+      avgLikes: avg_likes,
+      totalComments: total_comments
     }));
-  }, [allComments]);
+  }, [aggregates]);
 
   return (
     <div className="p-6 bg-white shadow-lg rounded-xl">
@@ -9,14 +9,7 @@ import {
 } from 'lucide-react';
 
 // Componente para vista global
-export const GlobalMetricCards = ({ allComments, allVideoStats }) => {
-  // Definición de tipos de toxicidad
-  const TOXICITY_TYPES = [
-    'toxic', 'hatespeech', 'abusive', 'threat', 
-    'provocative', 'obscene', 'racist', 'nationalist',
-    'sexist', 'homophobic', 'religious_hate', 'radicalism'
-  ];
-
+export const GlobalMetricCards = ({ aggregates }) => {
   const TOXICITY_LABELS = {
     toxic: 'General Toxic',
     hatespeech: 'Hate Speech',
@@ -32,57 +25,23 @@ export const GlobalMetricCards = ({ allComments, allVideoStats }) => {
     radicalism: 'Radicalism'
   };
 
-  // Función helper para calcular toxicidad general
-  const isToxicGeneral = (comment) => {
-    return TOXICITY_TYPES.some(type => comment[`is_${type}`]);
-  };
-
-  // Cálculos
+  // Cálculos: los agregados ya vienen calculados por el servidor (/api/aggregates/global)
   const metrics = useMemo(() => {
-    if (!allComments.length) return null;
-    
-    const totalComments = allComments.length;
-    const totalVideos = allVideoStats.length;
-    
-    // Toxicidad general
-    const toxicGeneralCount = allComments.filter(isToxicGeneral).length;
-    const toxicGeneralRate = (toxicGeneralCount / totalComments * 100).toFixed(1);
-    
-    // Análisis detallado de toxicidad
-    const toxicityBreakdown = {};
-    TOXICITY_TYPES.forEach(type => {
-      const count = allComments.filter(c => c[`is_${type}`]).length;
-      toxicityBreakdown[type] = {
-        count,
-        percentage: (count / totalComments * 100).toFixed(1)
-      };
-    });
-    
-    // Tipo más frecuente
-    const mostFrequentType = Object.entries(toxicityBreakdown)
-      .sort(([,a], [,b]) => b.count - a.count)[0];
-    
-    // Videos por riesgo
-    const videoRiskAnalysis = allVideoStats.map(videoItem => {
-      const videoComments = allComments.filter(c => c.video_id === videoItem.video_id);
-      const toxicCount = videoComments.filter(isToxicGeneral).length;
-      const toxicRate = videoComments.length > 0 ? 
-        (toxicCount / videoComments.length * 100) : 0;
-      
-      return { toxic_rate: parseFloat(toxicRate.toFixed(1)) };
-    });
-    
-    const highRiskVideos = videoRiskAnalysis.filter(v => v.toxic_rate > 15).length;
+    if (!aggregates?.totals?.total_comments) return null;
+
+    const { totals, categories = [] } = aggregates;
+    // categories viene ordenado de mayor a menor número de comentarios
+    const top = categories[0];
 
     return {
-      totalComments,
-      totalVideos,
-      toxicGeneralCount,
-      toxicGeneralRate,
-      mostFrequentType,
-      highRiskVideos
+      totalComments: totals.total_comments,
+      totalVideos: totals.total_videos,
+      toxicGeneralCount: totals.toxic_count,
+      toxicGeneralRate: Number(totals.toxic_rate).toFixed(1),
+      mostFrequentType: top ? [top.type, { count: top.count, percentage: Number(top.percentage).toFixed(1) }] : null,
+      highRiskVideos: totals.high_risk_videos
     };
-  }, [allComments, allVideoStats]);
+  }, [aggregates]);
 
   if (!metrics) return null;
 
@@ -4,7 +4,7 @@ import {
 } from 'recharts';
 import { BarChart3 } from 'lucide-react';
 
-const ToxicityDistribution = ({ allComments }) => {
+const ToxicityDistribution = ({ aggregates }) => {
   // Colores y configuración
   const TOXICITY_TYPES = [
     'toxic', 'hatespeech', 'abusive', 'threat', 
@@ -27,20 +27,14 @@ const ToxicityDistribution = ({ allComments }) => {
     radicalism: 'Radicalism'
   };
 
-  // Cálculos
+  // Cálculos: conteos por categoría agregados en el servidor
   const toxicityChartData = useMemo(() => {
-    if (!allComments || allComments.length === 0) return [];
+    const categories = aggregates?.categories || [];
+    if (!categories.length) return [];
     
-    const totalComments = allComments.length;
-    
-    // Análisis detallado de toxicidad
     const toxicityBreakdown = {};
-    TOXICITY_TYPES.forEach(type => {
-      const count = allComments.filter(c => c[`is_${type}`]).length;
-      toxicityBreakdown[type] = {
-        count,
-        percentage: (count / totalComments * 100).toFixed(1)
-      };
+    categories.forEach(({ type, count, percentage }) => {
+      toxicityBreakdown[type] = { count, percentage: Number(percentage).toFixed(1) };
     });
     
     // Datos para gráfico de barras
@@ -59,7 +53,7 @@ const ToxicityDistribution = ({ allComments }) => {
         value: 0,
         count: 0
       }));
-  }, [allComments]);
+  }, [aggregates]);
 
   const hasData = toxicityChartData.some(item => item.value > 0);
 
@@ -121,7 +115,7 @@ const ToxicityDistribution = ({ allComments }) => {
               <p className="mt-1 text-sm">All comments appear to be clean</p>
               <div className="p-3 mt-4 rounded-lg bg-green-50">
                 <p className="text-sm text-green-700">
-                  ✅ {allComments?.length || 0} comments analyzed
+                  ✅ {aggregates?.totals?.total_comments || 0} comments analyzed
                 </p>
               </div>
             </div>
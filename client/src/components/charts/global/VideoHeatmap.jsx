@@ -1,40 +1,8 @@
 import React, { useMemo } from 'react';
 
-const VideoHeatmap = ({ allComments, allVideoStats, onVideoSelect }) => {
-  // Definición de tipos de toxicidad
-  const TOXICITY_TYPES = [
-    'toxic', 'hatespeech', 'abusive', 'threat', 
-    'provocative', 'obscene', 'racist', 'nationalist',
-    'sexist', 'homophobic', 'religious_hate', 'radicalism'
-  ];
-
-  // Función helper para calcular toxicidad general
-  const isToxicGeneral = (comment) => {
-    return TOXICITY_TYPES.some(type => comment[`is_${type}`]);
-  };
-
-  // Cálculo de datos del heatmap
-  const heatmapData = useMemo(() => {
-    if (!allComments.length || !allVideoStats.length) return [];
-
-    // Videos por riesgo
-    const videoRiskAnalysis = allVideoStats.map(videoItem => {
-      const videoComments = allComments.filter(c => c.video_id === videoItem.video_id);
-      const toxicCount = videoComments.filter(isToxicGeneral).length;
-      const toxicRate = videoComments.length > 0 ? 
-        (toxicCount / videoComments.length * 100) : 0;
-      
-      return {
-        video_id: videoItem.video_id,
-        total_comments: videoComments.length,
-        toxic_count: toxicCount,
-        toxic_rate: parseFloat(toxicRate.toFixed(1))
-      };
-    });
-
-    // Ordenar por tasa de toxicidad y retornar top 10
-    return videoRiskAnalysis.sort((a, b) => b.toxic_rate - a.toxic_rate).slice(0, 10);
-  }, [allComments, allVideoStats]);
+const VideoHeatmap = ({ aggregates, onVideoSelect }) => {
+  // Top 10 de videos por tasa de toxicidad, ya ordenado por el servidor
+  const heatmapData = useMemo(() => aggregates?.videos || [], [aggregates]);
 
   return (
     <div className="p-6 bg-white shadow-lg rounded-xl">
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useMemo } from 'react';
 import { 
-  getSentimentAnalyzerAll,
+  getGlobalAggregates,
   getSentimentAnalyzerByVideo,
   getVideoStatisticsAll,
   getVideoStatisticsById
@@ -25,7 +25,7 @@ const Statistics = () => {
   const videoIdFromUrl = pathParts.length > 1 && pathParts[0] === 'statistics' && pathParts[1] !== '' ? pathParts[1] : null;
   
   // Estados principales
-  const [allComments, setAllComments] = useState([]);
+  const [globalAggregates, setGlobalAggregates] = useState(null);
   const [allVideoStats, setAllVideoStats] = useState([]);
   const [specificVideoComments, setSpecificVideoComments] = useState([]);
   const [specificVideoStats, setSpecificVideoStats] = useState(null);
@@ -43,12 +43,13 @@ const Statistics = () => {
       try {
         if (activeView === 'global') {
           console.log('🔄 Cargando datos globales...');
-          const [commentsResponse, statsResponse] = await Promise.all([
-            getSentimentAnalyzerAll(),
+          // Solo agregados (pocos KB) + lista de videos para el selector
+          const [aggregatesResponse, statsResponse] = await Promise.all([
+            getGlobalAggregates(),
             getVideoStatisticsAll()
           ]);
           
-          setAllComments(commentsResponse.comments || []);
+          setGlobalAggregates(aggregatesResponse);
           setAllVideoStats(statsResponse.video_statistics || []);
           console.log('✅ Datos globales cargados');
           
@@ -154,25 +155,21 @@ const Statistics = () => {
         {activeView === 'global' && (
           <>
             {/* Cards de métricas clave */}
-            <GlobalMetricCards 
-              allComments={allComments} 
-              allVideoStats={allVideoStats} 
-            />
+            <GlobalMetricCards aggregates={globalAggregates} />
 
             {/* Gráficos principales */}
             <div className="grid grid-cols-1 gap-8 mb-8 xl:grid-cols-2">
               {/* Gráfico de distribución de toxicidad */}
-              <ToxicityDistribution allComments={allComments} />
+              <ToxicityDistribution aggregates={globalAggregates} />
               
               {/* Heatmap de videos */}
               <VideoHeatmap 
-                allComments={allComments} 
-                allVideoStats={allVideoStats}
+                aggregates={globalAggregates}
                 onVideoSelect={handleVideoSelect}
               />
               
               {/* Engagement vs toxicidad */}
-              <EngagementComparison allComments={allComments} />
+              <EngagementComparison aggregates={globalAggregates} />
             </div>
           </>
         )}
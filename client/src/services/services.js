@@ -43,11 +43,30 @@ export const analyzeYouTubeVideo = async (videoUrl, maxComments = 100) => {
 // SENTIMENT ANALYZER SERVICES
 // ========================================
 
+// Recorre todas las páginas (cursor keyset) de un endpoint de comentarios
+// params admite: fields ("text,toxic_probability"), toxic_only, category, min_probability,
+// sentiment_type, order_by ("id" | "likes"), limit (tamaño de página)
+const fetchAllCommentPages = async (url, params = {}, maxPages = Infinity) => {
+    const comments = [];
+    let cursor = null;
+    let pages = 0;
+    do {
+        const response = await axios.get(url, {
+            params: { limit: 5000, ...params, ...(cursor ? { cursor } : {}) },
+            paramsSerializer: { indexes: null } // category=a&category=b
+        });
+        comments.push(...(response.data.comments || []));
+        cursor = response.data.next_cursor;
+        pages += 1;
+    } while (cursor && pages < maxPages);
+    return comments;
+};
+
 // Get all sentiment analyzer data
-export const getSentimentAnalyzerAll = async () => {
+export const getSentimentAnalyzerAll = async (params = {}) => {
     try {
-        const response = await axios.get(`${API_URL}/sentiment-analyzer/all`);
-        return response.data;
+        const comments = await fetchAllCommentPages(`${API_URL}/sentiment-analyzer/all`, params);
+        return { total_comments: comments.length, comments, source: "sentiment_analyzer_table" };
     } catch (error) {
         console.error('❌ Error getting all sentiment analyzer data:', error.message);
         throw new Error(`Error while obtaining all sentiment data: ${error.response?.data?.detail || error.message}`);
@@ -55,15 +74,15 @@ export const getSentimentAnalyzerAll = async () => {
 };
 
 // Get sentiment analyzer data by video ID
-export const getSentimentAnalyzerByVideo = async (videoId) => {
+export const getSentimentAnalyzerByVideo = async (videoId, params = {}) => {
     if (!videoId) {
         throw new Error("Se requiere el ID del video para obtener datos de sentiment analyzer");
     }
     
     try {
         // Convertir videoId (camelCase) a video_id (snake_case) para el endpoint
-        const response = await axios.get(`${API_URL}/sentiment-analyzer/video/${videoId}`);
-        return response.data;
+        const comments = await fetchAllCommentPages(`${API_URL}/sentiment-analyzer/video/${videoId}`, params);
+        return { video_id: videoId, total_comments: comments.length, comments, source: "sentiment_analyzer_table" };
     } catch (error) {
         const errorMessage = error.response?.data?.detail || 
                           (error.response?.status === 404 ? 
@@ -74,6 +93,17 @@ export const getSentimentAnalyzerByVideo = async (videoId) => {
     }
 };
 
+// Aggregated datasets for the global dashboard (computed server-side)
+export const getGlobalAggregates = async (params = {}) => {
+    try {
+        const response = await axios.get(`${API_URL}/aggregates/global`, { params });
+        return response.data;
+    } catch (error) {
+        console.error('❌ Error getting global aggregates:', error.message);
+        throw new Error(`Error while obtaining global statistics: ${error.response?.data?.detail || error.message}`);
+    }
+};
+
 // ========================================
 // VIDEO STATISTICS SERVICES
 // ========================================
@@ -0,0 +1,140 @@
+from dotenv import load_dotenv
+import os, json, time, hashlib, logging, requests
+from pathlib import Path
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Modos de la caché de respuestas de la API de YouTube:
+#   off    -> sin caché, siempre red (por defecto)
+#   cache  -> sirve desde disco mientras no caduque el TTL y revalida con ETag / If-None-Match
+#   record -> siempre red, pero guarda cada respuesta (sin caducidad) para reproducirla después
+#   replay -> solo disco, sin red; un fallo de caché es un error (fixture offline para benchmarks)
+CACHE_MODES = ("off", "cache", "record", "replay")
+
+# Parámetros que no forman parte de la clave (ni se guardan en disco)
+IGNORED_PARAMS = {"key"}
+
+# Cliente HTTP compartido: reutiliza conexiones TLS (keep-alive) entre páginas y entre
+# peticiones en lugar de abrir una nueva en cada requests.get
+YOUTUBE_HTTP_POOL_SIZE = int(os.getenv("YOUTUBE_HTTP_POOL_SIZE", "16"))
+YOUTUBE_HTTP_TIMEOUT = float(os.getenv("YOUTUBE_HTTP_TIMEOUT", "30"))
+
+http = requests.Session()
+http.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=YOUTUBE_HTTP_POOL_SIZE))
+
+
+class CacheMiss(Exception):
+    """Respuesta no encontrada en disco en modo replay"""
+
+
+class ResponseCache:
+    def __init__(self, cache_dir=".cache/youtube", ttl=3600, mode="off"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Modo de caché no válido: {mode}. Usa uno de {CACHE_MODES}")
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def make_key(self, endpoint, params):
+        # Clave = endpoint + parámetros ordenados (incluye pageToken), sin la API key
+        relevant = {k: v for k, v in sorted(params.items()) if k not in IGNORED_PARAMS}
+        raw = json.dumps({"endpoint": endpoint, "params": relevant}, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.json"
+
+    def load(self, key):
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"⚠️ Entrada de caché corrupta, se ignora ({path.name}): {e}")
+            return None
+
+    def store(self, key, endpoint, params, body, etag=None):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "endpoint": endpoint,
+            "params": {k: v for k, v in params.items() if k not in IGNORED_PARAMS},
+            "etag": etag,
+            "stored_at": time.time(),
+            "body": body,
+        }
+        # Escritura atómica: nunca queda un JSON a medias si el proceso muere
+        tmp_path = self._path(key).with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(key))
+        return entry
+
+    def is_fresh(self, entry):
+        if self.mode in ("record", "replay"):
+            return True
+        return (time.time() - entry.get("stored_at", 0)) < self.ttl
+
+    def get_json(self, endpoint, params):
+        """
+        GET a la API pasando por la caché según el modo configurado
+        """
+        if self.mode == "off":
+            return _request_json(endpoint, params)
+
+        key = self.make_key(endpoint, params)
+        entry = self.load(key) if self.mode != "record" else None
+
+        if self.mode == "replay":
+            if entry is None:
+                self.misses += 1
+                raise CacheMiss(f"Sin respuesta grabada para {endpoint} {params.get('pageToken') or ''}")
+            self.hits += 1
+            return entry["body"]
+
+        if entry is not None and self.is_fresh(entry):
+            self.hits += 1
+            logger.debug(f"💾 Respuesta servida desde caché ({key[:8]})")
+            return entry["body"]
+
+        headers = {}
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+
+        response = http.get(endpoint, params=params, headers=headers, timeout=YOUTUBE_HTTP_TIMEOUT)
+        logger.debug(f"📦 Estado HTTP comentarios: {response.status_code}")
+
+        if response.status_code == 304 and entry is not None:
+            # No ha cambiado: se renueva el TTL sin volver a descargar el cuerpo
+            self.revalidated += 1
+            entry = self.store(key, endpoint, params, entry["body"], etag=entry.get("etag"))
+            logger.debug(f"♻️ Respuesta revalidada con ETag ({key[:8]})")
+            return entry["body"]
+
+        response.raise_for_status()
+        body = response.json()
+        self.misses += 1
+        etag = response.headers.get("ETag") or body.get("etag")
+        self.store(key, endpoint, params, body, etag=etag if isinstance(etag, str) else None)
+        return body
+
+
+def _request_json(endpoint, params):
+    response = http.get(endpoint, params=params, timeout=YOUTUBE_HTTP_TIMEOUT)
+    logger.debug(f"📦 Estado HTTP comentarios: {response.status_code}")
+    response.raise_for_status()
+    return response.json()
+
+
+def cache_from_env():
+    return ResponseCache(
+        cache_dir=os.getenv("YOUTUBE_CACHE_DIR", ".cache/youtube"),
+        ttl=float(os.getenv("YOUTUBE_CACHE_TTL", "3600")),
+        mode=os.getenv("YOUTUBE_CACHE_MODE", "off"),
+    )
@@ -1,33 +1,116 @@
 from dotenv import load_dotenv
-import os, requests, time, pandas as pd
+import os, time, pandas as pd
 import re
+import logging
+from datetime import datetime, timezone
+
+from etl.response_cache import ResponseCache, cache_from_env
 
 load_dotenv()
 API_KEY = os.getenv("API_KEY")
 
+# Caché opcional de respuestas (YOUTUBE_CACHE_MODE=off|cache|record|replay)
+response_cache = cache_from_env()
+
+logger = logging.getLogger(__name__)
+# Hook opcional de métricas: page_observer(segundos, items) por cada página de commentThreads
+# (lo instala el servidor; el ETL no depende de él)
+page_observer = None
+
+def configure_cache(mode="cache", cache_dir=".cache/youtube", ttl=3600):
+    """Cambia la caché de respuestas en caliente (tests, benchmarks, notebooks)"""
+    global response_cache
+    response_cache = ResponseCache(cache_dir=cache_dir, ttl=ttl, mode=mode)
+    return response_cache
+
 def extract_video_id(url_or_id):
-    print(f"🔍 Extrayendo ID del vídeo de: {url_or_id}")
+    logger.debug(f"🔍 Extrayendo ID del vídeo de: {url_or_id}")
     pattern = r"(?:v=|\/)([0-9A-Za-z_-]{11}).*"
     match = re.search(pattern, url_or_id)
     if match:
         video_id = match.group(1)
-        print(f"✅ ID extraído: {video_id}")
+        logger.debug(f"✅ ID extraído: {video_id}")
         return video_id
     else:
-        print(f"⚠️ No se pudo extraer ID, asumiendo input es ID directo: {url_or_id}")
+        logger.debug(f"⚠️ No se pudo extraer ID, asumiendo input es ID directo: {url_or_id}")
         return url_or_id
 
-def fetch_comment_threads(video_id, max_total=100000, delay=1):
-    print(f"▶️ Iniciando extracción de comentarios para video {video_id}")
+def _parse_published_at(value):
+    # YouTube devuelve "2024-01-01T00:00:00Z"; Supabase "2024-01-01T00:00:00+00:00"
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def _reply_row(video_id, thread_id, rep):
+    rps = rep["snippet"]
+    return {
+        "threadId": thread_id,
+        "commentId": rep["id"],
+        "videoId": video_id,
+        "author": rps.get("authorDisplayName"),
+        "authorChannelId": rps.get("authorChannelId", {}).get("value"),
+        "isReply": True,
+        "parentCommentId": rps.get("parentId"),
+        "publishedAtComment": rps.get("publishedAt"),
+        "text": rps.get("textDisplay"),
+        "like_count_comment": rps.get("likeCount"),
+        "replyCount": None
+    }
+
+def fetch_replies(video_id, thread_id, skip_ids=(), max_total=100000):
+    """
+    Todas las respuestas de un hilo (comments.list con parentId), salvo las de skip_ids
+    """
+    url = "https://www.googleapis.com/youtube/v3/comments"
+    replies = []
+    token = None
+    while len(replies) < max_total:
+        params = {
+            "part": "snippet",
+            "parentId": thread_id,
+            "maxResults": 100,
+            "textFormat": "plainText",
+            "key": API_KEY
+        }
+        if token:
+            params["pageToken"] = token
+        data = response_cache.get_json(url, params)
+        replies += [_reply_row(video_id, thread_id, rep) for rep in data.get("items", []) if rep["id"] not in skip_ids]
+        token = data.get("nextPageToken")
+        if not token:
+            break
+    return replies[:max_total]
+
+def fetch_comment_threads(video_id, max_total=100000, delay=1, order=None, known_threads=None, since=None):
+    """
+    Descarga hilos de comentarios (y sus respuestas) de un vídeo.
+
+    Modo incremental: known_threads(ids) recibe los ids de hilo de cada página y devuelve
+    {hilo ya guardado: ids de sus respuestas guardadas}. Con order="time" los hilos llegan
+    del más nuevo al más antiguo, así que en cuanto aparece un hilo ya guardado (o anterior
+    a `since`) se termina esa página y se deja de paginar. En los hilos guardados de las
+    páginas recorridas cuyo totalReplyCount creció se descargan las respuestas nuevas.
+    Limitación: las respuestas nuevas a hilos más antiguos que esa página solo llegan con
+    un análisis completo (no incremental).
+    """
+    logger.info(f"▶️ Iniciando extracción de comentarios para video {video_id}", extra={"video_id": video_id})
     url = "https://www.googleapis.com/youtube/v3/commentThreads"
     comments = []
     token = None
     total = 0
     round_count = 0
+    since_dt = _parse_published_at(since)
+    reached_known = False
 
     while total < max_total:
         round_count += 1
-        print(f"\n🔁 Petición {round_count}: descargando comentarios...")
+        logger.debug(f"🔁 Petición {round_count}: descargando comentarios...")
         params = {
             "part": "snippet,replies",
             "videoId": video_id,
@@ -35,21 +118,43 @@ def fetch_comment_threads(video_id, max_total=100000, delay=1):
             "textFormat": "plainText",
             "key": API_KEY
         }
+        if order:
+            params["order"] = order
         if token:
             params["pageToken"] = token
-            print(f"➡️ Usando pageToken: {token}")
+            logger.debug(f"➡️ Usando pageToken: {token}")
 
-        response = requests.get(url, params=params)
-        print(f"📦 Estado HTTP comentarios: {response.status_code}")
-        response.raise_for_status()
-        data = response.json()
+        started = time.perf_counter()
+        data = response_cache.get_json(url, params)
         items = data.get("items", [])
-        print(f"📥 Comentarios recibidos en esta tanda: {len(items)}")
+        if page_observer is not None:
+            page_observer(time.perf_counter() - started, len(items))
+        logger.debug(f"📥 Comentarios recibidos en esta tanda: {len(items)}")
+        # Hilos de esta página ya guardados -> ids de sus respuestas guardadas
+        stored = known_threads([item["id"] for item in items]) if known_threads and items else {}
 
         for item in items:
             s = item["snippet"]
             top = s["topLevelComment"]["snippet"]
 
+            if item["id"] in stored or since_dt:
+                published = _parse_published_at(top.get("publishedAt"))
+                if item["id"] in stored or (since_dt and published and published < since_dt):
+                    if not reached_known:
+                        logger.info(f"🛑 Alcanzado comentario ya analizado ({item['id']}), fin de la descarga incremental")
+                    reached_known = True
+            if reached_known:
+                # Resto de la página: solo las respuestas nuevas de hilos ya guardados
+                known_replies = stored.get(item["id"])
+                if known_replies is not None and (s.get("totalReplyCount") or 0) > len(known_replies):
+                    replies = fetch_replies(video_id, item["id"], known_replies, max_total - total)
+                    logger.debug(f"💬 {len(replies)} respuestas nuevas en el hilo {item['id']}")
+                    comments += replies
+                    total += len(replies)
+                if total >= max_total:
+                    break
+                continue
+
             comments.append({
                 "threadId": item["id"],
                 "commentId": item["id"],
@@ -66,39 +171,80 @@ def fetch_comment_threads(video_id, max_total=100000, delay=1):
             total += 1
 
             for rep in item.get("replies", {}).get("comments", []):
-                rps = rep["snippet"]
-                comments.append({
-                    "threadId": item["id"],
-                    "commentId": rep["id"],
-                    "videoId": video_id,
-                    "author": rps.get("authorDisplayName"),
-                    "authorChannelId": rps.get("authorChannelId", {}).get("value"),
-                    "isReply": True,
-                    "parentCommentId": rps.get("parentId"),
-                    "publishedAtComment": rps.get("publishedAt"),
-                    "text": rps.get("textDisplay"),
-                    "like_count_comment": rps.get("likeCount"),
-                    "replyCount": None
-                })
+                comments.append(_reply_row(video_id, item["id"], rep))
                 total += 1
                 if total >= max_total:
                     break
             if total >= max_total:
                 break
 
-        print(f"✅ Total comentarios acumulados: {total}")
+        logger.debug(f"✅ Total comentarios acumulados: {total}")
+        if reached_known:
+            break
         token = data.get("nextPageToken")
         if not token:
-            print("🚫 No hay más páginas disponibles.")
+            logger.debug("🚫 No hay más páginas disponibles.")
             break
 
-        print(f"⏳ Esperando {delay} segundos antes de la siguiente petición...")
+        if response_cache.mode == "replay":
+            continue  # reproducción offline: no hay cuota que proteger
+        logger.debug(f"⏳ Esperando {delay} segundos antes de la siguiente petición...")
         time.sleep(delay)
 
-    print(f"\n🎯 Total final de comentarios extraídos: {total}")
+    logger.info(f"🎯 Total final de comentarios extraídos: {total}",
+                extra={"video_id": video_id, "comments": total, "pages": round_count})
     return comments
 
+def fetch_playlist_video_ids(playlist_id, max_videos=50):
+    """
+    IDs de los vídeos de una playlist (playlistItems, 50 por página)
+    """
+    logger.info(f"▶️ Expandiendo playlist {playlist_id}")
+    url = "https://www.googleapis.com/youtube/v3/playlistItems"
+    video_ids = []
+    token = None
+
+    while len(video_ids) < max_videos:
+        params = {
+            "part": "contentDetails",
+            "playlistId": playlist_id,
+            "maxResults": min(50, max_videos - len(video_ids)),
+            "key": API_KEY
+        }
+        if token:
+            params["pageToken"] = token
+
+        data = response_cache.get_json(url, params)
+        for item in data.get("items", []):
+            video_id = item.get("contentDetails", {}).get("videoId")
+            if video_id:
+                video_ids.append(video_id)
+
+        token = data.get("nextPageToken")
+        if not token:
+            break
+
+    logger.info(f"✅ {len(video_ids)} vídeos en la playlist {playlist_id}")
+    return video_ids[:max_videos]
+
+def fetch_channel_video_ids(channel_id, max_videos=50):
+    """
+    IDs de los vídeos subidos por un canal (a través de su playlist "uploads")
+    """
+    logger.info(f"▶️ Expandiendo canal {channel_id}")
+    url = "https://www.googleapis.com/youtube/v3/channels"
+    params = {"part": "contentDetails", "id": channel_id, "key": API_KEY}
+    data = response_cache.get_json(url, params)
+    items = data.get("items", [])
+    if not items:
+        logger.warning(f"⚠️ Canal no encontrado: {channel_id}")
+        return []
+
+    uploads = items[0]["contentDetails"]["relatedPlaylists"]["uploads"]
+    return fetch_playlist_video_ids(uploads, max_videos=max_videos)
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     url_or_id = input("Introduce URL o ID de vídeo YouTube: ").strip()
     video_id = extract_video_id(url_or_id)
 
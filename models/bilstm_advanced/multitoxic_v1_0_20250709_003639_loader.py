@@ -13,6 +13,8 @@ import numpy as np
 import pickle
 import json
 import re
+import time
+import logging
 # ============================ spaCy ============================
 import spacy
 try:
@@ -25,6 +27,9 @@ from pathlib import Path
 
 import re
 
+# Logs por logging (nivel y formato los pone quien carga el modelo, p. ej. el servidor)
+logger = logging.getLogger(__name__)
+
 class MultitoxicProcessor:
     def __init__(self, processor_data_path):
         with open(processor_data_path, 'rb') as f:
@@ -33,7 +38,7 @@ class MultitoxicProcessor:
         self.special_tokens = data['special_tokens']  # {'<PAD>':0, ... '<RADICAL>':9}
         self.max_sequence_length = data['max_sequence_length']
         self.discriminant_words = data['discriminant_words']  # dict c/ listas de palabras por categoría
-        print(f"📝 Processor cargado: {len(self.word_to_idx)} palabras")
+        logger.info(f"📝 Processor cargado: {len(self.word_to_idx)} palabras")
     
     def text_to_sequence(self, text):
         # Manejo de casos no string o vacío
@@ -125,7 +130,7 @@ class MultitoxicExtractor:
             data = pickle.load(f)
         self.feature_names = data['feature_names']
         self.scaler = data.get('scaler', None) or data.get('scaler_state', None)
-        print(f"🔧 Extractor cargado: {len(self.feature_names)} features")
+        logger.info(f"🔧 Extractor cargado: {len(self.feature_names)} features")
 
     def extract_features(self, text, processor):
         sequence, visual_features, tokens = processor.text_to_sequence(text)
@@ -424,12 +429,14 @@ class MultitoxicLoader:
         self.processor = None
         self.feature_extractor = None
         self.config = None
+        # Hook opcional de métricas: stage_observer(etapa, segundos, textos_del_lote) por cada
+        # lote de predict_batch, con etapa = tokenization | feature_extraction | forward
+        self.stage_observer = None
         
-        print(f"🚀 Multitoxic Loader")
-        print(f"   Dispositivo: {self.device}")
+        logger.info(f"🚀 Multitoxic Loader (dispositivo: {self.device})")
     
     def load_model(self):
-        print("🔄 Cargando modelo...")
+        logger.info("🔄 Cargando modelo...")
         
         # Load config
         with open(self.model_dir / "config.json", 'r') as f:
@@ -449,9 +456,8 @@ class MultitoxicLoader:
         self.model.load_state_dict(checkpoint['state_dict'])
         self.model.eval()
         
-        print("✅ Modelo cargado exitosamente")
         f1_score = self.config.get('test_metrics', {}).get('f1_macro', 0)
-        print(f"   F1-macro: {f1_score:.4f}")
+        logger.info(f"✅ Modelo cargado exitosamente (F1-macro: {f1_score:.4f})")
     
     def predict(self, text, return_probabilities=True, return_categories=True):
         if not self.model:
@@ -502,9 +508,12 @@ class MultitoxicLoader:
             with torch.no_grad():
                 logits = self.model(text_tensor, features_tensor, attention_mask)
 
-                # 🔍 DEBUG: Imprimir los logits crudos antes de aplicar sigmoid
-                for i, class_name in enumerate(self.config['classes']['class_names']):
-                    print(f"[DEBUG] Logit {class_name}: {logits[0][i].item():.4f}")
+                # 🔍 DEBUG: logits crudos antes de aplicar sigmoid (solo con LOG_LEVEL=DEBUG:
+                # formatearlos por clase y comentario cuesta más que el propio forward)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Logits: " + ", ".join(
+                        f"{class_name}={logits[0][i].item():.4f}"
+                        for i, class_name in enumerate(self.config['classes']['class_names'])))
 
                 probabilities = torch.sigmoid(logits).cpu().numpy()[0]
             
@@ -554,8 +563,67 @@ class MultitoxicLoader:
                 'predictions': {k: {'probability': 0.0, 'detected': False, 'threshold': 0.5} for k in class_names}
             }
 
+    def predict_batch(self, texts, batch_size=256):
+        """
+        Probabilidades de muchos textos con un forward por lote.
+        Devuelve una matriz [N, n_clases] en el orden de config['classes']['class_names'];
+        los textos vacíos quedan a 0.0 (como en predict) y los que fallan, a NaN.
+        """
+        if not self.model:
+            raise ValueError("Modelo no cargado. Ejecuta load_model() primero.")
+
+        class_names = self.config['classes']['class_names']
+        probabilities = np.zeros((len(texts), len(class_names)), dtype=np.float32)
+        max_len = self.processor.max_sequence_length
+
+        observe = self.stage_observer
+        clock = time.perf_counter
+        for start in range(0, len(texts), batch_size):
+            rows, sequences, features = [], [], []
+            tokenization = extraction = 0.0
+            for i, text in enumerate(texts[start:start + batch_size], start=start):
+                if not isinstance(text, str) or text.strip() == "":
+                    continue
+                try:
+                    t0 = clock()
+                    sequence, _, _ = self.processor.text_to_sequence(text)
+                    t1 = clock()
+                    features.append(self.feature_extractor.extract_features(text, self.processor))
+                    tokenization += t1 - t0
+                    extraction += clock() - t1
+                except Exception:
+                    probabilities[i] = np.nan
+                    continue
+                sequences.append((list(sequence) + [0] * max_len)[:max_len])
+                rows.append(i)
+            if not rows:
+                continue
+
+            t0 = clock()
+            text_tensor = torch.tensor(sequences, dtype=torch.long, device=self.device)
+            # El scaler normaliza todo el lote de una vez
+            normalized = self.feature_extractor.scaler.transform(np.array(features))
+            features_tensor = torch.from_numpy(np.asarray(normalized)).float().to(self.device)
+            attention_mask = (text_tensor != 0).float()
+            extraction += clock() - t0
+            t0 = clock()
+            try:
+                with torch.no_grad():
+                    logits = self.model(text_tensor, features_tensor, attention_mask)
+                probabilities[rows] = torch.sigmoid(logits).cpu().numpy()
+            except Exception as e:
+                logger.warning(f"⚠️ Error prediciendo lote de {len(rows)} textos: {e}")
+                probabilities[rows] = np.nan
+            if observe is not None:
+                observe("tokenization", tokenization, len(rows))
+                observe("feature_extraction", extraction, len(rows))
+                observe("forward", clock() - t0, len(rows))
+
+        return probabilities
+
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     print("🚀 TESTING MULTITOXIC")
     print("=" * 40)
     
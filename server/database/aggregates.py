@@ -0,0 +1,159 @@
+from typing import Dict, Any, List
+
+from server.database.storage import get_storage, TOXICITY_CATEGORIES
+from server.database.save_comments import get_comments_page
+from server.database.stats_cache import stats_cache, aggregates_key, GLOBAL_AGGREGATES_KEY
+from server.outils.logging_config import get_logger
+
+# Agregados del dashboard global (MetricCards, ToxicityDistribution, EngagementComparison,
+# VideoHeatmap). Se calculan en la BD (en Supabase con la función dashboard_global_aggregates
+# de migrations/004_dashboard_aggregates.sql); si no está disponible se recorre la tabla
+# por páginas con solo las columnas necesarias. En ambos casos la respuesta ocupa pocos KB
+# y se guarda en stats_cache hasta la siguiente escritura de comentarios.
+
+HIGH_RISK_RATE = 15.0
+
+logger = get_logger(__name__)
+
+_SCAN_FIELDS = ["video_id", "total_likes_comment", "toxic_probability", "sentiment_score"] + \
+    [f"is_{category}" for category in TOXICITY_CATEGORIES]
+
+
+def _bin_edges(low: float, high: float, bins: int) -> List[Dict[str, float]]:
+    width = (high - low) / bins
+    return [{"start": round(low + i * width, 4), "end": round(low + (i + 1) * width, 4), "count": 0}
+            for i in range(bins)]
+
+
+def _bucket(value: float, low: float, high: float, bins: int) -> int:
+    # Igual que GREATEST(LEAST(width_bucket(...), bins), 1) en SQL, pero empezando en 0
+    index = int((value - low) / (high - low) * bins)
+    return min(max(index, 0), bins - 1)
+
+
+def _format_aggregates(raw: Dict[str, Any], bins: int) -> Dict[str, Any]:
+    """
+    Da la misma forma a la salida de la función SQL y a la del recorrido en Python
+    """
+    total = raw.get("total_comments", 0) or 0
+    category_counts = raw.get("category_counts") or {}
+
+    categories = sorted(
+        ({"type": category,
+          "count": category_counts.get(category, 0),
+          "percentage": round(category_counts.get(category, 0) / total * 100, 1) if total else 0.0}
+         for category in TOXICITY_CATEGORIES),
+        key=lambda c: c["count"], reverse=True
+    )
+
+    engagement = []
+    for category in ("toxic", "clean"):
+        data = (raw.get("engagement") or {}).get(category)
+        if data and data.get("count"):
+            engagement.append({
+                "category": category,
+                "total_comments": data["count"],
+                "avg_likes": round((data.get("likes") or 0) / data["count"], 1),
+            })
+
+    def histogram(key, low, high):
+        counts = raw.get(key) or {}
+        edges = _bin_edges(low, high, bins)
+        for bucket, count in counts.items():
+            # Las claves de jsonb_object_agg llegan como texto y empiezan en 1
+            edges[int(bucket) - 1]["count"] = count
+        return edges
+
+    return {
+        "totals": {
+            "total_comments": total,
+            "total_videos": raw.get("total_videos", 0),
+            "toxic_count": raw.get("toxic_count", 0),
+            "toxic_rate": round(raw.get("toxic_count", 0) / total * 100, 1) if total else 0.0,
+            "high_risk_videos": raw.get("high_risk_videos", 0),
+        },
+        "categories": categories,
+        "engagement": engagement,
+        "videos": raw.get("videos") or [],
+        "histograms": {
+            "toxic_probability": histogram("toxic_probability_bins", 0.0, 1.0),
+            "sentiment_score": histogram("sentiment_score_bins", -1.0, 1.0),
+        },
+    }
+
+
+def _scan_aggregates(top_videos: int, bins: int, high_risk_rate: float) -> Dict[str, Any]:
+    """
+    Alternativa sin la función SQL: recorre la tabla por páginas, memoria O(videos + bins)
+    """
+    raw = {
+        "total_comments": 0, "toxic_count": 0,
+        "category_counts": {category: 0 for category in TOXICITY_CATEGORIES},
+        "engagement": {"toxic": {"count": 0, "likes": 0}, "clean": {"count": 0, "likes": 0}},
+        "toxic_probability_bins": {}, "sentiment_score_bins": {},
+    }
+    per_video: Dict[str, List[int]] = {}
+
+    cursor = None
+    while True:
+        page = get_comments_page(cursor=cursor, limit=5000, fields=_SCAN_FIELDS)
+        for row in page["comments"]:
+            flags = [category for category in TOXICITY_CATEGORIES if row.get(f"is_{category}")]
+            any_toxic = bool(flags)
+            raw["total_comments"] += 1
+            raw["toxic_count"] += any_toxic
+            for category in flags:
+                raw["category_counts"][category] += 1
+
+            group = raw["engagement"]["toxic" if any_toxic else "clean"]
+            group["count"] += 1
+            group["likes"] += row.get("total_likes_comment") or 0
+
+            counts = per_video.setdefault(row["video_id"], [0, 0])
+            counts[0] += 1
+            counts[1] += any_toxic
+
+            for key, column, low, high in (("toxic_probability_bins", "toxic_probability", 0.0, 1.0),
+                                           ("sentiment_score_bins", "sentiment_score", -1.0, 1.0)):
+                if row.get(column) is not None:
+                    bucket = str(_bucket(row[column], low, high, bins) + 1)
+                    raw[key][bucket] = raw[key].get(bucket, 0) + 1
+
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    videos = [
+        {"video_id": video_id, "total_comments": total, "toxic_count": toxic,
+         "toxic_rate": round(toxic / total * 100, 1)}
+        for video_id, (total, toxic) in per_video.items()
+    ]
+    videos.sort(key=lambda v: v["toxic_rate"], reverse=True)
+    raw["total_videos"] = len(videos)
+    raw["high_risk_videos"] = sum(1 for v in videos if v["toxic_rate"] > high_risk_rate)
+    raw["videos"] = videos[:top_videos]
+    return raw
+
+
+def get_global_aggregates(top_videos: int = 10, bins: int = 10,
+                          high_risk_rate: float = HIGH_RISK_RATE) -> Dict[str, Any]:
+    """
+    Datos de todos los gráficos del dashboard global en una sola respuesta pequeña
+    """
+    # Una escritura cambia la generación: lo calculado antes queda bajo una clave sin uso
+    key = aggregates_key(stats_cache.generation(GLOBAL_AGGREGATES_KEY), top_videos, bins, high_risk_rate)
+    cached = stats_cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        raw = get_storage().global_aggregates(top_videos, bins, high_risk_rate)
+    except Exception as e:
+        logger.warning(f"⚠️ Agregados en la BD no disponibles ({e}), agregando por páginas")
+        raw = None
+    if raw is None:
+        raw = _scan_aggregates(top_videos, bins, high_risk_rate)
+
+    aggregates = _format_aggregates(raw or {}, bins)
+    stats_cache.set(key, aggregates)
+    return aggregates
@@ -0,0 +1,21 @@
+import argparse
+
+from server.database.save_comments import backfill_video_statistics, rebuild_video_statistics
+
+# Backfill único de video_statistics tras las migraciones 007 y 009: las filas escritas antes
+# de los resúmenes sumables solo guardan los números de la última petición. Se recalcula cada
+# vídeo sin resumen desde todos sus comentarios (resumen y franjas de tiempo). Lanzarlo sin
+# análisis en curso; lo que no se recalcule aquí se recalcula la primera vez que se lea.
+#
+#   python -m server.database.backfill_statistics
+#   python -m server.database.backfill_statistics --video-id dQw4w9WgXcQ
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcula las filas de video_statistics sin resumen sumable")
+    parser.add_argument("--video-id", help="Recalcular solo este video (tenga o no resumen)")
+    args = parser.parse_args()
+    if args.video_id:
+        rebuild_video_statistics(args.video_id)
+    else:
+        backfill_video_statistics()
@@ -0,0 +1,77 @@
+import argparse
+from typing import Dict, List, Optional, Tuple, Any
+
+from server.database.storage import get_storage
+from server.outils.logging_config import get_logger
+
+# Compactación única de sentiment_analyzer: borra las filas duplicadas que dejaron
+# los análisis repetidos anteriores al UPSERT por (video_id, comment_id).
+# Se conserva la fila más reciente (id mayor) de cada comentario.
+#
+#   python -m server.database.compact_comments --dry-run
+#   python -m server.database.compact_comments --video-id dQw4w9WgXcQ
+
+PAGE_SIZE = 1000
+DELETE_CHUNK_SIZE = 200
+
+logger = get_logger(__name__)
+
+
+def _duplicate_key(row: Dict[str, Any]) -> Tuple[str, str, str]:
+    # Filas antiguas sin comment_id: se identifican por su texto dentro del vídeo
+    if row.get("comment_id"):
+        return (row["video_id"], "comment_id", row["comment_id"])
+    return (row["video_id"], "text", row.get("text") or "")
+
+
+def find_duplicate_ids(video_id: Optional[str] = None) -> List[int]:
+    """
+    Recorre la tabla por páginas (keyset sobre id) y devuelve los ids a borrar
+    """
+    latest: Dict[Tuple[str, str, str], int] = {}
+    to_delete: List[int] = []
+    last_id = 0
+
+    while True:
+        rows = get_storage().scan_comment_keys(last_id, PAGE_SIZE, video_id=video_id)
+
+        for row in rows:
+            key = _duplicate_key(row)
+            previous = latest.get(key)
+            if previous is not None:
+                # ids crecientes: la fila anterior es la más antigua
+                to_delete.append(previous)
+            latest[key] = row["id"]
+
+        if len(rows) < PAGE_SIZE:
+            break
+        last_id = rows[-1]["id"]
+
+    return to_delete
+
+
+def compact_duplicates(video_id: Optional[str] = None, dry_run: bool = False) -> int:
+    duplicate_ids = find_duplicate_ids(video_id)
+    scope = f"el video {video_id}" if video_id else "toda la tabla"
+    logger.info(f"🔍 {len(duplicate_ids)} filas duplicadas en {scope}")
+
+    if dry_run or not duplicate_ids:
+        return len(duplicate_ids)
+
+    deleted = 0
+    for i in range(0, len(duplicate_ids), DELETE_CHUNK_SIZE):
+        chunk = duplicate_ids[i:i + DELETE_CHUNK_SIZE]
+        get_storage().delete_comments_by_ids(chunk)
+        deleted += len(chunk)
+        logger.info(f"🗑️ Eliminadas {deleted}/{len(duplicate_ids)} filas duplicadas")
+
+    logger.info(f"✅ Compactación terminada: {deleted} filas eliminadas")
+    return deleted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Elimina comentarios duplicados de sentiment_analyzer")
+    parser.add_argument("--video-id", help="Compactar solo este video")
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar duplicados, sin borrar")
+    args = parser.parse_args()
+    compact_duplicates(video_id=args.video_id, dry_run=args.dry_run)
@@ -1,14 +1,19 @@
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from typing import Optional
 import os
 
 load_dotenv()
 url = os.getenv("SUPABASE_URL")
 key = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
+# Sin credenciales no hay cliente: la app arranca con el almacenamiento local (server/database/storage.py)
+supabase: Optional[Client] = create_client(url, key) if url and key else None
 
 def test_connection():
     try:
+        if supabase is None:
+            print("⚠️ SUPABASE_URL / SUPABASE_KEY no configuradas")
+            return False
         response = supabase.table("sentiment_analyzer").select("*").execute()
         return response.data is not None
     
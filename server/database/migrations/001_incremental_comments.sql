@@ -0,0 +1,14 @@
+-- Análisis incremental: identificador de YouTube y fecha de cada comentario
+-- Ejecutar en el SQL editor de Supabase
+
+ALTER TABLE sentiment_analyzer
+    ADD COLUMN IF NOT EXISTS comment_id TEXT,
+    ADD COLUMN IF NOT EXISTS published_at_comment TIMESTAMPTZ;
+
+-- Necesario para upsert(on_conflict="video_id,comment_id")
+CREATE UNIQUE INDEX IF NOT EXISTS sentiment_analyzer_video_comment_uidx
+    ON sentiment_analyzer (video_id, comment_id);
+
+-- Estado incremental: comentario más reciente por video
+CREATE INDEX IF NOT EXISTS sentiment_analyzer_video_published_idx
+    ON sentiment_analyzer (video_id, published_at_comment DESC);
@@ -0,0 +1,21 @@
+-- Identidad completa de cada comentario de YouTube y UPSERT idempotente
+-- Ejecutar en el SQL editor de Supabase (después de 001_incremental_comments.sql)
+
+ALTER TABLE sentiment_analyzer
+    ADD COLUMN IF NOT EXISTS thread_id TEXT,
+    ADD COLUMN IF NOT EXISTS parent_comment_id TEXT;
+
+-- Compactación equivalente a `python -m server.database.compact_comments`:
+-- conserva la fila más reciente de cada comentario (o de cada texto en filas antiguas sin comment_id)
+DELETE FROM sentiment_analyzer a
+USING sentiment_analyzer b
+WHERE a.video_id = b.video_id
+  AND a.id < b.id
+  AND (
+        (a.comment_id IS NOT NULL AND a.comment_id = b.comment_id)
+     OR (a.comment_id IS NULL AND b.comment_id IS NULL AND a.text = b.text)
+  );
+
+-- La clave (video_id, comment_id) ya es única desde 001; se repite por si se aplica sola
+CREATE UNIQUE INDEX IF NOT EXISTS sentiment_analyzer_video_comment_uidx
+    ON sentiment_analyzer (video_id, comment_id);
@@ -0,0 +1,22 @@
+-- Índices para la lectura paginada de /api/sentiment-analyzer/* (cursor keyset + filtros)
+-- Ejecutar en el SQL editor de Supabase
+
+-- Paginación por id, global y por video
+CREATE INDEX IF NOT EXISTS sentiment_analyzer_video_id_id_idx
+    ON sentiment_analyzer (video_id, id);
+
+-- Top-N por likes (order_by=likes)
+CREATE INDEX IF NOT EXISTS sentiment_analyzer_likes_id_idx
+    ON sentiment_analyzer (total_likes_comment DESC, id DESC);
+CREATE INDEX IF NOT EXISTS sentiment_analyzer_video_likes_id_idx
+    ON sentiment_analyzer (video_id, total_likes_comment DESC, id DESC);
+
+-- toxic_only / min_probability: índices parciales, los tóxicos son una minoría
+CREATE INDEX IF NOT EXISTS sentiment_analyzer_toxic_id_idx
+    ON sentiment_analyzer (id) WHERE is_toxic;
+CREATE INDEX IF NOT EXISTS sentiment_analyzer_toxic_probability_idx
+    ON sentiment_analyzer (toxic_probability);
+
+-- Filtro por tipo de sentimiento
+CREATE INDEX IF NOT EXISTS sentiment_analyzer_sentiment_id_idx
+    ON sentiment_analyzer (sentiment_type, id);
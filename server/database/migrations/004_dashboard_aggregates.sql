@@ -0,0 +1,81 @@
+-- Agregados del dashboard global calculados en la BD (un único JSON de pocos KB)
+-- Ejecutar en el SQL editor de Supabase; se llama con supabase.rpc("dashboard_global_aggregates", ...)
+
+CREATE OR REPLACE FUNCTION dashboard_global_aggregates(
+    top_videos INT DEFAULT 10,
+    bins INT DEFAULT 10,
+    high_risk_rate FLOAT DEFAULT 15
+)
+RETURNS JSONB
+LANGUAGE sql STABLE
+AS $$
+WITH c AS (
+    SELECT
+        video_id,
+        COALESCE(total_likes_comment, 0) AS likes,
+        toxic_probability,
+        sentiment_score,
+        is_toxic, is_hatespeech, is_abusive, is_provocative, is_racist, is_obscene,
+        is_threat, is_religious_hate, is_nationalist, is_sexist, is_homophobic, is_radicalism,
+        COALESCE(is_toxic OR is_hatespeech OR is_abusive OR is_provocative OR is_racist OR is_obscene
+                 OR is_threat OR is_religious_hate OR is_nationalist OR is_sexist OR is_homophobic
+                 OR is_radicalism, FALSE) AS any_toxic
+    FROM sentiment_analyzer
+),
+per_video AS (
+    SELECT video_id,
+           COUNT(*) AS total_comments,
+           COUNT(*) FILTER (WHERE any_toxic) AS toxic_count,
+           ROUND(100.0 * COUNT(*) FILTER (WHERE any_toxic) / COUNT(*), 1) AS toxic_rate
+    FROM c
+    GROUP BY video_id
+)
+SELECT jsonb_build_object(
+    'total_comments', (SELECT COUNT(*) FROM c),
+    'total_videos', (SELECT COUNT(*) FROM per_video),
+    'toxic_count', (SELECT COUNT(*) FROM c WHERE any_toxic),
+    'high_risk_videos', (SELECT COUNT(*) FROM per_video WHERE toxic_rate > high_risk_rate),
+    'category_counts', (
+        SELECT jsonb_build_object(
+            'toxic', COUNT(*) FILTER (WHERE is_toxic),
+            'hatespeech', COUNT(*) FILTER (WHERE is_hatespeech),
+            'abusive', COUNT(*) FILTER (WHERE is_abusive),
+            'provocative', COUNT(*) FILTER (WHERE is_provocative),
+            'racist', COUNT(*) FILTER (WHERE is_racist),
+            'obscene', COUNT(*) FILTER (WHERE is_obscene),
+            'threat', COUNT(*) FILTER (WHERE is_threat),
+            'religious_hate', COUNT(*) FILTER (WHERE is_religious_hate),
+            'nationalist', COUNT(*) FILTER (WHERE is_nationalist),
+            'sexist', COUNT(*) FILTER (WHERE is_sexist),
+            'homophobic', COUNT(*) FILTER (WHERE is_homophobic),
+            'radicalism', COUNT(*) FILTER (WHERE is_radicalism)
+        ) FROM c
+    ),
+    'engagement', (
+        SELECT COALESCE(jsonb_object_agg(category, jsonb_build_object('count', n, 'likes', likes)), '{}'::jsonb)
+        FROM (
+            SELECT CASE WHEN any_toxic THEN 'toxic' ELSE 'clean' END AS category,
+                   COUNT(*) AS n, SUM(likes) AS likes
+            FROM c GROUP BY 1
+        ) g
+    ),
+    'videos', (
+        SELECT COALESCE(jsonb_agg(to_jsonb(v) ORDER BY v.toxic_rate DESC), '[]'::jsonb)
+        FROM (SELECT * FROM per_video ORDER BY toxic_rate DESC LIMIT top_videos) v
+    ),
+    'toxic_probability_bins', (
+        SELECT COALESCE(jsonb_object_agg(b, n), '{}'::jsonb)
+        FROM (
+            SELECT GREATEST(LEAST(width_bucket(toxic_probability, 0, 1, bins), bins), 1) AS b, COUNT(*) AS n
+            FROM c WHERE toxic_probability IS NOT NULL GROUP BY 1
+        ) h
+    ),
+    'sentiment_score_bins', (
+        SELECT COALESCE(jsonb_object_agg(b, n), '{}'::jsonb)
+        FROM (
+            SELECT GREATEST(LEAST(width_bucket(sentiment_score, -1, 1, bins), bins), 1) AS b, COUNT(*) AS n
+            FROM c WHERE sentiment_score IS NOT NULL GROUP BY 1
+        ) h
+    )
+);
+$$;
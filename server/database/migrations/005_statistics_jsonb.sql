@@ -0,0 +1,15 @@
+-- Estadísticas como JSONB nativo: sin json.dumps al guardar ni json.loads al leer
+-- Ejecutar en el SQL editor de Supabase
+
+ALTER TABLE video_statistics
+    ALTER COLUMN sentiment_distribution TYPE JSONB USING sentiment_distribution::text::jsonb,
+    ALTER COLUMN toxicity_stats TYPE JSONB USING toxicity_stats::text::jsonb;
+
+-- Filas guardadas con json.dumps en una columna ya JSONB: quedaron como string JSON, se desanidan
+UPDATE video_statistics
+SET sentiment_distribution = (sentiment_distribution #>> '{}')::jsonb
+WHERE jsonb_typeof(sentiment_distribution) = 'string';
+
+UPDATE video_statistics
+SET toxicity_stats = (toxicity_stats #>> '{}')::jsonb
+WHERE jsonb_typeof(toxicity_stats) = 'string';
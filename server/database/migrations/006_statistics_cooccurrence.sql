@@ -0,0 +1,5 @@
+-- Co-ocurrencias de categorías por vídeo: {"is_toxic": {"is_racist": 3, ...}, ...}
+-- Ejecutar en el SQL editor de Supabase
+
+ALTER TABLE video_statistics
+    ADD COLUMN IF NOT EXISTS toxicity_cooccurrence JSONB NOT NULL DEFAULT '{}'::jsonb;
@@ -0,0 +1,12 @@
+-- Resúmenes sumables de estadísticas (StatsSummary): video_statistics se actualiza
+-- sumando/restando lotes en la escritura de comentarios, sin volver a leerlos
+-- Ejecutar en el SQL editor de Supabase
+
+ALTER TABLE sentiment_analyzer
+    ADD COLUMN IF NOT EXISTS is_self_promotional BOOLEAN;
+
+-- NULL en filas anteriores: se recalculan desde los comentarios con
+--   python -m server.database.backfill_statistics
+-- (o la primera vez que se leen o se les suma un lote)
+ALTER TABLE video_statistics
+    ADD COLUMN IF NOT EXISTS summary JSONB;
@@ -0,0 +1,17 @@
+-- Rollups por franjas de tiempo de cada vídeo (por hora y por día), según published_at_comment.
+-- Se mantienen al escribir/borrar comentarios (sumando y restando contadores), así los
+-- timelines leen unas pocas filas en lugar de recorrer todos los comentarios.
+-- Ejecutar en el SQL editor de Supabase
+
+CREATE TABLE IF NOT EXISTS video_time_buckets (
+    video_id TEXT NOT NULL,
+    granularity TEXT NOT NULL CHECK (granularity IN ('hour', 'day')),
+    bucket_start TIMESTAMPTZ NOT NULL,
+    comments INTEGER NOT NULL DEFAULT 0,
+    toxic INTEGER NOT NULL DEFAULT 0,
+    likes BIGINT NOT NULL DEFAULT 0,
+    sentiment_count INTEGER NOT NULL DEFAULT 0,
+    sentiment_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    -- Necesario para upsert(on_conflict="video_id,granularity,bucket_start") y los rangos
+    PRIMARY KEY (video_id, granularity, bucket_start)
+);
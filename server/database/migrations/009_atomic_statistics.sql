@@ -0,0 +1,119 @@
+-- Resúmenes de video_statistics y franjas de tiempo correctos con varios workers/procesos
+-- escribiendo a la vez: las versiones anteriores se leen en la misma transacción que el UPSERT
+-- (con el vídeo bloqueado), las franjas se suman en la BD y el resumen se reescribe con
+-- compare-and-set sobre summary_version.
+-- Ejecutar en el SQL editor de Supabase
+
+-- Se incrementa en cada escritura del resumen; 0 en las filas anteriores
+ALTER TABLE video_statistics
+    ADD COLUMN IF NOT EXISTS summary_version BIGINT NOT NULL DEFAULT 0;
+
+-- UPSERT de un trozo de comentarios que devuelve {"rows": guardadas, "previous": versiones reemplazadas}
+CREATE OR REPLACE FUNCTION upsert_comments_returning_previous(rows JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    locked_video TEXT;
+    previous JSONB;
+    saved JSONB;
+BEGIN
+    -- Un lock por vídeo hasta el final de la transacción (en orden, para que dos trozos
+    -- no se bloqueen entre sí): otra escritura de los mismos comentarios espera aquí y
+    -- después ve estas filas como versión anterior
+    FOR locked_video IN
+        SELECT DISTINCT r->>'video_id' FROM jsonb_array_elements(rows) r ORDER BY 1
+    LOOP
+        PERFORM pg_advisory_xact_lock(hashtext('sentiment_analyzer:' || locked_video));
+    END LOOP;
+
+    SELECT COALESCE(jsonb_agg(to_jsonb(s)), '[]'::jsonb) INTO previous
+    FROM sentiment_analyzer s
+    JOIN jsonb_populate_recordset(NULL::sentiment_analyzer, rows) r
+      ON s.video_id = r.video_id AND s.comment_id = r.comment_id;
+
+    WITH upserted AS (
+        INSERT INTO sentiment_analyzer (
+            video_id, comment_id, thread_id, parent_comment_id, published_at_comment, text,
+            toxic_probability, hatespeech_probability, abusive_probability, provocative_probability,
+            racist_probability, obscene_probability, threat_probability, religious_hate_probability,
+            nationalist_probability, sexist_probability, homophobic_probability, radicalism_probability,
+            is_toxic, is_hatespeech, is_abusive, is_provocative, is_racist, is_obscene, is_threat,
+            is_religious_hate, is_nationalist, is_sexist, is_homophobic, is_radicalism,
+            sentiment_type, sentiment_score, sentiment_intensity, total_likes_comment, is_self_promotional
+        )
+        SELECT
+            video_id, comment_id, thread_id, parent_comment_id, published_at_comment, text,
+            toxic_probability, hatespeech_probability, abusive_probability, provocative_probability,
+            racist_probability, obscene_probability, threat_probability, religious_hate_probability,
+            nationalist_probability, sexist_probability, homophobic_probability, radicalism_probability,
+            is_toxic, is_hatespeech, is_abusive, is_provocative, is_racist, is_obscene, is_threat,
+            is_religious_hate, is_nationalist, is_sexist, is_homophobic, is_radicalism,
+            sentiment_type, sentiment_score, sentiment_intensity, COALESCE(total_likes_comment, 0), is_self_promotional
+        FROM jsonb_populate_recordset(NULL::sentiment_analyzer, rows)
+        ON CONFLICT (video_id, comment_id) DO UPDATE SET
+            thread_id = EXCLUDED.thread_id,
+            parent_comment_id = EXCLUDED.parent_comment_id,
+            published_at_comment = EXCLUDED.published_at_comment,
+            text = EXCLUDED.text,
+            toxic_probability = EXCLUDED.toxic_probability,
+            hatespeech_probability = EXCLUDED.hatespeech_probability,
+            abusive_probability = EXCLUDED.abusive_probability,
+            provocative_probability = EXCLUDED.provocative_probability,
+            racist_probability = EXCLUDED.racist_probability,
+            obscene_probability = EXCLUDED.obscene_probability,
+            threat_probability = EXCLUDED.threat_probability,
+            religious_hate_probability = EXCLUDED.religious_hate_probability,
+            nationalist_probability = EXCLUDED.nationalist_probability,
+            sexist_probability = EXCLUDED.sexist_probability,
+            homophobic_probability = EXCLUDED.homophobic_probability,
+            radicalism_probability = EXCLUDED.radicalism_probability,
+            is_toxic = EXCLUDED.is_toxic,
+            is_hatespeech = EXCLUDED.is_hatespeech,
+            is_abusive = EXCLUDED.is_abusive,
+            is_provocative = EXCLUDED.is_provocative,
+            is_racist = EXCLUDED.is_racist,
+            is_obscene = EXCLUDED.is_obscene,
+            is_threat = EXCLUDED.is_threat,
+            is_religious_hate = EXCLUDED.is_religious_hate,
+            is_nationalist = EXCLUDED.is_nationalist,
+            is_sexist = EXCLUDED.is_sexist,
+            is_homophobic = EXCLUDED.is_homophobic,
+            is_radicalism = EXCLUDED.is_radicalism,
+            sentiment_type = EXCLUDED.sentiment_type,
+            sentiment_score = EXCLUDED.sentiment_score,
+            sentiment_intensity = EXCLUDED.sentiment_intensity,
+            total_likes_comment = EXCLUDED.total_likes_comment,
+            is_self_promotional = EXCLUDED.is_self_promotional
+        RETURNING *
+    )
+    SELECT COALESCE(jsonb_agg(to_jsonb(u)), '[]'::jsonb) INTO saved FROM upserted;
+
+    RETURN jsonb_build_object('rows', saved, 'previous', previous);
+END;
+$$;
+
+-- Suma los contadores a cada franja (video_id, granularity, bucket_start); las que quedan sin
+-- comentarios se ponen a cero
+CREATE OR REPLACE FUNCTION add_time_buckets(rows JSONB)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    INSERT INTO video_time_buckets AS b (
+        video_id, granularity, bucket_start, comments, toxic, likes, sentiment_count, sentiment_sum
+    )
+    SELECT video_id, granularity, bucket_start, comments, toxic, likes, sentiment_count, sentiment_sum
+    FROM jsonb_populate_recordset(NULL::video_time_buckets, rows)
+    ON CONFLICT (video_id, granularity, bucket_start) DO UPDATE SET
+        comments = b.comments + EXCLUDED.comments,
+        toxic = b.toxic + EXCLUDED.toxic,
+        likes = b.likes + EXCLUDED.likes,
+        sentiment_count = b.sentiment_count + EXCLUDED.sentiment_count,
+        sentiment_sum = b.sentiment_sum + EXCLUDED.sentiment_sum;
+
+    UPDATE video_time_buckets b
+    SET comments = 0, toxic = 0, likes = 0, sentiment_count = 0, sentiment_sum = 0
+    FROM jsonb_populate_recordset(NULL::video_time_buckets, rows) r
+    WHERE b.video_id = r.video_id AND b.granularity = r.granularity
+      AND b.bucket_start = r.bucket_start AND b.comments <= 0;
+$$;
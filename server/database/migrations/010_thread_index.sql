@@ -0,0 +1,6 @@
+-- Análisis incremental: comentarios guardados de los hilos de cada página de YouTube
+-- (respuestas nuevas a hilos ya conocidos)
+-- Ejecutar en el SQL editor de Supabase
+
+CREATE INDEX IF NOT EXISTS sentiment_analyzer_video_thread_idx
+    ON sentiment_analyzer (video_id, thread_id);
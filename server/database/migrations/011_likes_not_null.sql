@@ -0,0 +1,9 @@
+-- Likes sin valor como 0: el orden por likes (y su cursor keyset) no depende de dónde
+-- coloca cada BD los NULL, y coincide con SQLite
+-- Ejecutar en el SQL editor de Supabase
+
+UPDATE sentiment_analyzer SET total_likes_comment = 0 WHERE total_likes_comment IS NULL;
+
+ALTER TABLE sentiment_analyzer
+    ALTER COLUMN total_likes_comment SET DEFAULT 0,
+    ALTER COLUMN total_likes_comment SET NOT NULL;
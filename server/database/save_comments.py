@@ -1,113 +1,354 @@
-from server.database.connection_db import supabase
-from typing import List, Dict, Any
+from server.database.storage import get_storage
+from typing import Callable, List, Dict, Any, Set
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pydantic import ValidationError
 from server.schemas import Comment
+from server.records import ScoredComments, COMMENT_FIELDS
+from server.outils.stats_engine import StatsSummary, distribution, needs_rebuild
+from server.outils.stats_engine import time_bucket_rollups, merge_rollups, bucket_key, bucket_view
+from server.database.stats_cache import stats_cache, video_key, ALL_VIDEOS_KEY
+from server.outils.logging_config import get_logger
+from server.outils.metrics import stage_timer, ERRORS
+import os
+import time
+import json
+import base64
 
+logger = get_logger(__name__)
+
+# Columnas de la tabla sentiment_analyzer (sin id ni created_at, que genera la BD)
+DB_FIELDS = {
+    "video_id", "comment_id", "thread_id", "parent_comment_id", "published_at_comment", "text",
+    "toxic_probability", "hatespeech_probability", "abusive_probability",
+    "provocative_probability", "racist_probability", "obscene_probability",
+    "threat_probability", "religious_hate_probability", "nationalist_probability",
+    "sexist_probability", "homophobic_probability", "radicalism_probability",
+    "is_toxic", "is_hatespeech", "is_abusive", "is_provocative",
+    "is_racist", "is_obscene", "is_threat", "is_religious_hate",
+    "is_nationalist", "is_sexist", "is_homophobic", "is_radicalism",
+    "sentiment_type", "sentiment_score", "sentiment_intensity",
+    "total_likes_comment", "is_self_promotional"
+}
+# Mismas columnas en el orden de Comment, para sacar filas de un ScoredComments
+DB_COLUMNS = [name for name in COMMENT_FIELDS if name in DB_FIELDS]
+
+# Campos que, si no cambian, hacen innecesario reescribir la fila en un re-análisis
+SCORE_FIELDS = sorted(
+    f for f in DB_FIELDS
+    if f.endswith("_probability") or f.startswith("is_") or f.startswith("sentiment_")
+) + ["total_likes_comment", "text"]
+
+# Escritura en lotes: filas por petición, peticiones simultáneas y reintentos por trozo
+COMMENT_WRITE_CHUNK_SIZE = int(os.getenv("COMMENT_WRITE_CHUNK_SIZE", "500"))
+COMMENT_WRITE_WORKERS = int(os.getenv("COMMENT_WRITE_WORKERS", "4"))
+COMMENT_WRITE_RETRIES = int(os.getenv("COMMENT_WRITE_RETRIES", "3"))
+# Intentos de la escritura optimista de video_statistics (compare-and-set sobre summary_version)
+STATS_WRITE_ATTEMPTS = int(os.getenv("STATS_WRITE_ATTEMPTS", "20"))
 
 ## Esta función es para guardar comentario unico para pruebas
 def save_comment(comment_data: Dict[str, Any]) -> Dict[str, Any] | None:
     """
-    Guarda un comentario individual en Supabase con validación de schema
+    Guarda un comentario individual con validación de schema
     """
     try:
         # VALIDAR con schema Comment
         try:
             validated_comment = Comment(**comment_data)
         except ValidationError as ve:
-            print(f"⚠️ Error de validación: {ve}")
+            logger.warning(f"⚠️ Error de validación: {ve}")
             return None
         
         # Convertir a dict y filtrar solo campos de BD
         comment_dict = validated_comment.dict()
-        db_fields = {
-            "video_id", "text",
-            "toxic_probability", "hatespeech_probability", "abusive_probability",
-            "provocative_probability", "racist_probability", "obscene_probability",
-            "threat_probability", "religious_hate_probability", "nationalist_probability",
-            "sexist_probability", "homophobic_probability", "radicalism_probability",
-            "is_toxic", "is_hatespeech", "is_abusive", "is_provocative",
-            "is_racist", "is_obscene", "is_threat", "is_religious_hate",
-            "is_nationalist", "is_sexist", "is_homophobic", "is_radicalism",
-            "sentiment_type", "sentiment_score", "sentiment_intensity",
-            "total_likes_comment"
-        }
-        
         # extraer campos de BD (sin id ni created_at)
-        filtered_data = {k: v for k, v in comment_dict.items() if k in db_fields and v is not None}
+        filtered_data = _likes_not_null({k: v for k, v in comment_dict.items() if k in DB_FIELDS and v is not None})
         
-        print(f"🔄 Guardando comentario: {filtered_data['text'][:50]}...")
-        response = supabase.table("sentiment_analyzer").insert(filtered_data).execute()
+        logger.debug(f"🔄 Guardando comentario: {filtered_data['text'][:50]}...")
+        saved = get_storage().insert_comment(filtered_data)
         
-        if response.data:
-            print(f"✅ Comentario guardado con ID: {response.data[0]['id']}")
-            return response.data[0]
+        if saved:
+            logger.debug(f"✅ Comentario guardado con ID: {saved['id']}")
+            return saved
         else:
-            print(f"⚠️ Advertencia: No se recibieron datos en la respuesta")
+            logger.warning(f"⚠️ Advertencia: No se recibieron datos en la respuesta")
             return None
             
     except Exception as e:
-        print(f"❌ Error al guardar comentario: {e}")
-        print(f"📋 Datos que causaron error: {comment_data}")
+        logger.error(f"❌ Error al guardar comentario: {e}")
+        logger.debug(f"📋 Datos que causaron error: {comment_data}")
         return None
 
 
-## Esta función es para guardar múltiples comentarios, valida múltiples comentarios y los guarda todos de una vez
+## Escritura de comentarios en lotes: troceada, en paralelo y con reintentos por trozo
+
+@dataclass
+class BatchWriteReport:
+    rows_written: int = 0
+    chunks: int = 0
+    failed_chunks: int = 0
+    retries: int = 0
+    invalid: int = 0
+    unchanged: int = 0
+    elapsed_seconds: float = 0.0
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+    # Filas de los trozos descartados, para reintentarlas más tarde (cola write-behind)
+    failed_rows: List[Dict[str, Any]] = field(default_factory=list)
+    # Vídeos cuyo resumen o franjas no se pudieron actualizar: sus comentarios ya están
+    # guardados (un reintento los saltaría como "sin cambios"), hay que rebuild_video_statistics
+    stale_statistics: List[str] = field(default_factory=list)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_written / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+
+def _likes_not_null(row: Dict[str, Any]) -> Dict[str, Any]:
+    # Sin likes es 0, nunca NULL: el orden por likes es el mismo en Supabase y en SQLite, y en
+    # un UPSERT por lotes PostgREST rellena con NULL las columnas que faltan en alguna fila
+    if row.get("total_likes_comment") is None:
+        row["total_likes_comment"] = 0
+    return row
+
+
+def _to_db_row(comment: Comment | Dict[str, Any], validate: bool = True) -> Dict[str, Any] | None:
+    # Los Comment ya construidos son de confianza: no se re-validan
+    if isinstance(comment, Comment):
+        return comment.model_dump(include=DB_FIELDS, exclude_none=True)
+    if not validate:
+        # Filas generadas por el propio servidor (to_db_rows): solo se filtran columnas
+        return {k: v for k, v in comment.items() if k in DB_FIELDS and v is not None}
+    validated_comment = Comment(**comment)
+    return validated_comment.model_dump(include=DB_FIELDS, exclude_none=True)
+
 
-def save_comments_batch(comments_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def to_db_rows(comments: ScoredComments | List[Comment | Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    Guarda múltiples comentarios con validación de schema
+    Filas de BD de confianza. Los ScoredComments del pipeline salen por columnas, sin Pydantic;
+    los dicts de fuera se validan aquí (los inválidos se saltan)
     """
-    try:
-        if not comments_list:
-            print("⚠️ Lista de comentarios vacía")
-            return []
-        
-        # valida cada comentario con schema
-        validated_comments = []
+    if isinstance(comments, ScoredComments):
+        return comments.rows(DB_COLUMNS, exclude_none=True)
+    rows = []
+    for i, comment in enumerate(comments):
+        try:
+            rows.append(_to_db_row(comment))
+        except ValidationError as ve:
+            logger.warning(f"⚠️ Comentario {i} inválido, saltando: {ve}")
+    return rows
+
+
+def _fetch_existing_scores(video_id: str, comment_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Puntuaciones ya guardadas de esos comentarios, por comment_id
+    """
+    rows = get_storage().get_comment_scores(video_id, comment_ids,
+                                            ["comment_id", "published_at_comment"] + SCORE_FIELDS)
+    return {row["comment_id"]: {**row, "video_id": video_id} for row in rows}
+
+
+def _row_changed(row: Dict[str, Any], existing: Dict[str, Any]) -> bool:
+    for field_name in SCORE_FIELDS:
+        new, old = row.get(field_name), existing.get(field_name)
+        if isinstance(new, float) and isinstance(old, (int, float)) and not isinstance(old, bool):
+            if abs(new - old) > 1e-6:
+                return True
+        elif new != old:
+            return True
+    return False
+
+
+def _row_key(row: Dict[str, Any], default: Any) -> Any:
+    return (row["video_id"], row["comment_id"]) if row.get("comment_id") else default
+
+
+def _fetch_existing_versions(rows: List[Dict[str, Any]]) -> Dict[Any, Dict[str, Any]]:
+    """
+    Versión ya guardada de cada fila, por (video_id, comment_id)
+    """
+    ids_by_video: Dict[str, List[str]] = {}
+    for row in rows:
+        if row.get("comment_id"):
+            ids_by_video.setdefault(row["video_id"], []).append(row["comment_id"])
+
+    existing: Dict[Any, Dict[str, Any]] = {}
+    for video_id, comment_ids in ids_by_video.items():
+        for comment_id, stored in _fetch_existing_scores(video_id, comment_ids).items():
+            existing[(video_id, comment_id)] = stored
+    return existing
+
+
+def _statistics_deltas(written: List[Dict[str, Any]],
+                       replaced: List[Dict[str, Any]]) -> Dict[str, StatsSummary]:
+    """
+    Por vídeo: resumen de las filas escritas menos el de las versiones que reemplazan
+    """
+    new_by_video: Dict[str, List[Dict[str, Any]]] = {}
+    old_by_video: Dict[str, List[Dict[str, Any]]] = {}
+    for row in written:
+        new_by_video.setdefault(row["video_id"], []).append(row)
+    for previous in replaced:
+        old_by_video.setdefault(previous["video_id"], []).append(previous)
+    return {
+        video_id: StatsSummary.from_rows(rows) - StatsSummary.from_rows(old_by_video.get(video_id, []))
+        for video_id, rows in new_by_video.items()
+    }
+
+
+def _upsert_chunk(chunk: List[Dict[str, Any]], max_retries: int,
+                  with_previous: bool = False) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]:
+    """
+    UPSERT de un trozo con reintentos y backoff exponencial. Devuelve (filas, versiones
+    reemplazadas, reintentos); las versiones reemplazadas solo con with_previous.
+    Si se agotan los reintentos, la excepción lleva los hechos en `retries`.
+    """
+    attempt = 0
+    while True:
+        try:
+            # Cada intento, en db_write (y los fallidos, en sentiment_analyzer_errors_total)
+            with stage_timer("db_write"):
+                if with_previous:
+                    return (*get_storage().upsert_comments_returning_previous(chunk), attempt)
+                return get_storage().upsert_comments(chunk), [], attempt
+        except Exception as e:
+            if attempt >= max_retries:
+                e.retries = attempt
+                raise
+            attempt += 1
+            wait = 0.5 * 2 ** (attempt - 1)
+            logger.warning(f"⚠️ Trozo de {len(chunk)} comentarios falló ({e}), reintento {attempt}/{max_retries} en {wait}s")
+            time.sleep(wait)
+
+
+def write_comments(comments_list: ScoredComments | List[Comment | Dict[str, Any]],
+                   chunk_size: int = COMMENT_WRITE_CHUNK_SIZE,
+                   max_workers: int = COMMENT_WRITE_WORKERS,
+                   max_retries: int = COMMENT_WRITE_RETRIES,
+                   skip_unchanged: bool = True,
+                   validate: bool = True,
+                   fold_statistics: bool = False) -> BatchWriteReport:
+    """
+    Guarda comentarios en trozos de `chunk_size` enviados en paralelo (máx. `max_workers`).
+    Un trozo que falla se reintenta por separado sin descartar el resto.
+    Con skip_unchanged solo se reescriben los comentarios nuevos o cuyas puntuaciones cambiaron.
+    validate=False: los dicts ya son filas de to_db_rows y no se pasan por Comment.
+    fold_statistics: suma al resumen de video_statistics (y a video_time_buckets) lo escrito
+    menos lo reemplazado, con las versiones reemplazadas que devuelve el propio UPSERT.
+    """
+    report = BatchWriteReport()
+    started = time.perf_counter()
+
+    if isinstance(comments_list, ScoredComments):
+        rows = to_db_rows(comments_list)
+    else:
+        rows = []
         for i, comment in enumerate(comments_list):
             try:
-                validated_comment = Comment(**comment)
-                validated_comments.append(validated_comment.dict())
+                rows.append(_to_db_row(comment, validate))
             except ValidationError as ve:
-                print(f"⚠️ Comentario {i} inválido, saltando: {ve}")
-                continue
-        
-        if not validated_comments:
-            print("❌ No hay comentarios válidos para guardar")
+                logger.warning(f"⚠️ Comentario {i} inválido, saltando: {ve}")
+                report.invalid += 1
+
+    # Filas para BD; un UPSERT no puede tocar la misma (video_id, comment_id) dos veces
+    rows_by_key: Dict[Any, Dict[str, Any]] = {}
+    for i, row in enumerate(rows):
+        _likes_not_null(row)
+        rows_by_key[_row_key(row, i)] = row
+    batch_data = list(rows_by_key.values())
+
+    existing = None
+    if skip_unchanged and batch_data:
+        try:
+            with stage_timer("db_read_existing"):
+                existing = _fetch_existing_versions(batch_data)
+        except Exception as e:
+            # Sin poder comparar se reescribe todo: el UPSERT sigue siendo idempotente
+            logger.warning(f"⚠️ No se pudieron comparar puntuaciones previas, se reescriben todas: {e}")
+    if existing is not None:
+        changed = [row for i, row in enumerate(batch_data)
+                   if _row_key(row, i) not in existing or _row_changed(row, existing[_row_key(row, i)])]
+        report.unchanged = len(batch_data) - len(changed)
+        batch_data = changed
+
+    chunks = [batch_data[i:i + chunk_size] for i in range(0, len(batch_data), chunk_size)]
+    report.chunks = len(chunks)
+    if not chunks:
+        return report
+
+    written: List[Dict[str, Any]] = []
+    replaced: List[Dict[str, Any]] = []
+
+    def collect(chunk, result):
+        try:
+            rows, previous, retries = result()
+            written.extend(chunk)
+            replaced.extend(previous)
+            report.rows.extend(rows)
+            report.rows_written += len(rows)
+            report.retries += retries
+        except Exception as e:
+            retries = getattr(e, "retries", 0)
+            logger.error(f"❌ Trozo descartado tras {retries} reintentos: {e}")
+            ERRORS.inc(len(chunk), stage="db_write_discarded")
+            report.failed_chunks += 1
+            report.failed_rows.extend(chunk)
+            report.retries += retries
+
+    workers = max(1, min(max_workers, len(chunks)))
+    logger.info(f"🔄 Guardando {len(batch_data)} comentarios en {len(chunks)} trozos ({workers} en paralelo)...")
+    if workers == 1:
+        # Sin pool: nada que paralelizar, y al salir del intérprete (vaciado de la cola
+        # write-behind en atexit) ya no se pueden crear hilos nuevos
+        for chunk in chunks:
+            collect(chunk, lambda: _upsert_chunk(chunk, max_retries, fold_statistics))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_upsert_chunk, chunk, max_retries, fold_statistics): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                collect(futures[future], future.result)
+
+    if written:
+        # Los agregados globales salen de la tabla de comentarios, con o sin fold
+        stats_cache.invalidate_aggregates()
+    if fold_statistics and written:
+        # Los deltas conmutan: da igual en qué orden los sumen lotes concurrentes
+        with stage_timer("stats_fold"):
+            stale = fold_video_statistics(_statistics_deltas(written, replaced))
+            if not fold_time_buckets(merge_rollups(time_bucket_rollups(written), time_bucket_rollups(replaced, -1))):
+                stale += [row["video_id"] for row in written]
+            report.stale_statistics = sorted(set(stale))
+
+    report.elapsed_seconds = time.perf_counter() - started
+    return report
+
+
+## Esta función es para guardar múltiples comentarios, valida múltiples comentarios y los guarda todos de una vez
+
+def save_comments_batch(comments_list: ScoredComments | List[Comment | Dict[str, Any]],
+                        validate: bool = True, fold_statistics: bool = False) -> List[Dict[str, Any]]:
+    """
+    Guarda múltiples comentarios (UPSERT por video_id + comment_id) en trozos paralelos
+    """
+    try:
+        if not len(comments_list):
+            logger.warning("⚠️ Lista de comentarios vacía")
             return []
-        
-        # Filtra campos para BD
-        db_fields = {
-            "video_id", "text",
-            "toxic_probability", "hatespeech_probability", "abusive_probability",
-            "provocative_probability", "racist_probability", "obscene_probability", 
-            "threat_probability", "religious_hate_probability", "nationalist_probability",
-            "sexist_probability", "homophobic_probability", "radicalism_probability",
-            "is_toxic", "is_hatespeech", "is_abusive", "is_provocative",
-            "is_racist", "is_obscene", "is_threat", "is_religious_hate",
-            "is_nationalist", "is_sexist", "is_homophobic", "is_radicalism",
-            "sentiment_type", "sentiment_score", "sentiment_intensity",
-            "total_likes_comment"
-        }
-        
-        # Prepara datos para inserción en lote
-        batch_data = []
-        for comment in validated_comments:
-            filtered_comment = {k: v for k, v in comment.items() if k in db_fields and v is not None}
-            batch_data.append(filtered_comment)
-        
-        print(f"🔄 Guardando {len(batch_data)} comentarios en lote...")
-        response = supabase.table("sentiment_analyzer").insert(batch_data).execute()
-        
-        if response.data:
-            print(f"✅ {len(response.data)} comentarios guardados correctamente")
-            return response.data
-        else:
-            print("⚠️ Advertencia: No se recibieron datos en la respuesta")
+
+        report = write_comments(comments_list, validate=validate, fold_statistics=fold_statistics)
+        if not report.chunks:
+            if report.unchanged:
+                logger.info(f"✅ {report.unchanged} comentarios ya guardados sin cambios, nada que escribir")
+            else:
+                logger.warning("❌ No hay comentarios válidos para guardar")
             return []
+
+        logger.info(f"✅ {report.rows_written} comentarios guardados en {report.elapsed_seconds:.2f}s "
+                    f"({report.rows_per_second:.0f} filas/s, {report.unchanged} sin cambios, {report.retries} reintentos, "
+                    f"{report.failed_chunks}/{report.chunks} trozos fallidos)")
+        return report.rows
             
     except Exception as e:
-        print(f"❌ Error al guardar comentarios en lote: {e}")
+        logger.error(f"❌ Error al guardar comentarios en lote: {e}")
         return []
 
 
@@ -117,34 +358,160 @@ def get_comments_by_video(video_id: str) -> List[Dict[str, Any]]:
     Recupera comentarios de un video específico
     """
     try:
-        print(f"🔍 Buscando comentarios para video: {video_id}")
-        response = supabase.table("sentiment_analyzer").select("*").eq("video_id", video_id).execute()
+        logger.debug(f"🔍 Buscando comentarios para video: {video_id}")
+        rows = get_storage().get_comments_by_video(video_id)
         
-        if response.data:
-            print(f"✅ Encontrados {len(response.data)} comentarios para el video")
-            return response.data
+        if rows:
+            logger.debug(f"✅ Encontrados {len(rows)} comentarios para el video")
+            return rows
         else:
-            print("📭 No se encontraron comentarios para este video")
+            logger.debug("📭 No se encontraron comentarios para este video")
             return []
             
     except Exception as e:
-        print(f"❌ Error al recuperar comentarios: {e}")
+        logger.error(f"❌ Error al recuperar comentarios: {e}")
         return []
 
 
+## Lectura paginada (keyset) con proyección de columnas y filtros en servidor
+
+# Columnas que se pueden pedir con fields= (además de las generadas por la BD)
+READ_FIELDS = DB_FIELDS | {"id", "created_at"}
+TOXICITY_CATEGORIES = sorted(f[len("is_"):] for f in DB_FIELDS if f.startswith("is_"))
+COMMENTS_PAGE_MAX = 5000
+# Claves del cursor según el orden de la página
+CURSOR_KEYS = {"id": ("id",), "likes": ("id", "likes")}
+
+
+def encode_cursor(values: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, order_by: str = "id") -> Dict[str, Any]:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError(f"Cursor no válido: {cursor}")
+    # Un cursor emitido con otro order_by (o alterado) rompería la consulta keyset
+    if not isinstance(position, dict) or set(position) != set(CURSOR_KEYS[order_by]) or \
+            not all(isinstance(value, int) and not isinstance(value, bool) for value in position.values()):
+        raise ValueError(f"Cursor no válido para order_by={order_by}: repite la consulta sin cursor")
+    return position
+
+
+def parse_fields(fields: str | None) -> List[str] | None:
+    """
+    "text,toxic_probability" -> lista validada de columnas (None = todas)
+    """
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in READ_FIELDS]
+    if unknown:
+        raise ValueError(f"Campos desconocidos: {', '.join(unknown)}")
+    return requested
+
+
+def get_comments_page(video_id: str | None = None,
+                      cursor: str | None = None,
+                      limit: int = 500,
+                      fields: List[str] | None = None,
+                      toxic_only: bool = False,
+                      categories: List[str] | None = None,
+                      min_probability: float | None = None,
+                      sentiment_type: str | None = None,
+                      order_by: str = "id") -> Dict[str, Any]:
+    """
+    Una página de comentarios. order_by="id" (orden de inserción) o "likes" (top-N por likes).
+    Devuelve {"comments": [...], "next_cursor": str | None}; next_cursor None = última página.
+    """
+    if order_by not in CURSOR_KEYS:
+        raise ValueError("order_by debe ser 'id' o 'likes'")
+    unknown = [c for c in categories or [] if c not in TOXICITY_CATEGORIES]
+    if unknown:
+        raise ValueError(f"Categorías desconocidas: {', '.join(unknown)}")
+    limit = max(1, min(limit, COMMENTS_PAGE_MAX))
+
+    # El cursor necesita id (y likes si se ordena por likes) aunque no se pidan
+    columns = list(fields) if fields else ["*"]
+    if fields:
+        required = ["id"] + (["total_likes_comment"] if order_by == "likes" else [])
+        columns += [c for c in required if c not in columns]
+
+    position = decode_cursor(cursor, order_by) if cursor else None
+    rows = get_storage().query_comments(
+        video_id=video_id,
+        columns=columns,
+        toxic_only=toxic_only,
+        categories=categories,
+        min_probability=min_probability,
+        sentiment_type=sentiment_type,
+        order_by=order_by,
+        position=position,
+        limit=limit,
+    )
+
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        position = {"id": last["id"]}
+        if order_by == "likes":
+            position["likes"] = last.get("total_likes_comment") or 0
+        next_cursor = encode_cursor(position)
+
+    return {"comments": rows, "next_cursor": next_cursor}
+
+
+## Esta función recupera el estado de sincronización de un video para el análisis incremental
+def get_video_sync_state(video_id: str) -> Dict[str, Any]:
+    """
+    Devuelve si el video tiene comentarios guardados y la fecha del comentario más reciente
+    """
+    state = {"has_comments": False, "last_published_at": None}
+    try:
+        logger.debug(f"🔍 Recuperando estado incremental para video: {video_id}")
+        state = get_storage().get_comment_sync_state(video_id)
+        logger.debug(f"✅ Comentarios guardados: {state['has_comments']}, último: {state['last_published_at']}")
+        return state
+
+    except Exception as e:
+        logger.error(f"❌ Error al recuperar estado incremental: {e}")
+        return state
+
+
+## Esta función dice qué hilos de una página de YouTube ya están guardados
+def get_known_threads(video_id: str, thread_ids: List[str]) -> Dict[str, Set[str]]:
+    """
+    {hilo con el comentario principal guardado: ids de sus respuestas guardadas}
+    """
+    thread_ids = set(thread_ids)
+    stored, replies = set(), {}
+    for row in get_storage().get_thread_comment_ids(video_id, list(thread_ids)):
+        # El comentario principal tiene el mismo id que su hilo
+        if row["comment_id"] in thread_ids:
+            stored.add(row["comment_id"])
+        else:
+            replies.setdefault(row.get("thread_id"), set()).add(row["comment_id"])
+    return {thread_id: replies.get(thread_id, set()) for thread_id in stored}
+
+
 ## Esta función es para eliminar todos los comentarios de un video específico
 def delete_comments_by_video(video_id: str) -> bool:
     """
     Elimina todos los comentarios de un video
     """
     try:
-        print(f"🗑️ Eliminando comentarios del video: {video_id}")
-        response = supabase.table("sentiment_analyzer").delete().eq("video_id", video_id).execute()
-        print(f"✅ Comentarios eliminados correctamente")
+        logger.info(f"🗑️ Eliminando comentarios del video: {video_id}")
+        deleted = get_storage().delete_comments_by_video(video_id)
+        # Resta de lo borrado: el resumen del vídeo queda vacío sin recalcular nada
+        fold_video_statistics({video_id: StatsSummary() - StatsSummary.from_rows(deleted)})
+        get_storage().delete_time_buckets(video_id)
+        stats_cache.invalidate(video_id)
+        logger.info(f"✅ Comentarios eliminados correctamente")
         return True
         
     except Exception as e:
-        print(f"❌ Error al eliminar comentarios: {e}")
+        logger.error(f"❌ Error al eliminar comentarios: {e}")
         return False
 
 
@@ -208,65 +575,296 @@ def save_video_statistics(video_id: str, complete_stats: Dict[str, Any]) -> Dict
     Resumen de TODOS los comentarios del video
     """
     try:
-        import json
-        print(f"📊 Guardando estadísticas para video: {video_id}")
-
-        stats_record = {
-            "video_id": video_id,
-            "total_comments": complete_stats.get("total_comments", 0),
-            "percentage_toxicity": complete_stats.get("percentage_toxicity", 0.0),
-            "mean_likes": complete_stats.get("mean_likes", 0.0),
-            "max_likes": complete_stats.get("max_likes", 0),
-            "total_likes": complete_stats.get("total_likes", 0),
-            "self_promotional": complete_stats.get("self_promotional", 0),
-            "mean_sentiment_score": complete_stats.get("mean_sentiment_score", 0.0),
-            "sentiment_distribution": json.dumps(complete_stats.get("sentiment_distribution", {})),
-            "toxicity_stats": json.dumps(complete_stats.get("toxicity_stats", {})),
-        }
-        
-        # UPSERT: insertar o actualizar si ya existe
-        response = supabase.table("video_statistics")\
-            .upsert(stats_record, on_conflict="video_id")\
-            .execute()
+        logger.debug(f"📊 Guardando estadísticas para video: {video_id}")
+        saved = write_video_statistics(video_id, complete_stats)
         
-        if response.data:
-            print(f"✅ Estadísticas guardadas/actualizadas para video: {video_id}")
-            return response.data[0]
+        if saved:
+            logger.info(f"✅ Estadísticas guardadas/actualizadas para video: {video_id}")
+            return saved
         else:
-            print(f"⚠️ No se recibieron datos al guardar estadísticas")
+            logger.warning(f"⚠️ No se recibieron datos al guardar estadísticas")
             return None
             
     except Exception as e:
-        print(f"❌ Error al guardar estadísticas: {e}")
+        logger.error(f"❌ Error al guardar estadísticas: {e}")
         return None
 
+def _stats_record(video_id: str, complete_stats: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "video_id": video_id,
+        "total_comments": complete_stats.get("total_comments", 0),
+        "percentage_toxicity": complete_stats.get("percentage_toxicity", 0.0),
+        "mean_likes": complete_stats.get("mean_likes", 0.0),
+        "max_likes": complete_stats.get("max_likes", 0),
+        "total_likes": complete_stats.get("total_likes", 0),
+        "self_promotional": complete_stats.get("self_promotional", 0),
+        "mean_sentiment_score": complete_stats.get("mean_sentiment_score", 0.0),
+        # Columnas JSONB (migrations/005_statistics_jsonb.sql): se envían como dict
+        "sentiment_distribution": complete_stats.get("sentiment_distribution", {}),
+        "toxicity_stats": complete_stats.get("toxicity_stats", {}),
+        "toxicity_cooccurrence": complete_stats.get("toxicity_cooccurrence", {}),
+        # Resumen sumable (migrations/007_statistics_summary.sql): base de fold_video_statistics
+        "summary": complete_stats.get("summary"),
+    }
+
+
+def _compare_and_set_statistics(video_id: str,
+                                compute: Callable[[Dict[str, Any] | None], Dict[str, Any] | None]) -> Dict[str, Any] | None:
+    """
+    Lee la fila del vídeo, calcula sus complete_stats con compute(fila) y la escribe solo si
+    nadie la cambió entretanto (summary_version); si no, vuelve a empezar. A diferencia de un
+    lock del proceso, vale entre workers de uvicorn que comparten la BD.
+    compute devuelve None si no hay nada que escribir.
+    """
+    storage = get_storage()
+    for _ in range(STATS_WRITE_ATTEMPTS):
+        row = storage.get_video_statistics(video_id)
+        row = _parse_stats_row(row) if row else None
+        complete_stats = compute(row)
+        if complete_stats is None:
+            return row
+        version = (row.get("summary_version") or 0) if row else None
+        saved = storage.compare_and_set_video_statistics(_stats_record(video_id, complete_stats), version)
+        if saved is not None:
+            stats_cache.invalidate(video_id)
+            return saved
+    raise RuntimeError(f"video_statistics de {video_id} cambió {STATS_WRITE_ATTEMPTS} veces seguidas")
+
+
+def write_video_statistics(video_id: str, complete_stats: Dict[str, Any]) -> Dict[str, Any] | None:
+    """
+    Reescribe las estadísticas sin capturar errores (la cola write-behind reintenta)
+    """
+    return _compare_and_set_statistics(video_id, lambda row: complete_stats)
+
+def _parse_stats_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    # Con JSONB llegan ya como dict; solo las filas anteriores a la migración 005 son texto
+    for key in ("sentiment_distribution", "toxicity_stats", "toxicity_cooccurrence", "summary"):
+        if isinstance(row.get(key), str):
+            row[key] = json.loads(row[key])
+    return row
+
+def _flag_legacy(stats: Dict[str, Any]) -> Dict[str, Any]:
+    # Fila anterior a los resúmenes: sus números son solo los de la última petición
+    if needs_rebuild(stats):
+        stats["needs_rebuild"] = True
+    return stats
+
 def get_video_statistics(video_id: str) -> Dict[str, Any] | None:
     """
-    Recupera estadísticas de UN video específico
+    Recupera estadísticas de UN video específico (read-through con stats_cache).
+    El dict devuelto se comparte con la caché: no modificarlo.
+    Solo lee: una fila anterior a los resúmenes se devuelve tal cual con needs_rebuild=True
+    (la recalculan backfill_statistics o POST /api/video-statistics/.../rebuild).
     """
+    cached = stats_cache.get(video_key(video_id))
+    if cached is not None:
+        return cached
+    generation = stats_cache.generation(video_key(video_id))
+
     try:
-        import json
-        print(f"📊 Buscando estadísticas para video: {video_id}")
-        response = supabase.table("video_statistics")\
-            .select("*")\
-            .eq("video_id", video_id)\
-            .single()\
-            .execute()
+        logger.debug(f"📊 Buscando estadísticas para video: {video_id}")
+        row = get_storage().get_video_statistics(video_id)
         
-        if response.data:
-            # Parsear campos JSON de vuelta a dict
-            stats = response.data.copy()
-            if stats.get("sentiment_distribution"):
-                stats["sentiment_distribution"] = json.loads(stats["sentiment_distribution"])
-            if stats.get("toxicity_stats"):
-                stats["toxicity_stats"] = json.loads(stats["toxicity_stats"])
-            
-            print(f"✅ Estadísticas encontradas para video: {video_id}")
+        if row:
+            stats = _flag_legacy(_parse_stats_row(row))
+            stats_cache.set(video_key(video_id), stats, generation=generation)
+            logger.debug(f"✅ Estadísticas encontradas para video: {video_id}")
             return stats
         else:
-            print(f"📭 No hay estadísticas guardadas para video: {video_id}")
+            logger.debug(f"📭 No hay estadísticas guardadas para video: {video_id}")
             return None
             
     except Exception as e:
-        print(f"❌ Error al recuperar estadísticas: {e}")
-        return None
\ No newline at end of file
+        logger.error(f"❌ Error al recuperar estadísticas: {e}")
+        return None
+
+def get_all_video_statistics() -> List[Dict[str, Any]]:
+    """
+    Estadísticas de todos los videos, con snapshot cacheado hasta el próximo upsert/borrado
+    """
+    cached = stats_cache.get(ALL_VIDEOS_KEY)
+    if cached is not None:
+        return cached
+    generation = stats_cache.generation(ALL_VIDEOS_KEY)
+
+    logger.debug("📊 Recuperando todas las estadísticas de video_statistics...")
+    parsed_stats = [_flag_legacy(_parse_stats_row(stat)) for stat in get_storage().list_video_statistics()]
+    stats_cache.set(ALL_VIDEOS_KEY, parsed_stats, generation=generation)
+    return parsed_stats
+
+def delete_video_statistics(video_id: str) -> bool:
+    """
+    Elimina las estadísticas guardadas de un video
+    """
+    try:
+        get_storage().delete_video_statistics(video_id)
+        stats_cache.invalidate(video_id)
+        logger.info(f"✅ Estadísticas eliminadas para video: {video_id}")
+        return True
+    except Exception as e:
+        logger.error(f"❌ Error al eliminar estadísticas: {e}")
+        return False
+
+
+#  RESÚMENES SUMABLES DE ESTADÍSTICAS
+# video_statistics se mantiene desde la escritura de comentarios: cada lote suma su resumen
+# (menos el de las versiones que reemplaza) y cada borrado resta el de las filas borradas.
+
+
+def fold_video_statistics(deltas: Dict[str, StatsSummary]) -> List[str]:
+    """
+    Suma cada delta al resumen guardado del vídeo y reescribe su fila de video_statistics.
+    Devuelve los vídeos que no se pudieron actualizar.
+    """
+    failed = []
+    for video_id, delta in deltas.items():
+        def fold(row, delta=delta, video_id=video_id):
+            if needs_rebuild(row):
+                # Fila anterior a los resúmenes: el delta ya está en los comentarios, se recalcula todo
+                return StatsSummary.from_rows(get_storage().get_comments_by_video(video_id)).to_complete_stats()
+            folded = StatsSummary.from_complete_stats(row).merge(delta)
+            if folded.count <= 0:
+                # Vídeo sin comentarios (o resumen anterior inexacto): se empieza de cero
+                if row is None:
+                    return None
+                folded = StatsSummary()
+            return folded.to_complete_stats()
+
+        try:
+            # Leer-sumar-escribir con compare-and-set: dos lotes del mismo vídeo no se pisan
+            _compare_and_set_statistics(video_id, fold)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo actualizar el resumen de {video_id}: {e}")
+            ERRORS.inc(stage="stats_fold")
+            failed.append(video_id)
+    return failed
+
+
+def _bucket_row(key: tuple, values: Dict[str, float]) -> Dict[str, Any]:
+    video_id, granularity, bucket_start = key
+    return {"video_id": video_id, "granularity": granularity, "bucket_start": bucket_start, **values}
+
+
+def fold_time_buckets(deltas: Dict[tuple, Dict[str, float]]) -> bool:
+    """
+    Suma los contadores de cada franja (video_id, granularity, bucket_start) a los guardados.
+    La suma la hace la BD: no se lee nada y dos lotes simultáneos no se pisan.
+    """
+    if not deltas:
+        return True
+    try:
+        get_storage().add_time_buckets([_bucket_row(key, values) for key, values in deltas.items()])
+        return True
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudieron actualizar las franjas de tiempo: {e}")
+        ERRORS.inc(stage="stats_fold")
+        return False
+
+
+def get_timeline(video_id: str, granularity: str = "hour", start: str | None = None,
+                 end: str | None = None) -> List[Dict[str, Any]]:
+    """
+    Franjas [start, end) de un vídeo ya agregadas (sin leer comentarios); omite las vacías
+    """
+    rows = get_storage().get_time_buckets(video_id, granularity,
+                                          bucket_key(start) if start else None, bucket_key(end) if end else None)
+    return [bucket_view(row) for row in rows if (row.get("comments") or 0) > 0]
+
+
+def rebuild_video_statistics(video_id: str) -> Dict[str, Any] | None:
+    """
+    Recalcula el resumen y las franjas de un vídeo leyendo todos sus comentarios (si quedaron desfasados).
+    Un lote del vídeo que se escriba mientras tanto puede quedar contado dos veces: lanzarlo
+    sin análisis de ese vídeo en curso.
+    """
+    try:
+        rows: List[Dict[str, Any]] = []
+        summary = StatsSummary()
+
+        def recompute(row):
+            nonlocal rows, summary
+            # Se relee en cada intento: si el resumen cambió es que entraron comentarios
+            rows = get_storage().get_comments_by_video(video_id)
+            summary = StatsSummary.from_rows(rows)
+            return summary.to_complete_stats()
+
+        saved = _compare_and_set_statistics(video_id, recompute)
+        get_storage().delete_time_buckets(video_id)
+        buckets = time_bucket_rollups(rows)
+        if buckets:
+            get_storage().upsert_time_buckets([_bucket_row(key, values) for key, values in buckets.items()])
+        logger.info(f"✅ Estadísticas recalculadas para video: {video_id} ({summary.count} comentarios)")
+        return saved
+    except Exception as e:
+        logger.error(f"❌ Error al recalcular estadísticas: {e}")
+        return None
+
+
+def backfill_video_statistics() -> Dict[str, int]:
+    """
+    Recalcula todas las filas de video_statistics sin resumen sumable (anteriores a la
+    migración 007), que solo guardan los números de la última petición
+    """
+    legacy = [row["video_id"] for row in get_storage().list_video_statistics() if needs_rebuild(row)]
+    rebuilt = 0
+    for video_id in legacy:
+        if rebuild_video_statistics(video_id) is not None:
+            rebuilt += 1
+    logger.info(f"✅ Backfill de estadísticas: {rebuilt}/{len(legacy)} vídeos recalculados")
+    return {"legacy": len(legacy), "rebuilt": rebuilt}
+
+
+def delete_comments(video_id: str, comment_ids: List[str]) -> int:
+    """
+    Borra comentarios concretos de un vídeo y resta sus filas del resumen del vídeo
+    """
+    try:
+        rows = get_storage().get_comment_scores(video_id, comment_ids, ["id"])
+        if not rows:
+            return 0
+        # Se resta lo que de verdad se borró (la versión vigente al borrar, no la leída antes)
+        rows = get_storage().delete_comments_by_ids([row["id"] for row in rows])
+        if not rows:
+            return 0
+        fold_video_statistics({video_id: StatsSummary() - StatsSummary.from_rows(rows)})
+        fold_time_buckets(time_bucket_rollups(rows, -1))
+        stats_cache.invalidate(video_id)
+        logger.info(f"🗑️ {len(rows)} comentarios eliminados del video: {video_id}")
+        return len(rows)
+    except Exception as e:
+        logger.error(f"❌ Error al eliminar comentarios: {e}")
+        return 0
+
+
+def _merged_summary(video_ids: List[str] | None) -> tuple[StatsSummary, int, List[str]]:
+    stats = get_all_video_statistics()
+    if video_ids is not None:
+        wanted = set(video_ids)
+        stats = [row for row in stats if row.get("video_id") in wanted]
+    # Las filas sin resumen no se pueden sumar: quedan fuera hasta recalcularlas
+    legacy = [row["video_id"] for row in stats if row.get("needs_rebuild")]
+    stats = [row for row in stats if not row.get("needs_rebuild")]
+    return StatsSummary.merge_all(StatsSummary.from_complete_stats(row) for row in stats), len(stats), legacy
+
+
+def get_summary_statistics(video_ids: List[str] | None = None) -> Dict[str, Any]:
+    """
+    complete_stats de varios vídeos (un canal) o de todos, sumando sus resúmenes guardados
+    """
+    merged, videos, legacy = _merged_summary(video_ids)
+    complete_stats = merged.to_complete_stats()
+    complete_stats["videos"] = videos
+    complete_stats["needs_rebuild"] = legacy
+    return complete_stats
+
+
+def get_distribution(video_ids: List[str] | None = None, sample_size: int | None = None) -> Dict[str, Any]:
+    """
+    Histogramas, cuantiles y muestra de uno o varios vídeos (o de todos), de tamaño fijo
+    """
+    merged, videos, legacy = _merged_summary(video_ids)
+    result = distribution(merged, sample_size=sample_size)
+    result["videos"] = videos
+    result["needs_rebuild"] = legacy
+    return result
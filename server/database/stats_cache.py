@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from server.outils.logging_config import get_logger
+
+# Caché de lectura para las estadísticas de video_statistics (ya parseadas).
+# Nivel 1: en memoria del proceso, LRU con tamaño máximo y TTL.
+# Nivel 2 (opcional): backend compartido (Redis) para que varios workers vean las
+# mismas invalidaciones. Con backend compartido el nivel 1 usa un TTL corto, que acota
+# lo que puede tardar un worker en ver una invalidación hecha por otro.
+# Read-through: generation(key) antes de leer la BD y set(..., generation=) después; si
+# entre medias hubo una invalidación, el valor leído puede ser anterior y no se guarda.
+# Los agregados globales dependen de los parámetros de la petición: su clave lleva la
+# generación de GLOBAL_AGGREGATES_KEY, y al invalidar las claves anteriores quedan sin uso.
+
+ALL_VIDEOS_KEY = "video_statistics:all"
+GLOBAL_AGGREGATES_KEY = "dashboard_aggregates"
+# Los contadores de generación en el backend compartido caducan si nadie invalida en un día
+GENERATION_TTL = 86400
+
+logger = get_logger(__name__)
+
+
+def video_key(video_id: str) -> str:
+    return f"video_statistics:{video_id}"
+
+
+def aggregates_key(generation: Tuple[int, Optional[str]], *params: Any) -> str:
+    local, shared = generation
+    return ":".join(str(part) for part in (GLOBAL_AGGREGATES_KEY, local, shared) + params)
+
+
+def _generation_key(key: str) -> str:
+    return f"{key}:generation"
+
+
+class TTLCache:
+    """
+    LRU en memoria con caducidad por entrada; seguro entre hilos
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def keys(self) -> list:
+        with self._lock:
+            return list(self._data)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class InMemorySharedBackend:
+    """
+    Sustituto local de Redis para tests: una instancia compartida entre varios
+    StatsCache simula varios workers conectados al mismo backend
+    """
+    def __init__(self):
+        self._store = TTLCache(maxsize=100_000, ttl=3600)
+        self._incr_lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        return self._store.get(key)
+
+    def set(self, key: str, value: str, ttl: float):
+        self._store.set(key, value, ttl)
+
+    def delete(self, *keys: str):
+        self._store.delete(*keys)
+
+    def incr(self, key: str, ttl: float) -> int:
+        with self._incr_lock:
+            value = int(self._store.get(key) or 0) + 1
+            self._store.set(key, str(value), ttl)
+            return value
+
+
+class RedisBackend:
+    def __init__(self, url: str):
+        import redis  # dependencia opcional, solo si se configura STATS_CACHE_REDIS_URL
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._client.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, value: str, ttl: float):
+        self._client.set(key, value, ex=max(1, int(ttl)))
+
+    def delete(self, *keys: str):
+        if keys:
+            self._client.delete(*keys)
+
+    def incr(self, key: str, ttl: float) -> int:
+        with self._client.pipeline() as pipe:
+            value, _ = pipe.incr(key).expire(key, max(1, int(ttl))).execute()
+        return value
+
+
+class StatsCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 300, shared=None, shared_local_ttl: float = 5):
+        self.ttl = ttl
+        self.shared = shared
+        self.local = TTLCache(maxsize=maxsize, ttl=min(ttl, shared_local_ttl) if shared else ttl)
+        self.hits = 0
+        self.misses = 0
+        # Invalidaciones por clave en este proceso; el lock también cubre comprobar y guardar
+        self._generations: Dict[str, int] = {}
+        self._generation_lock = threading.Lock()
+
+    def generation(self, key: str) -> Tuple[int, Optional[str]]:
+        """
+        Versión actual de la clave (local y compartida) para pasarla luego a set()
+        """
+        with self._generation_lock:
+            local = self._generations.get(key, 0)
+        shared = None
+        if self.shared is not None:
+            try:
+                shared = self.shared.get(_generation_key(key))
+            except Exception as e:
+                logger.warning(f"⚠️ Caché compartida no disponible: {e}")
+        return local, shared
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            try:
+                raw = self.shared.get(key)
+            except Exception as e:
+                logger.warning(f"⚠️ Caché compartida no disponible: {e}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, generation: Optional[Tuple[int, Optional[str]]] = None):
+        """
+        Con generation (de generation() antes de leer la BD) no se guarda nada si la clave
+        se invalidó después: el valor podría ser anterior a la escritura que invalidó
+        """
+        if generation is not None and self.shared is not None:
+            _, shared = self.generation(key)
+            if shared != generation[1]:
+                return
+        with self._generation_lock:
+            if generation is not None and self._generations.get(key, 0) != generation[0]:
+                return
+            self.local.set(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, json.dumps(value, default=str), self.ttl)
+            except Exception as e:
+                logger.warning(f"⚠️ Caché compartida no disponible: {e}")
+
+    def invalidate(self, video_id: str):
+        # Cambiar un video también deja obsoleto el listado de todos los videos y los agregados
+        self._invalidate(video_key(video_id), ALL_VIDEOS_KEY, GLOBAL_AGGREGATES_KEY)
+
+    def invalidate_aggregates(self):
+        # Comentarios escritos sin tocar video_statistics
+        self._invalidate(GLOBAL_AGGREGATES_KEY)
+
+    def _invalidate(self, *keys: str):
+        with self._generation_lock:
+            for key in keys:
+                self._generations[key] = self._generations.get(key, 0) + 1
+            self.local.delete(*keys)
+        if self.shared is not None:
+            try:
+                for key in keys:
+                    self.shared.incr(_generation_key(key), GENERATION_TTL)
+                self.shared.delete(*keys)
+            except Exception as e:
+                logger.warning(f"⚠️ Caché compartida no disponible: {e}")
+
+    def clear(self):
+        self.local.clear()
+
+    def info(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.local),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "shared_backend": type(self.shared).__name__ if self.shared else None,
+        }
+
+
+def cache_from_env() -> StatsCache:
+    redis_url = os.getenv("STATS_CACHE_REDIS_URL")
+    shared = None
+    if redis_url:
+        try:
+            shared = RedisBackend(redis_url)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo conectar a Redis ({e}), solo caché local")
+    return StatsCache(
+        maxsize=int(os.getenv("STATS_CACHE_SIZE", "1024")),
+        ttl=float(os.getenv("STATS_CACHE_TTL", "300")),
+        shared=shared,
+    )
+
+
+stats_cache = cache_from_env()
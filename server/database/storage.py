@@ -0,0 +1,817 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from server.outils.logging_config import get_logger
+
+# Backend de almacenamiento intercambiable. Todo el acceso a la BD (escritura de
+# comentarios, upsert de estadísticas, lecturas por video y agregados) pasa por un
+# StorageBackend:
+#   - SupabaseStorage: la BD gestionada de producción (PostgREST)
+#   - SQLiteStorage: BD embebida con el mismo esquema e índices, para desarrollo local,
+#     tests rápidos y despliegues de un solo nodo sin credenciales
+#
+# Se elige con STORAGE_BACKEND=supabase|sqlite. Sin valor se usa Supabase si hay
+# credenciales (SUPABASE_URL/SUPABASE_KEY) y SQLite (SQLITE_PATH) si no.
+
+COMMENTS_TABLE = "sentiment_analyzer"
+STATS_TABLE = "video_statistics"
+TIME_BUCKETS_TABLE = "video_time_buckets"
+# Filas por petición al leer tablas enteras de Supabase (no más que el max-rows de PostgREST)
+SUPABASE_PAGE_SIZE = int(os.getenv("SUPABASE_PAGE_SIZE", "1000"))
+
+logger = get_logger(__name__)
+
+TOXICITY_CATEGORIES = [
+    "toxic", "hatespeech", "abusive", "provocative", "racist", "obscene",
+    "threat", "religious_hate", "nationalist", "sexist", "homophobic", "radicalism",
+]
+
+
+class StorageBackend:
+    """
+    Operaciones que la aplicación necesita de la BD. Las filas son dicts con los
+    nombres de columna de sentiment_analyzer / video_statistics.
+    """
+    name = "base"
+
+    # --- Comentarios ---
+    def insert_comment(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def upsert_comments(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """UPSERT de un trozo por (video_id, comment_id); devuelve las filas guardadas"""
+        raise NotImplementedError
+
+    def upsert_comments_returning_previous(self, rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        UPSERT como upsert_comments que devuelve también la versión anterior de las filas que
+        reemplaza, leída en la misma transacción y con los vídeos del trozo bloqueados: dos
+        escrituras simultáneas de los mismos comentarios no ven ambas "no había nada"
+        """
+        raise NotImplementedError
+
+    def get_comment_scores(self, video_id: str, comment_ids: List[str],
+                           columns: List[str]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_comments_by_video(self, video_id: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_comment_sync_state(self, video_id: str) -> Dict[str, Any]:
+        """{"has_comments", "last_published_at"}: si hay comentarios guardados y el más reciente"""
+        raise NotImplementedError
+
+    def get_thread_comment_ids(self, video_id: str, thread_ids: List[str]) -> List[Dict[str, Any]]:
+        """comment_id y thread_id de los comentarios guardados de esos hilos"""
+        raise NotImplementedError
+
+    def query_comments(self, video_id: Optional[str] = None, columns: Optional[List[str]] = None,
+                       toxic_only: bool = False, categories: Optional[List[str]] = None,
+                       min_probability: Optional[float] = None, sentiment_type: Optional[str] = None,
+                       order_by: str = "id", position: Optional[Dict[str, Any]] = None,
+                       limit: int = 500) -> List[Dict[str, Any]]:
+        """Página keyset: position es el cursor decodificado ({"id"} o {"id", "likes"})"""
+        raise NotImplementedError
+
+    def scan_comment_keys(self, after_id: int, limit: int,
+                          video_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """id, video_id, comment_id y text ordenados por id (para la compactación)"""
+        raise NotImplementedError
+
+    def delete_comments_by_video(self, video_id: str) -> List[Dict[str, Any]]:
+        """Devuelve las filas borradas (lo que hay que restar del resumen)"""
+        raise NotImplementedError
+
+    def delete_comments_by_ids(self, ids: List[int]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    # --- Estadísticas ---
+    def upsert_video_statistics(self, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def compare_and_set_video_statistics(self, record: Dict[str, Any],
+                                         version: Optional[int]) -> Optional[Dict[str, Any]]:
+        """
+        Escribe la fila solo si su summary_version sigue siendo `version` (None: si el vídeo
+        aún no tiene fila) y la incrementa. None si otro escritor la cambió antes.
+        """
+        raise NotImplementedError
+
+    def get_video_statistics(self, video_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def list_video_statistics(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def delete_video_statistics(self, video_id: str):
+        raise NotImplementedError
+
+    # --- Franjas de tiempo (rollups por hora / día) ---
+    def get_time_buckets(self, video_id: str, granularity: str, start: Optional[str] = None,
+                         end: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Franjas del video con start <= bucket_start < end, ordenadas por bucket_start"""
+        raise NotImplementedError
+
+    def upsert_time_buckets(self, rows: List[Dict[str, Any]]):
+        """UPSERT por (video_id, granularity, bucket_start) con los contadores ya sumados"""
+        raise NotImplementedError
+
+    def add_time_buckets(self, rows: List[Dict[str, Any]]):
+        """
+        Suma los contadores de cada fila a los de su franja en la propia BD (atómico entre
+        procesos); las franjas que quedan sin comentarios se ponen a cero
+        """
+        raise NotImplementedError
+
+    def delete_time_buckets(self, video_id: str):
+        raise NotImplementedError
+
+    # --- Agregados ---
+    def global_aggregates(self, top_videos: int, bins: int, high_risk_rate: float) -> Optional[Dict[str, Any]]:
+        """Agregados del dashboard calculados en la BD; None si el backend no los soporta"""
+        return None
+
+    def ping(self) -> bool:
+        raise NotImplementedError
+
+
+class SupabaseStorage(StorageBackend):
+    name = "supabase"
+
+    def __init__(self, client):
+        self.client = client
+
+    def _table(self, name: str):
+        return self.client.table(name)
+
+    def insert_comment(self, row):
+        response = self._table(COMMENTS_TABLE).insert(row).execute()
+        return response.data[0] if response.data else None
+
+    def upsert_comments(self, rows):
+        response = self._table(COMMENTS_TABLE)\
+            .upsert(rows, on_conflict="video_id,comment_id")\
+            .execute()
+        return response.data or []
+
+    def upsert_comments_returning_previous(self, rows):
+        # migrations/009_atomic_statistics.sql
+        result = self.client.rpc("upsert_comments_returning_previous", {"rows": rows}).execute().data or {}
+        return result.get("rows") or [], result.get("previous") or []
+
+    def get_comment_scores(self, video_id, comment_ids, columns):
+        # Consultas de 200 ids para no exceder la longitud de la URL
+        rows = []
+        for i in range(0, len(comment_ids), 200):
+            response = self._table(COMMENTS_TABLE)\
+                .select(",".join(columns))\
+                .eq("video_id", video_id)\
+                .in_("comment_id", comment_ids[i:i + 200])\
+                .execute()
+            rows.extend(response.data or [])
+        return rows
+
+    def get_comments_by_video(self, video_id):
+        # PostgREST corta cada respuesta en su máximo de filas (1000 por defecto): se pagina
+        # por id (keyset) hasta la última, o un recálculo del resumen contaría solo una parte
+        rows, last_id = [], 0
+        while True:
+            page = self._table(COMMENTS_TABLE)\
+                .select("*")\
+                .eq("video_id", video_id)\
+                .gt("id", last_id)\
+                .order("id")\
+                .limit(SUPABASE_PAGE_SIZE)\
+                .execute().data or []
+            rows.extend(page)
+            if len(page) < SUPABASE_PAGE_SIZE:
+                return rows
+            last_id = page[-1]["id"]
+
+    def get_comment_sync_state(self, video_id):
+        latest = self._table(COMMENTS_TABLE)\
+            .select("published_at_comment")\
+            .eq("video_id", video_id)\
+            .not_.is_("published_at_comment", "null")\
+            .order("published_at_comment", desc=True)\
+            .limit(1)\
+            .execute().data or []
+        exists = latest or self._table(COMMENTS_TABLE).select("id").eq("video_id", video_id).limit(1).execute().data
+        return {"has_comments": bool(exists),
+                "last_published_at": latest[0]["published_at_comment"] if latest else None}
+
+    def get_thread_comment_ids(self, video_id, thread_ids):
+        rows = []
+        for i in range(0, len(thread_ids), 200):
+            chunk = thread_ids[i:i + 200]
+            # Comentario principal (comment_id == id del hilo) y respuestas (thread_id)
+            for column in ("comment_id", "thread_id"):
+                response = self._table(COMMENTS_TABLE)\
+                    .select("comment_id, thread_id")\
+                    .eq("video_id", video_id)\
+                    .in_(column, chunk)\
+                    .execute()
+                rows.extend(response.data or [])
+        return rows
+
+    def query_comments(self, video_id=None, columns=None, toxic_only=False, categories=None,
+                       min_probability=None, sentiment_type=None, order_by="id", position=None, limit=500):
+        query = self._table(COMMENTS_TABLE).select(",".join(columns or ["*"]))
+        if video_id:
+            query = query.eq("video_id", video_id)
+        if toxic_only:
+            query = query.eq("is_toxic", True)
+        for category in categories or []:
+            query = query.eq(f"is_{category}", True)
+        if min_probability is not None:
+            # Sobre las categorías pedidas o, si no hay, sobre la probabilidad general "toxic"
+            for category in categories or ["toxic"]:
+                query = query.gte(f"{category}_probability", min_probability)
+        if sentiment_type:
+            query = query.eq("sentiment_type", sentiment_type)
+
+        if order_by == "id":
+            if position:
+                query = query.gt("id", position["id"])
+            query = query.order("id")
+        else:
+            if position:
+                likes, last_id = position["likes"], position["id"]
+                query = query.or_(f"total_likes_comment.lt.{likes},"
+                                  f"and(total_likes_comment.eq.{likes},id.lt.{last_id})")
+            # Sin NULLs desde migrations/011_likes_not_null.sql: mismo orden que SQLite
+            query = query.order("total_likes_comment", desc=True).order("id", desc=True)
+
+        return query.limit(limit).execute().data or []
+
+    def scan_comment_keys(self, after_id, limit, video_id=None):
+        query = self._table(COMMENTS_TABLE)\
+            .select("id, video_id, comment_id, text")\
+            .gt("id", after_id)
+        if video_id:
+            query = query.eq("video_id", video_id)
+        return query.order("id").limit(limit).execute().data or []
+
+    def delete_comments_by_video(self, video_id):
+        return self._table(COMMENTS_TABLE).delete().eq("video_id", video_id).execute().data or []
+
+    def delete_comments_by_ids(self, ids):
+        return self._table(COMMENTS_TABLE).delete().in_("id", ids).execute().data or []
+
+    def upsert_video_statistics(self, record):
+        response = self._table(STATS_TABLE).upsert(record, on_conflict="video_id").execute()
+        return response.data[0] if response.data else None
+
+    def compare_and_set_video_statistics(self, record, version):
+        # migrations/009_atomic_statistics.sql (summary_version)
+        if version is None:
+            try:
+                response = self._table(STATS_TABLE).insert({**record, "summary_version": 1}).execute()
+            except Exception as e:
+                # unique_violation: otro escritor creó la fila entretanto
+                if getattr(e, "code", None) == "23505":
+                    return None
+                raise
+        else:
+            response = self._table(STATS_TABLE).update({**record, "summary_version": version + 1})\
+                .eq("video_id", record["video_id"])\
+                .eq("summary_version", version)\
+                .execute()
+        return response.data[0] if response.data else None
+
+    def get_video_statistics(self, video_id):
+        response = self._table(STATS_TABLE).select("*").eq("video_id", video_id).limit(1).execute()
+        return response.data[0] if response.data else None
+
+    def list_video_statistics(self):
+        return self._table(STATS_TABLE).select("*").execute().data or []
+
+    def delete_video_statistics(self, video_id):
+        self._table(STATS_TABLE).delete().eq("video_id", video_id).execute()
+
+    def get_time_buckets(self, video_id, granularity, start=None, end=None):
+        query = self._table(TIME_BUCKETS_TABLE).select("*")\
+            .eq("video_id", video_id).eq("granularity", granularity)
+        if start:
+            query = query.gte("bucket_start", start)
+        if end:
+            query = query.lt("bucket_start", end)
+        return query.order("bucket_start").execute().data or []
+
+    def upsert_time_buckets(self, rows):
+        # migrations/008_video_time_buckets.sql
+        self._table(TIME_BUCKETS_TABLE).upsert(rows, on_conflict="video_id,granularity,bucket_start").execute()
+
+    def add_time_buckets(self, rows):
+        # migrations/009_atomic_statistics.sql
+        self.client.rpc("add_time_buckets", {"rows": rows}).execute()
+
+    def delete_time_buckets(self, video_id):
+        self._table(TIME_BUCKETS_TABLE).delete().eq("video_id", video_id).execute()
+
+    def global_aggregates(self, top_videos, bins, high_risk_rate):
+        # migrations/004_dashboard_aggregates.sql
+        return self.client.rpc("dashboard_global_aggregates", {
+            "top_videos": top_videos, "bins": bins, "high_risk_rate": high_risk_rate
+        }).execute().data
+
+    def ping(self):
+        response = self._table(COMMENTS_TABLE).select("id").limit(1).execute()
+        return response.data is not None
+
+
+# Esquema de SQLite equivalente al de Supabase (migraciones 001-003 y 006-010 incluidas)
+_SQLITE_COMMENT_COLUMNS = [
+    ("video_id", "TEXT NOT NULL"),
+    ("comment_id", "TEXT"),
+    ("thread_id", "TEXT"),
+    ("parent_comment_id", "TEXT"),
+    ("published_at_comment", "TEXT"),
+    ("text", "TEXT"),
+] + [(f"{category}_probability", "REAL") for category in TOXICITY_CATEGORIES] \
+  + [(f"is_{category}", "INTEGER") for category in TOXICITY_CATEGORIES] + [
+    ("sentiment_type", "TEXT"),
+    ("sentiment_score", "REAL"),
+    ("sentiment_intensity", "TEXT"),
+    ("total_likes_comment", "INTEGER DEFAULT 0"),
+    ("is_self_promotional", "INTEGER"),
+]
+
+_SQLITE_STATS_COLUMNS = [
+    ("video_id", "TEXT NOT NULL UNIQUE"),
+    ("total_comments", "INTEGER"),
+    ("percentage_toxicity", "REAL"),
+    ("mean_likes", "REAL"),
+    ("max_likes", "INTEGER"),
+    ("total_likes", "INTEGER"),
+    ("self_promotional", "INTEGER"),
+    ("mean_sentiment_score", "REAL"),
+    ("sentiment_distribution", "JSON"),
+    ("toxicity_stats", "JSON"),
+    ("toxicity_cooccurrence", "JSON"),
+    ("summary", "JSON"),
+    ("summary_version", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+_SQLITE_TIME_BUCKET_COLUMNS = [
+    ("video_id", "TEXT NOT NULL"),
+    ("granularity", "TEXT NOT NULL"),
+    ("bucket_start", "TEXT NOT NULL"),      # ISO UTC "YYYY-MM-DDTHH:00:00Z": ordena como texto
+    ("comments", "INTEGER NOT NULL DEFAULT 0"),
+    ("toxic", "INTEGER NOT NULL DEFAULT 0"),
+    ("likes", "INTEGER NOT NULL DEFAULT 0"),
+    ("sentiment_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("sentiment_sum", "REAL NOT NULL DEFAULT 0"),
+]
+
+_SQLITE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {COMMENTS_TABLE} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    {", ".join(f"{name} {kind}" for name, kind in _SQLITE_COMMENT_COLUMNS)}
+);
+CREATE UNIQUE INDEX IF NOT EXISTS sentiment_analyzer_video_comment_uidx
+    ON {COMMENTS_TABLE} (video_id, comment_id);
+CREATE INDEX IF NOT EXISTS sentiment_analyzer_video_published_idx
+    ON {COMMENTS_TABLE} (video_id, published_at_comment DESC);
+CREATE INDEX IF NOT EXISTS sentiment_analyzer_video_id_id_idx
+    ON {COMMENTS_TABLE} (video_id, id);
+CREATE INDEX IF NOT EXISTS sentiment_analyzer_video_thread_idx
+    ON {COMMENTS_TABLE} (video_id, thread_id);
+CREATE INDEX IF NOT EXISTS sentiment_analyzer_likes_id_idx
+    ON {COMMENTS_TABLE} (total_likes_comment DESC, id DESC);
+CREATE INDEX IF NOT EXISTS sentiment_analyzer_video_likes_id_idx
+    ON {COMMENTS_TABLE} (video_id, total_likes_comment DESC, id DESC);
+CREATE INDEX IF NOT EXISTS sentiment_analyzer_toxic_id_idx
+    ON {COMMENTS_TABLE} (id) WHERE is_toxic;
+CREATE INDEX IF NOT EXISTS sentiment_analyzer_toxic_probability_idx
+    ON {COMMENTS_TABLE} (toxic_probability);
+CREATE INDEX IF NOT EXISTS sentiment_analyzer_sentiment_id_idx
+    ON {COMMENTS_TABLE} (sentiment_type, id);
+
+CREATE TABLE IF NOT EXISTS {STATS_TABLE} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    updated_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    {", ".join(f"{name} {kind}" for name, kind in _SQLITE_STATS_COLUMNS)}
+);
+
+CREATE TABLE IF NOT EXISTS {TIME_BUCKETS_TABLE} (
+    {", ".join(f"{name} {kind}" for name, kind in _SQLITE_TIME_BUCKET_COLUMNS)},
+    PRIMARY KEY (video_id, granularity, bucket_start)
+);
+"""
+
+_COMMENT_COLUMN_NAMES = {"id", "created_at"} | {name for name, _ in _SQLITE_COMMENT_COLUMNS}
+_STATS_COLUMN_NAMES = {name for name, _ in _SQLITE_STATS_COLUMNS}
+_TIME_BUCKET_COLUMN_NAMES = [name for name, _ in _SQLITE_TIME_BUCKET_COLUMNS]
+# En SQLite el JSON se guarda como texto; se codifica/decodifica aquí para que el
+# resto de la app reciba dicts igual que con las columnas JSONB de Supabase
+_STATS_JSON_COLUMNS = {name for name, kind in _SQLITE_STATS_COLUMNS if kind == "JSON"}
+_ANY_TOXIC_SQL = "(" + " OR ".join(f"COALESCE(is_{c}, 0)" for c in TOXICITY_CATEGORIES) + ")"
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    BD embebida (sqlite3 de la librería estándar). Una sola conexión protegida con un
+    lock: las escrituras en SQLite son de un único escritor, y así ":memory:" también
+    funciona desde varios hilos.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str = "data/sentiment_analyzer.db"):
+        self.path = path
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SQLITE_SCHEMA)
+            self._add_missing_columns(COMMENTS_TABLE, _SQLITE_COMMENT_COLUMNS)
+            self._add_missing_columns(STATS_TABLE, _SQLITE_STATS_COLUMNS)
+            # Ficheros con likes NULL de versiones anteriores (como 011_likes_not_null.sql)
+            self._conn.execute(f"UPDATE {COMMENTS_TABLE} SET total_likes_comment = 0 "
+                               "WHERE total_likes_comment IS NULL")
+
+    def _add_missing_columns(self, table: str, columns):
+        # Ficheros creados con un esquema anterior: CREATE TABLE IF NOT EXISTS no añade columnas
+        existing = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+        for name, kind in columns:
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {kind}")
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        data = dict(row)
+        for key, value in data.items():
+            # SQLite guarda los booleanos como 0/1
+            if key.startswith("is_") and value is not None:
+                data[key] = bool(value)
+        return data
+
+    def _fetch(self, sql: str, params=()) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [self._to_dict(row) for row in self._conn.execute(sql, params).fetchall()]
+
+    @staticmethod
+    def _stats_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        data = dict(row)
+        for key in _STATS_JSON_COLUMNS:
+            if isinstance(data.get(key), str):
+                data[key] = json.loads(data[key])
+        return data
+
+    @staticmethod
+    def _columns(columns: Optional[List[str]], allowed) -> str:
+        if not columns or columns == ["*"]:
+            return "*"
+        unknown = [c for c in columns if c not in allowed]
+        if unknown:
+            raise ValueError(f"Columnas desconocidas: {', '.join(unknown)}")
+        return ", ".join(columns)
+
+    @staticmethod
+    def _check_row(row: Dict[str, Any], allowed):
+        unknown = [c for c in row if c not in allowed]
+        if unknown:
+            raise ValueError(f"Columnas desconocidas: {', '.join(unknown)}")
+
+    def insert_comment(self, row):
+        self._check_row(row, _COMMENT_COLUMN_NAMES)
+        columns = list(row)
+        sql = f"INSERT INTO {COMMENTS_TABLE} ({', '.join(columns)}) " \
+              f"VALUES ({', '.join('?' for _ in columns)}) RETURNING *"
+        with self._lock, self._conn:
+            result = self._conn.execute(sql, [row[c] for c in columns]).fetchone()
+        return self._to_dict(result) if result else None
+
+    def _upsert_rows(self, rows) -> List[Dict[str, Any]]:
+        # Dentro de una transacción ya abierta y con self._lock tomado
+        saved = []
+        for row in rows:
+            self._check_row(row, _COMMENT_COLUMN_NAMES)
+            columns = list(row)
+            updates = [c for c in columns if c not in ("video_id", "comment_id")]
+            sql = f"INSERT INTO {COMMENTS_TABLE} ({', '.join(columns)}) " \
+                  f"VALUES ({', '.join('?' for _ in columns)}) " \
+                  f"ON CONFLICT (video_id, comment_id) DO " + \
+                  (f"UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in updates)}" if updates else "NOTHING") + \
+                  " RETURNING *"
+            result = self._conn.execute(sql, [row[c] for c in columns]).fetchone()
+            if result:
+                saved.append(self._to_dict(result))
+        return saved
+
+    def upsert_comments(self, rows):
+        with self._lock, self._conn:
+            return self._upsert_rows(rows)
+
+    def upsert_comments_returning_previous(self, rows):
+        ids_by_video: Dict[str, List[str]] = {}
+        for row in rows:
+            if row.get("comment_id"):
+                ids_by_video.setdefault(row["video_id"], []).append(row["comment_id"])
+        with self._lock, self._conn:
+            # BEGIN IMMEDIATE: lectura y UPSERT en una sola transacción de escritura, también
+            # frente a otros procesos que abran el mismo fichero
+            self._conn.execute("BEGIN IMMEDIATE")
+            previous = []
+            for video_id, comment_ids in ids_by_video.items():
+                for i in range(0, len(comment_ids), 500):
+                    chunk = comment_ids[i:i + 500]
+                    previous += [self._to_dict(row) for row in self._conn.execute(
+                        f"SELECT * FROM {COMMENTS_TABLE} "
+                        f"WHERE video_id = ? AND comment_id IN ({', '.join('?' for _ in chunk)})",
+                        [video_id, *chunk],
+                    )]
+            return self._upsert_rows(rows), previous
+
+    def get_comment_scores(self, video_id, comment_ids, columns):
+        select = self._columns(columns, _COMMENT_COLUMN_NAMES)
+        rows = []
+        # SQLite limita el número de parámetros por consulta
+        for i in range(0, len(comment_ids), 500):
+            chunk = comment_ids[i:i + 500]
+            rows += self._fetch(
+                f"SELECT {select} FROM {COMMENTS_TABLE} "
+                f"WHERE video_id = ? AND comment_id IN ({', '.join('?' for _ in chunk)})",
+                [video_id, *chunk],
+            )
+        return rows
+
+    def get_comments_by_video(self, video_id):
+        return self._fetch(f"SELECT * FROM {COMMENTS_TABLE} WHERE video_id = ? ORDER BY id", (video_id,))
+
+    def get_comment_sync_state(self, video_id):
+        # Ambas subconsultas usan el índice (video_id, published_at_comment DESC)
+        row = self._fetch(
+            f"SELECT EXISTS (SELECT 1 FROM {COMMENTS_TABLE} WHERE video_id = ?) AS has_comments, "
+            f"(SELECT MAX(published_at_comment) FROM {COMMENTS_TABLE} WHERE video_id = ?) AS last_published_at",
+            (video_id, video_id),
+        )[0]
+        return {"has_comments": bool(row["has_comments"]), "last_published_at": row["last_published_at"]}
+
+    def get_thread_comment_ids(self, video_id, thread_ids):
+        rows = []
+        for i in range(0, len(thread_ids), 500):
+            chunk = thread_ids[i:i + 500]
+            marks = ", ".join("?" for _ in chunk)
+            rows += self._fetch(
+                f"SELECT comment_id, thread_id FROM {COMMENTS_TABLE} "
+                f"WHERE video_id = ? AND (comment_id IN ({marks}) OR thread_id IN ({marks}))",
+                [video_id, *chunk, *chunk],
+            )
+        return rows
+
+    def query_comments(self, video_id=None, columns=None, toxic_only=False, categories=None,
+                       min_probability=None, sentiment_type=None, order_by="id", position=None, limit=500):
+        where, params = [], []
+        if video_id:
+            where.append("video_id = ?")
+            params.append(video_id)
+        if toxic_only:
+            where.append("is_toxic = 1")
+        for category in categories or []:
+            if category not in TOXICITY_CATEGORIES:
+                raise ValueError(f"Categoría desconocida: {category}")
+            where.append(f"is_{category} = 1")
+        if min_probability is not None:
+            for category in categories or ["toxic"]:
+                where.append(f"{category}_probability >= ?")
+                params.append(min_probability)
+        if sentiment_type:
+            where.append("sentiment_type = ?")
+            params.append(sentiment_type)
+
+        if order_by == "id":
+            if position:
+                where.append("id > ?")
+                params.append(position["id"])
+            order = "id"
+        else:
+            # Sin NULLs (se escriben como 0): mismo orden que Supabase, y usa el índice de likes
+            if position:
+                where.append("(total_likes_comment < ? OR (total_likes_comment = ? AND id < ?))")
+                params += [position["likes"], position["likes"], position["id"]]
+            order = "total_likes_comment DESC, id DESC"
+
+        sql = f"SELECT {self._columns(columns, _COMMENT_COLUMN_NAMES)} FROM {COMMENTS_TABLE}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order} LIMIT ?"
+        return self._fetch(sql, [*params, limit])
+
+    def scan_comment_keys(self, after_id, limit, video_id=None):
+        sql = f"SELECT id, video_id, comment_id, text FROM {COMMENTS_TABLE} WHERE id > ?"
+        params: List[Any] = [after_id]
+        if video_id:
+            sql += " AND video_id = ?"
+            params.append(video_id)
+        return self._fetch(sql + " ORDER BY id LIMIT ?", [*params, limit])
+
+    def delete_comments_by_video(self, video_id):
+        with self._lock, self._conn:
+            rows = self._conn.execute(f"DELETE FROM {COMMENTS_TABLE} WHERE video_id = ? RETURNING *",
+                                      (video_id,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def delete_comments_by_ids(self, ids):
+        deleted = []
+        with self._lock, self._conn:
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                deleted += self._conn.execute(
+                    f"DELETE FROM {COMMENTS_TABLE} WHERE id IN ({', '.join('?' for _ in chunk)}) RETURNING *", chunk
+                ).fetchall()
+        return [self._to_dict(row) for row in deleted]
+
+    def upsert_video_statistics(self, record):
+        self._check_row(record, _STATS_COLUMN_NAMES)
+        columns = list(record)
+        values = [json.dumps(record[c]) if c in _STATS_JSON_COLUMNS and record[c] is not None else record[c]
+                  for c in columns]
+        updates = [f"{c} = excluded.{c}" for c in columns if c != "video_id"]
+        updates.append("updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')")
+        sql = f"INSERT INTO {STATS_TABLE} ({', '.join(columns)}) " \
+              f"VALUES ({', '.join('?' for _ in columns)}) " \
+              f"ON CONFLICT (video_id) DO UPDATE SET {', '.join(updates)} RETURNING *"
+        with self._lock, self._conn:
+            result = self._conn.execute(sql, values).fetchone()
+        return self._stats_to_dict(result) if result else None
+
+    def compare_and_set_video_statistics(self, record, version):
+        self._check_row(record, _STATS_COLUMN_NAMES)
+        columns = [c for c in record if c != "summary_version"]
+        values = [json.dumps(record[c]) if c in _STATS_JSON_COLUMNS and record[c] is not None else record[c]
+                  for c in columns]
+        if version is None:
+            sql = f"INSERT INTO {STATS_TABLE} ({', '.join(columns)}, summary_version) " \
+                  f"VALUES ({', '.join('?' for _ in columns)}, 1) " \
+                  f"ON CONFLICT (video_id) DO NOTHING RETURNING *"
+            params = values
+        else:
+            updates = [f"{c} = ?" for c in columns if c != "video_id"]
+            updates += ["summary_version = summary_version + 1",
+                        "updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"]
+            sql = f"UPDATE {STATS_TABLE} SET {', '.join(updates)} " \
+                  f"WHERE video_id = ? AND summary_version = ? RETURNING *"
+            params = [v for c, v in zip(columns, values) if c != "video_id"] + [record["video_id"], version]
+        with self._lock, self._conn:
+            result = self._conn.execute(sql, params).fetchone()
+        return self._stats_to_dict(result) if result else None
+
+    def get_video_statistics(self, video_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT * FROM {STATS_TABLE} WHERE video_id = ?", (video_id,)).fetchone()
+        return self._stats_to_dict(row) if row else None
+
+    def list_video_statistics(self):
+        with self._lock:
+            rows = self._conn.execute(f"SELECT * FROM {STATS_TABLE} ORDER BY id").fetchall()
+        return [self._stats_to_dict(row) for row in rows]
+
+    def delete_video_statistics(self, video_id):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {STATS_TABLE} WHERE video_id = ?", (video_id,))
+
+    def get_time_buckets(self, video_id, granularity, start=None, end=None):
+        sql = f"SELECT * FROM {TIME_BUCKETS_TABLE} WHERE video_id = ? AND granularity = ?"
+        params: List[Any] = [video_id, granularity]
+        if start:
+            sql += " AND bucket_start >= ?"
+            params.append(start)
+        if end:
+            sql += " AND bucket_start < ?"
+            params.append(end)
+        return self._fetch(sql + " ORDER BY bucket_start", params)
+
+    def upsert_time_buckets(self, rows):
+        columns = _TIME_BUCKET_COLUMN_NAMES
+        updates = ", ".join(f"{c} = excluded.{c}" for c in columns[3:])
+        sql = f"INSERT INTO {TIME_BUCKETS_TABLE} ({', '.join(columns)}) " \
+              f"VALUES ({', '.join('?' for _ in columns)}) " \
+              f"ON CONFLICT (video_id, granularity, bucket_start) DO UPDATE SET {updates}"
+        with self._lock, self._conn:
+            self._conn.executemany(sql, [[row.get(c, 0) for c in columns] for row in rows])
+
+    def add_time_buckets(self, rows):
+        columns = _TIME_BUCKET_COLUMN_NAMES
+        counters = columns[3:]
+        updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in counters)
+        sql = f"INSERT INTO {TIME_BUCKETS_TABLE} ({', '.join(columns)}) " \
+              f"VALUES ({', '.join('?' for _ in columns)}) " \
+              f"ON CONFLICT (video_id, granularity, bucket_start) DO UPDATE SET {updates}"
+        emptied = f"UPDATE {TIME_BUCKETS_TABLE} SET {', '.join(f'{c} = 0' for c in counters)} " \
+                  f"WHERE video_id = ? AND granularity = ? AND bucket_start = ? AND comments <= 0"
+        with self._lock, self._conn:
+            self._conn.executemany(sql, [[row.get(c, 0) for c in columns] for row in rows])
+            self._conn.executemany(emptied, [[row[c] for c in columns[:3]] for row in rows])
+
+    def delete_time_buckets(self, video_id):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {TIME_BUCKETS_TABLE} WHERE video_id = ?", (video_id,))
+
+    def global_aggregates(self, top_videos, bins, high_risk_rate):
+        # Misma salida que dashboard_global_aggregates (004_dashboard_aggregates.sql)
+        def scalar(sql, params=()):
+            with self._lock:
+                return self._conn.execute(sql, params).fetchone()[0]
+
+        raw: Dict[str, Any] = {
+            "total_comments": scalar(f"SELECT COUNT(*) FROM {COMMENTS_TABLE}"),
+            "toxic_count": scalar(f"SELECT COUNT(*) FROM {COMMENTS_TABLE} WHERE {_ANY_TOXIC_SQL}"),
+        }
+
+        sums = ", ".join(f"COALESCE(SUM(is_{c}), 0)" for c in TOXICITY_CATEGORIES)
+        with self._lock:
+            counts = self._conn.execute(f"SELECT {sums} FROM {COMMENTS_TABLE}").fetchone()
+        raw["category_counts"] = dict(zip(TOXICITY_CATEGORIES, counts))
+
+        raw["engagement"] = {
+            row["category"]: {"count": row["n"], "likes": row["likes"]}
+            for row in self._fetch(
+                f"SELECT CASE WHEN {_ANY_TOXIC_SQL} THEN 'toxic' ELSE 'clean' END AS category, "
+                f"COUNT(*) AS n, SUM(COALESCE(total_likes_comment, 0)) AS likes "
+                f"FROM {COMMENTS_TABLE} GROUP BY 1"
+            )
+        }
+
+        per_video = f"""
+            SELECT video_id, COUNT(*) AS total_comments,
+                   SUM({_ANY_TOXIC_SQL}) AS toxic_count,
+                   ROUND(100.0 * SUM({_ANY_TOXIC_SQL}) / COUNT(*), 1) AS toxic_rate
+            FROM {COMMENTS_TABLE} GROUP BY video_id
+        """
+        raw["total_videos"] = scalar(f"SELECT COUNT(*) FROM ({per_video})")
+        raw["high_risk_videos"] = scalar(f"SELECT COUNT(*) FROM ({per_video}) WHERE toxic_rate > ?",
+                                         (high_risk_rate,))
+        raw["videos"] = self._fetch(f"{per_video} ORDER BY toxic_rate DESC LIMIT ?", (top_videos,))
+
+        for key, column, low, high in (("toxic_probability_bins", "toxic_probability", 0.0, 1.0),
+                                       ("sentiment_score_bins", "sentiment_score", -1.0, 1.0)):
+            bucket = f"MAX(MIN(CAST(({column} - ?) / ? * ? AS INTEGER) + 1, ?), 1)"
+            rows = self._fetch(
+                f"SELECT {bucket} AS b, COUNT(*) AS n FROM {COMMENTS_TABLE} "
+                f"WHERE {column} IS NOT NULL GROUP BY 1",
+                (low, high - low, bins, bins),
+            )
+            raw[key] = {str(row["b"]): row["n"] for row in rows}
+        return raw
+
+    def ping(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1").fetchone()[0] == 1
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_storage: Optional[StorageBackend] = None
+_storage_lock = threading.Lock()
+
+
+def storage_from_env() -> StorageBackend:
+    backend = os.getenv("STORAGE_BACKEND", "").lower()
+    if backend != "sqlite":
+        # Con STORAGE_BACKEND=sqlite no hace falta ni el paquete supabase
+        from server.database import connection_db
+        if not backend:
+            backend = "supabase" if connection_db.supabase is not None else "sqlite"
+
+    if backend == "supabase":
+        if connection_db.supabase is None:
+            raise RuntimeError("STORAGE_BACKEND=supabase requiere SUPABASE_URL y SUPABASE_KEY")
+        return SupabaseStorage(connection_db.supabase)
+    if backend == "sqlite":
+        path = os.getenv("SQLITE_PATH", "data/sentiment_analyzer.db")
+        logger.info(f"💾 Usando almacenamiento SQLite local: {path}")
+        return SQLiteStorage(path)
+    raise ValueError(f"STORAGE_BACKEND desconocido: {backend} (usa 'supabase' o 'sqlite')")
+
+
+def get_storage() -> StorageBackend:
+    """
+    Backend del proceso, creado en el primer uso
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = storage_from_env()
+    return _storage
+
+
+def set_storage(backend: Optional[StorageBackend]):
+    """
+    Sustituye el backend (tests, scripts). None vuelve a leerlo del entorno en el próximo uso
+    """
+    global _storage
+    with _storage_lock:
+        _storage = backend
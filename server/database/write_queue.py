@@ -0,0 +1,215 @@
+import os
+import time
+import atexit
+import threading
+from typing import Any, Dict, List, Optional
+
+from server.schemas import Comment
+from server.records import ScoredComments
+from server.database.save_comments import write_comments, to_db_rows, rebuild_video_statistics, COMMENT_WRITE_WORKERS
+from server.outils.logging_config import get_logger
+
+# Cola write-behind de la app: predict_pipeline encola comentarios y responde
+# sin esperar a la BD. Un único hilo agrupa lo encolado por muchas peticiones en escrituras
+# grandes, reintenta con backoff exponencial y se vacía al apagar el servidor.
+# Cada lote de comentarios suma su resumen a video_statistics al escribirse (fold_statistics):
+# no hay escrituras de estadísticas aparte que puedan pisar el resumen sumado.
+
+WRITE_QUEUE_BATCH_SIZE = int(os.getenv("WRITE_QUEUE_BATCH_SIZE", "2000"))
+WRITE_QUEUE_FLUSH_INTERVAL = float(os.getenv("WRITE_QUEUE_FLUSH_INTERVAL", "0.5"))
+WRITE_QUEUE_RETRIES = int(os.getenv("WRITE_QUEUE_RETRIES", "5"))
+# Comentarios pendientes a partir de los cuales encolar bloquea (backpressure)
+WRITE_QUEUE_MAX_PENDING = int(os.getenv("WRITE_QUEUE_MAX_PENDING", "100000"))
+
+logger = get_logger(__name__)
+
+
+class WriteBehindQueue:
+    def __init__(self, batch_size: int = WRITE_QUEUE_BATCH_SIZE,
+                 flush_interval: float = WRITE_QUEUE_FLUSH_INTERVAL,
+                 max_retries: int = WRITE_QUEUE_RETRIES,
+                 max_pending: int = WRITE_QUEUE_MAX_PENDING,
+                 backoff: float = 0.5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.max_pending = max_pending
+        self.backoff = backoff
+
+        self._comments: List[Dict[str, Any]] = []
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._draining = False
+
+        self.written_comments = 0
+        self.failed_comments = 0
+        # Vídeos con estadísticas desfasadas que ni recalculándolas se pudieron arreglar
+        self.failed_statistics = 0
+        self.retries = 0
+        self.last_error: Optional[str] = None
+
+    # --- Productores ---
+    def enqueue_comments(self, comments: ScoredComments | List[Comment | Dict[str, Any]]):
+        if not len(comments):
+            return
+        # En la cola solo hay filas de BD ya validadas: el hilo escritor no re-valida
+        rows = to_db_rows(comments)
+        with self._cond:
+            while len(self._comments) >= self.max_pending and not self._stopping:
+                self._cond.wait(timeout=1)
+            self._comments.extend(rows)
+            self._cond.notify_all()
+        self.start()
+
+    # --- Ciclo de vida ---
+    def start(self):
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Espera a que todo lo encolado hasta ahora esté escrito (o descartado tras los reintentos)
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._comments or self._in_flight:
+                if self._thread is None or not self._thread.is_alive():
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining if remaining is not None else 1)
+            return not (self._comments or self._in_flight)
+
+    def stop(self, timeout: Optional[float] = 30):
+        """
+        Vacía la cola y detiene el hilo (apagado del servidor)
+        """
+        # Vaciado final sin pools de hilos: en atexit ya no se pueden crear
+        self._draining = True
+        pending = self.pending
+        if pending:
+            logger.info(f"💾 Vaciando cola de escritura: {pending} elementos pendientes...")
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if not flushed:
+            logger.warning(f"⚠️ Cola de escritura detenida con {self.pending} elementos sin guardar")
+
+    # --- Consumidor ---
+    def _take_batch(self):
+        with self._cond:
+            # Espera a tener un lote lleno o a que pase flush_interval desde el primer elemento
+            while not self._comments and not self._stopping:
+                self._cond.wait()
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._comments) < self.batch_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(timeout=remaining)
+            comments = self._comments[:self.batch_size]
+            del self._comments[:self.batch_size]
+            self._in_flight = len(comments)
+            self._cond.notify_all()
+            return comments
+
+    def _run(self):
+        while True:
+            comments = self._take_batch()
+            if not comments:
+                if self._stopping:
+                    return
+                continue
+            try:
+                self._write_comments(comments)
+            finally:
+                with self._cond:
+                    self._in_flight = 0
+                    self._cond.notify_all()
+
+    def _retry_wait(self, attempt: int, what: str, error: Any):
+        wait = self.backoff * 2 ** (attempt - 1)
+        self.retries += 1
+        self.last_error = str(error)
+        logger.warning(f"⚠️ Cola de escritura: {what} falló ({error}), reintento {attempt}/{self.max_retries} en {wait}s")
+        time.sleep(wait)
+
+    def _write_comments(self, comments: List[Dict[str, Any]]):
+        attempt = 0
+        # Vídeos cuyo resumen no se actualizó al escribir: un reintento no lo arregla (sus
+        # comentarios ya no cambian), se recalculan al final
+        stale = set()
+        while True:
+            try:
+                report = write_comments(comments, max_workers=1 if self._draining else COMMENT_WRITE_WORKERS,
+                                        validate=False, fold_statistics=True)
+                stale.update(report.stale_statistics)
+                self.written_comments += report.rows_written
+                if not report.failed_chunks:
+                    break
+                # Se reintenta el lote entero: lo ya guardado se descarta como "sin cambios"
+                error = f"{report.failed_chunks}/{report.chunks} trozos fallidos"
+                failed = len(report.failed_rows)
+            except Exception as e:
+                error, failed = e, len(comments)
+            if attempt >= self.max_retries:
+                self.failed_comments += failed
+                self.last_error = str(error)
+                logger.error(f"❌ Cola de escritura: {failed} comentarios descartados tras {self.max_retries} reintentos")
+                break
+            attempt += 1
+            self._retry_wait(attempt, f"lote de {len(comments)} comentarios", error)
+        if stale:
+            self._rebuild_statistics(sorted(stale))
+
+    def _rebuild_statistics(self, video_ids: List[str]):
+        attempt = 0
+        while True:
+            video_ids = [video_id for video_id in video_ids if rebuild_video_statistics(video_id) is None]
+            if not video_ids:
+                return
+            if attempt >= self.max_retries:
+                self.failed_statistics += len(video_ids)
+                self.last_error = f"estadísticas desfasadas: {', '.join(video_ids)}"
+                logger.error(f"❌ Cola de escritura: estadísticas desfasadas de {', '.join(video_ids)} tras "
+                             f"{self.max_retries} reintentos (python -m server.database.backfill_statistics --video-id ...)")
+                return
+            attempt += 1
+            self._retry_wait(attempt, f"recálculo de estadísticas de {len(video_ids)} vídeos", "fold fallido")
+
+    # --- Observabilidad ---
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._comments) + self._in_flight
+
+    def info(self) -> Dict[str, Any]:
+        with self._cond:
+            pending_comments = len(self._comments)
+            in_flight = self._in_flight
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "pending_comments": pending_comments,
+            "in_flight": in_flight,
+            "written_comments": self.written_comments,
+            "failed_comments": self.failed_comments,
+            "failed_statistics": self.failed_statistics,
+            "retries": self.retries,
+            "last_error": self.last_error,
+        }
+
+
+write_queue = WriteBehindQueue()
+# Scripts y CLIs sin evento de apagado de FastAPI también vacían la cola al salir
+atexit.register(write_queue.stop)
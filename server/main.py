@@ -1,14 +1,73 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from server.schemas import VideoRequest, Comment, PredictionResponse  
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from server.schemas import VideoRequest, BulkRequest, Comment, PredictionResponse  
 from etl.youtube_extraction import extract_video_id, fetch_comment_threads 
-from server.outils.prediction_pipeline import predict_pipeline
-from server.database.connection_db import supabase 
-from server.database.save_comments import get_comments_by_video, delete_comments_by_video, get_video_statistics
-from typing import List
-import json 
+import etl.youtube_extraction as youtube_extraction
+from server.outils.prediction_pipeline import analyze_video_async, _persist_stage
+from server.outils.executors import run_cpu, run_io, shutdown_executors
+from server.outils.bulk_analysis import expand_targets, start_bulk_job, get_bulk_job
+from server.outils.analysis_cache import analysis_cache
+from server.outils.admission import admission, AdmissionRejected
+from server.outils.analysis_jobs import submit_analysis_job, get_analysis_job, stream_job_events
+from server.outils.text_scoring import parse_score_payload, stream_scores, SCORE_MAX_TEXTS
+from server.outils.compact_response import encode_prediction, parse_response_fields
+from server.outils.estimation import ESTIMATE_ERROR_BOUND
+from server.database.storage import get_storage
+from server.database.save_comments import delete_comments_by_video, get_video_statistics
+from server.database.save_comments import get_comments_page, parse_fields, COMMENTS_PAGE_MAX
+from server.database.aggregates import get_global_aggregates
+from server.database.save_comments import get_all_video_statistics
+from server.database.save_comments import get_summary_statistics, delete_comments, rebuild_video_statistics
+from server.database.save_comments import get_distribution, get_timeline
+from server.database.stats_cache import stats_cache
+from server.database.write_queue import write_queue
+from server.outils.fast_json import FastJSONResponse
+from server.outils.metrics import registry, cache_collector, render_metrics
+from server.outils.logging_config import get_logger
+from server.outils.profiling import PROFILING_ENABLED, profile_trigger, profile_request, active_session, is_admin, profile_store
+from typing import List, Optional
+from dataclasses import replace
+from contextlib import asynccontextmanager
+import time
 
-app = FastAPI()
+logger = get_logger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Al parar el servidor: no perder los comentarios aún pendientes de guardar
+    await run_in_threadpool(write_queue.stop)
+    shutdown_executors()
+
+app = FastAPI(lifespan=lifespan)
+
+# Contadores que ya llevan las cachés y la cola de escritura, leídos en cada GET /metrics
+registry.add_collector(cache_collector({
+    "analysis": lambda: analysis_cache,
+    "video_statistics": lambda: stats_cache,
+    # configure_cache puede sustituir la caché de YouTube en caliente
+    "youtube": lambda: youtube_extraction.response_cache,
+}))
+registry.add_collector(lambda: [
+    ("sentiment_analyzer_write_queue_pending", "gauge", "Elementos pendientes en la cola write-behind",
+     [({}, write_queue.pending)]),
+    ("sentiment_analyzer_write_queue_failed_total", "counter", "Comentarios descartados por la cola write-behind",
+     [({}, write_queue.failed_comments)]),
+])
+
+# Rutas async: el análisis corre en los pools de server/outils/executors.py y las lecturas
+# de BD en el threadpool de la app, que ya no queda ocupado por los análisis largos
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request, exc: AdmissionRejected):
+    # 429 / 503 con Retry-After: el cliente sabe cuándo reintentar en lugar de martillear
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,52 +77,113 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Perfilado bajo demanda de /api/CommentAnalyzer/ (X-Profile o ?profile= con el token de admin,
+# o PROFILE_SAMPLE_RATE). Sin configurar no se registra el middleware
+async def profile_analyzer_requests(request: Request, call_next):
+    if request.method != "POST" or not request.url.path.startswith("/api/CommentAnalyzer/"):
+        return await call_next(request)
+    trigger = profile_trigger(request.headers.get("x-profile"), request.query_params.get("profile"))
+    if trigger is None:
+        return await call_next(request)
+    with profile_request(trigger, f"{request.method} {request.url.path}") as session:
+        response = await call_next(request)
+    # Se guarda el código de estado, no la query: ?profile= lleva el token
+    await run_io(profile_store.save, session, {"status_code": response.status_code})
+    response.headers["X-Profile-Id"] = session.profile_id
+    return response
+
+if PROFILING_ENABLED:
+    app.middleware("http")(profile_analyzer_requests)
+
+def _require_admin(request: Request):
+    if not is_admin(request.headers.get("x-admin-token")):
+        raise HTTPException(status_code=403, detail="Token de administración no válido")
+
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Welcome to the FastAPI server!"}
 
 @app.get("/api/")
-def api_health():
-    return {"status": "ok"}
+async def api_health():
+    return {"status": "ok", "storage": get_storage().name}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Formato de texto de Prometheus: latencia por etapa, comentarios procesados, errores, cachés
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
-@app.get("/api/sentiment-analyzer/all")
-def get_all_sentiment_analyzer():
-    # Recupera TODOS los comentarios analizados de la tabla sentiment_analyzer
+def _comments_page(video_id, cursor, limit, fields, toxic_only, category, min_probability, sentiment_type, order_by):
+    try:
+        return get_comments_page(
+            video_id=video_id,
+            cursor=cursor,
+            limit=limit,
+            fields=parse_fields(fields),
+            toxic_only=toxic_only,
+            categories=category,
+            min_probability=min_probability,
+            sentiment_type=sentiment_type,
+            order_by=order_by,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/sentiment-analyzer/all", response_class=FastJSONResponse)
+async def get_all_sentiment_analyzer(
+    cursor: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=COMMENTS_PAGE_MAX),
+    fields: Optional[str] = Query(None, description="Columnas separadas por comas, p. ej. text,toxic_probability"),
+    toxic_only: bool = False,
+    category: Optional[List[str]] = Query(None, description="Solo comentarios con is_<category> = true"),
+    min_probability: Optional[float] = Query(None, ge=0, le=1),
+    sentiment_type: Optional[str] = None,
+    order_by: str = Query("id", pattern="^(id|likes)$"),
+):
+    # Recupera los comentarios analizados de sentiment_analyzer por páginas (cursor keyset)
 
     try:
-        print("🔍 Recuperando todos los comentarios de sentiment_analyzer...")
-        response = supabase.table("sentiment_analyzer").select("*").execute()
+        logger.debug("🔍 Recuperando página de comentarios de sentiment_analyzer...")
+        page = await run_in_threadpool(_comments_page, None, cursor, limit, fields, toxic_only, category, min_probability, sentiment_type, order_by)
         
-        if response.data:
-            return {
-                "total_comments": len(response.data),
-                "comments": response.data,
-                "source": "sentiment_analyzer_table"
-            }
-        else:
-            return {
-                "total_comments": 0,
-                "comments": [],
-                "message": "No hay comentarios en la tabla sentiment_analyzer"
-            }
+        return FastJSONResponse({
+            "total_comments": len(page["comments"]),
+            "comments": page["comments"],
+            "next_cursor": page["next_cursor"],
+            "source": "sentiment_analyzer_table"
+        })
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error recuperando comentarios: {str(e)}")
 
-@app.get("/api/sentiment-analyzer/video/{video_id}")
-def get_sentiment_analyzer_by_video_id(video_id: str):
-     # Recupera comentarios de sentiment_analyzer por video_id específico
+@app.get("/api/sentiment-analyzer/video/{video_id}", response_class=FastJSONResponse)
+async def get_sentiment_analyzer_by_video_id(
+    video_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=COMMENTS_PAGE_MAX),
+    fields: Optional[str] = None,
+    toxic_only: bool = False,
+    category: Optional[List[str]] = Query(None),
+    min_probability: Optional[float] = Query(None, ge=0, le=1),
+    sentiment_type: Optional[str] = None,
+    order_by: str = Query("id", pattern="^(id|likes)$"),
+):
+     # Recupera comentarios de sentiment_analyzer por video_id específico, por páginas
    
     try:
-        print(f"🔍 Recuperando comentarios de sentiment_analyzer para video: {video_id}")
-        comments = get_comments_by_video(video_id)
+        logger.debug(f"🔍 Recuperando comentarios de sentiment_analyzer para video: {video_id}")
+        page = await run_in_threadpool(_comments_page, video_id, cursor, limit, fields, toxic_only, category, min_probability, sentiment_type, order_by)
+        comments = page["comments"]
+        filtered = toxic_only or category or min_probability is not None or sentiment_type
         
-        if comments:
-            return {
+        if comments or cursor or filtered:
+            return FastJSONResponse({
                 "video_id": video_id,
                 "total_comments": len(comments),
                 "comments": comments,
+                "next_cursor": page["next_cursor"],
                 "source": "sentiment_analyzer_table"
-            }
+            })
         else:
             raise HTTPException(
                 status_code=404, 
@@ -74,54 +194,108 @@ def get_sentiment_analyzer_by_video_id(video_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error recuperando comentarios: {str(e)}")
 
-@app.get("/api/video-statistics/all")
-def get_all_video_statistics():
-    # Recupera TODAS las estadísticas de videos de la tabla video_statistics
+@app.get("/api/aggregates/global", response_class=FastJSONResponse)
+async def get_global_aggregates_endpoint(
+    top_videos: int = Query(10, ge=1, le=100),
+    bins: int = Query(10, ge=2, le=50),
+    high_risk_rate: float = Query(15.0, ge=0, le=100),
+):
+    # Datasets ya agregados para el dashboard global (no se descargan comentarios)
     try:
-        print("📊 Recuperando todas las estadísticas de video_statistics...")
-        response = supabase.table("video_statistics").select("*").execute()
+        aggregates = await run_in_threadpool(get_global_aggregates, top_videos=top_videos, bins=bins,
+                                             high_risk_rate=high_risk_rate)
+        return FastJSONResponse(aggregates)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error calculando agregados: {str(e)}")
+
+@app.get("/api/video-statistics/all", response_class=FastJSONResponse)
+async def get_all_video_statistics_endpoint():
+    # Recupera TODAS las estadísticas de videos de la tabla video_statistics (snapshot cacheado)
+    # CPU de JSON por petición: python -m server.outils.fast_json
+    try:
+        parsed_stats = await run_in_threadpool(get_all_video_statistics)
         
-        if response.data:
-            # Parsear campos JSON para cada registro
-            parsed_stats = []
-            for stat in response.data:
-                parsed_stat = stat.copy()
-                
-                # Parsear campos JSON
-                if parsed_stat.get("sentiment_distribution"):
-                    parsed_stat["sentiment_distribution"] = json.loads(parsed_stat["sentiment_distribution"])
-                if parsed_stat.get("toxicity_stats"):
-                    parsed_stat["toxicity_stats"] = json.loads(parsed_stat["toxicity_stats"])
-                
-                parsed_stats.append(parsed_stat)
-            
-            return {
+        if parsed_stats:
+            return FastJSONResponse({
                 "total_videos": len(parsed_stats),
                 "video_statistics": parsed_stats,
                 "source": "video_statistics_table"
-            }
+            })
         else:
-            return {
+            return FastJSONResponse({
                 "total_videos": 0,
                 "video_statistics": [],
                 "message": "No hay estadísticas en la tabla video_statistics"
-            }
+            })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error recuperando estadísticas: {str(e)}")
 
-@app.get("/api/video-statistics/video/{video_id}")
-def get_video_statistics_by_video_id(video_id: str):
+@app.get("/api/video-statistics/cache")
+async def get_video_statistics_cache_info():
+    # Aciertos / fallos de la caché de estadísticas
+    return stats_cache.info()
+
+@app.get("/api/video-statistics/summary", response_class=FastJSONResponse)
+async def get_summary_statistics_endpoint(video_ids: Optional[str] = Query(None, description="IDs separados por comas (un canal); sin ellos, todos")):
+    # Estadísticas de varios vídeos sumando sus resúmenes guardados (sin leer comentarios)
+    try:
+        ids = [v.strip() for v in video_ids.split(",") if v.strip()] if video_ids else None
+        summary = await run_in_threadpool(get_summary_statistics, ids)
+        return FastJSONResponse({"video_ids": ids, "statistics": summary, "source": "video_statistics_summaries"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error combinando estadísticas: {str(e)}")
+
+@app.get("/api/video-statistics/distribution", response_class=FastJSONResponse)
+async def get_distribution_endpoint(
+    video_ids: Optional[str] = Query(None, description="IDs separados por comas; sin ellos, todos"),
+    sample_size: Optional[int] = Query(None, ge=1, le=1000),
+):
+    # Bins, cuantiles y muestra para ToxicityDistribution / CorrelationScatter / SentimentPie:
+    # mismo tamaño con 100 o 100.000 comentarios (sketches guardados en video_statistics)
+    try:
+        ids = [v.strip() for v in video_ids.split(",") if v.strip()] if video_ids else None
+        result = await run_in_threadpool(get_distribution, ids, sample_size)
+        return FastJSONResponse({"video_ids": ids, "distribution": result})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error calculando distribuciones: {str(e)}")
+
+@app.post("/api/video-statistics/video/{video_id}/rebuild", response_class=FastJSONResponse)
+async def rebuild_video_statistics_endpoint(video_id: str):
+    # Recalcula el resumen desde todos los comentarios (si una escritura lo dejó desfasado)
+    saved = await run_in_threadpool(rebuild_video_statistics, video_id)
+    if not saved:
+        raise HTTPException(status_code=500, detail="Error al recalcular estadísticas")
+    return FastJSONResponse({"video_id": video_id, "statistics": saved})
+
+@app.get("/api/video-statistics/video/{video_id}/timeline", response_class=FastJSONResponse)
+async def get_video_timeline_endpoint(
+    video_id: str,
+    granularity: str = Query("hour", pattern="^(hour|day)$"),
+    start: Optional[str] = Query(None, description="ISO 8601, incluido"),
+    end: Optional[str] = Query(None, description="ISO 8601, excluido"),
+):
+    # Comentarios, tasa de toxicidad, sentimiento medio y likes por hora / día (video_time_buckets)
+    try:
+        buckets = await run_in_threadpool(get_timeline, video_id, granularity, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Fecha inválida: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error recuperando el timeline: {str(e)}")
+    return FastJSONResponse({"video_id": video_id, "granularity": granularity, "buckets": buckets})
+
+@app.get("/api/video-statistics/video/{video_id}", response_class=FastJSONResponse)
+async def get_video_statistics_by_video_id(video_id: str):
     # Recupera estadísticas de video_statistics por video_id específico
     try:
-        print(f"📊 Recuperando estadísticas de video_statistics para video: {video_id}")
-        saved_stats = get_video_statistics(video_id)
+        logger.debug(f"📊 Recuperando estadísticas de video_statistics para video: {video_id}")
+        saved_stats = await run_in_threadpool(get_video_statistics, video_id)
         
         if saved_stats:
-            return {
+            return FastJSONResponse({
                 "video_id": video_id,
                 "statistics": saved_stats,
                 "source": "video_statistics_table"
-            }
+            })
         else:
             raise HTTPException(
                 status_code=404, 
@@ -133,10 +307,10 @@ def get_video_statistics_by_video_id(video_id: str):
         raise HTTPException(status_code=500, detail=f"Error recuperando estadísticas: {str(e)}")
 
 @app.post("/api/extract-comments/") 
-def extract_comments_endpoint(request: VideoRequest):
+async def extract_comments_endpoint(request: VideoRequest):
     try:
         video_id = extract_video_id(request.url_or_id)
-        comments = fetch_comment_threads(video_id, max_total=request.max_comments)
+        comments = await run_io(fetch_comment_threads, video_id, max_total=request.max_comments)
         return {
             "video_id": video_id,
             "total_comments": len(comments),
@@ -148,25 +322,240 @@ def extract_comments_endpoint(request: VideoRequest):
 
 # Endpoint predicción
 @app.post("/api/CommentAnalyzer/", response_model=PredictionResponse)
-def predict_from_youtube(request: VideoRequest):
-    result = predict_pipeline(request.url_or_id, max_comments=request.max_comments)
-    return result
+async def predict_from_youtube(
+    request: VideoRequest,
+    format: str = Query("json", pattern="^(json|columnar|msgpack|arrow)$", description="json, columnar, msgpack o arrow"),
+    fields: Optional[str] = Query(None, description="Campos de cada comentario, p. ej. text,toxic_probability"),
+    precision: Optional[int] = Query(None, ge=0, le=10, description="Decimales de probabilidades y sentiment_score"),
+):
+    try:
+        comment_fields = parse_response_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Peticiones simultáneas del mismo vídeo comparten un único análisis (y su resultado en caché)
+    video_id = extract_video_id(request.url_or_id)
+    error_bound = request.error_bound or ESTIMATE_ERROR_BOUND
+    # durable no forma parte de la clave: con durable se exige más al mismo análisis (abajo)
+    key = (video_id, request.max_comments, request.incremental, error_bound if request.estimate else None)
+    # También en modo estimación se cobra la población: se descarga entera (y se tiene en
+    # memoria) aunque solo se limpie y puntúe la muestra
+    cost = request.max_comments
+    async def analyze():
+        # Solo el análisis real pasa por el control de admisión, no las peticiones coalescidas
+        async with admission.admit_async(cost, lane="interactive"):
+            return await analyze_video_async(
+                video_id,
+                max_comments=request.max_comments,
+                incremental=request.incremental,
+                durable=request.durable,
+                estimate=request.estimate,
+                error_bound=error_bound,
+            )
+
+    session = active_session()
+    if session is not None:
+        session.label = f"{video_id} max_comments={request.max_comments}" + (" estimate" if request.estimate else "")
+    if session is not None and session.trigger != "sample":
+        # Perfilado a petición: se analiza de nuevo aquí, sin caché ni unirse a otro análisis
+        # en curso (su trabajo corre fuera de esta petición y no se muestrearía)
+        result = await analyze()
+    else:
+        result = await analysis_cache.get_or_compute(key, analyze, force_refresh=request.force_refresh)
+    if request.durable and result.persistence == "queued":
+        # Análisis compartido (o en caché) de una petición sin durable: sus comentarios se
+        # guardan ya, y si la BD falla esta petición falla. Lo ya escrito por la cola se
+        # descarta como "sin cambios"
+        await run_io(_persist_stage, video_id, result.records, True)
+        result = replace(result, persistence="durable", _response=None)
+    if format == "json" and not comment_fields and precision is None:
+        # Aquí, en el borde de la API, es donde se construyen y validan los Comment
+        return await run_cpu(result.to_response)
+    # Formatos compactos (opt-in): mucho menos volumen y tiempo de codificación en análisis grandes
+    try:
+        return await run_cpu(encode_prediction, result, format, comment_fields, precision)
+    except ValueError as e:
+        # Formato binario sin su dependencia opcional instalada en el servidor
+        raise HTTPException(status_code=501, detail=str(e))
+
+@app.get("/api/CommentAnalyzer/cache")
+async def get_analysis_cache_info():
+    # Aciertos, peticiones unidas a un análisis en curso y fallos
+    return analysis_cache.info()
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse que libera el hueco de admisión cuando termina de enviarse, también si
+    el cliente se desconecta antes de que el generador llegue a empezar
+    """
+    def __init__(self, content, cost: int, lane: str, **kwargs):
+        super().__init__(content, **kwargs)
+        self.cost = cost
+        self.lane = lane
+        self.started = time.monotonic()
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            admission.release(self.cost, self.lane, time.monotonic() - self.started)
+
+# Puntuación de textos sueltos (JSON o NDJSON), sin YouTube ni BD; respuesta NDJSON en streaming
+@app.post("/api/score")
+async def score_texts(request: Request):
+    try:
+        records = parse_score_payload(await request.body(), request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Cuerpo no válido: {str(e)}")
+    if not records:
+        raise HTTPException(status_code=400, detail="No hay textos que puntuar")
+    if len(records) > SCORE_MAX_TEXTS:
+        raise HTTPException(status_code=413, detail=f"Máximo {SCORE_MAX_TEXTS} textos por petición")
+
+    # El hueco se reserva antes de responder (para poder devolver 429/503) y lo libera la respuesta
+    cost = await admission.acquire_async(len(records), lane="interactive")
+    return AdmittedStreamingResponse(stream_scores(records), cost, "interactive", media_type="application/x-ndjson")
+
+@app.get("/api/admission")
+async def get_admission_info():
+    # Coste en curso, esperas y rechazos por carril (interactive / bulk)
+    return admission.info()
+
+@app.get("/api/admin/profiles")
+async def list_profiles(request: Request):
+    # Perfiles guardados, del más reciente al más antiguo
+    _require_admin(request)
+    return await run_io(profile_store.list)
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request):
+    # Resumen: funciones con más muestras (propias y acumuladas) y operadores de torch
+    _require_admin(request)
+    summary = await run_io(profile_store.get_summary, profile_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return summary
+
+@app.get("/api/admin/profiles/{profile_id}/flamegraph", response_class=PlainTextResponse)
+async def get_profile_flamegraph(profile_id: str, request: Request):
+    # Pilas colapsadas: flamegraph.pl, speedscope o inferno las dibujan tal cual
+    _require_admin(request)
+    folded = await run_io(profile_store.get_folded, profile_id)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return PlainTextResponse(folded)
+
+@app.get("/api/persistence/queue")
+async def get_write_queue_info():
+    # Escrituras pendientes / fallidas de la cola write-behind
+    return write_queue.info()
+
+
+# Endpoint bulk: varios vídeos, una playlist o un canal en un solo job en segundo plano
+@app.post("/api/bulk/CommentAnalyzer/", status_code=202)
+async def bulk_predict_from_youtube(request: BulkRequest):
+    try:
+        video_ids = await run_io(
+            expand_targets,
+            request.video_ids,
+            playlist_id=request.playlist_id,
+            channel_id=request.channel_id,
+            max_videos=request.max_videos,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error expandiendo playlist/canal: {str(e)}")
+
+    if not video_ids:
+        raise HTTPException(status_code=400, detail="Indica video_ids, playlist_id o channel_id")
+    admission.check_lane("bulk")
+
+    job = start_bulk_job(video_ids, max_comments=request.max_comments, incremental=request.incremental)
+    return job.to_dict()
+
+@app.get("/api/bulk/{job_id}")
+async def get_bulk_job_status(job_id: str):
+    # Progreso por vídeo y throughput (comentarios/s) del job
+    job = get_bulk_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} no encontrado")
+    return job.to_dict()
+
+
+# Jobs de análisis de un vídeo: respuesta inmediata con job_id, progreso por etapas y
+# resultados en streaming por trozos (NDJSON o SSE)
+def _job_or_404(job_id: str):
+    job = get_analysis_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} no encontrado o caducado")
+    return job
+
+@app.post("/api/jobs/CommentAnalyzer/", status_code=202)
+async def submit_analysis(request: VideoRequest):
+    if request.estimate:
+        raise HTTPException(status_code=400, detail="El modo estimate solo está disponible en /api/CommentAnalyzer/")
+    admission.check_lane("interactive")
+    job = submit_analysis_job(
+        request.url_or_id,
+        max_comments=request.max_comments,
+        incremental=request.incremental,
+        durable=request.durable,
+    )
+    return {
+        **job.to_dict(),
+        "status_url": f"/api/jobs/{job.job_id}",
+        "stream_url": f"/api/jobs/{job.job_id}/stream",
+        "result_url": f"/api/jobs/{job.job_id}/result",
+    }
+
+@app.get("/api/jobs/{job_id}")
+async def get_analysis_status(job_id: str):
+    # Etapa actual (fetching / cleaning / scoring / saving) y contadores
+    return _job_or_404(job_id).to_dict()
+
+@app.get("/api/jobs/{job_id}/stream")
+async def stream_analysis(job_id: str, format: str = Query("ndjson", pattern="^(ndjson|sse)$")):
+    job = _job_or_404(job_id)
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_job_events(job, format),
+        media_type=media_type,
+        # X-Accel-Buffering: que nginx no acumule el stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/jobs/{job_id}/result", response_model=PredictionResponse)
+async def get_analysis_result(job_id: str):
+    job = _job_or_404(job_id)
+    if job.status == "error":
+        raise HTTPException(status_code=500, detail=f"Error en el análisis: {job.error}")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"El job está en estado '{job.status}'")
+    return job.result()
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_analysis(job_id: str):
+    # Se detiene antes del siguiente trozo; los resultados parciales no se guardan
+    job = _job_or_404(job_id)
+    if not job.finished:
+        job.cancel()
+    return job.to_dict()
 
 
 # Endpoint GET para los gráficos, se traen por video_id:
 @app.get("/api/stats/")
-def get_stats(video_id: str):
+async def get_stats(video_id: str):
     # Recupera estadísticas guardadas para gráficos del frontend
     # NO ejecuta pipeline - solo consulta base de datos
     try:
-        print(f"🔍 Recuperando estadísticas guardadas para: {video_id}")
-        saved_stats = get_video_statistics(video_id)
+        logger.debug(f"🔍 Recuperando estadísticas guardadas para: {video_id}")
+        saved_stats = await run_in_threadpool(get_video_statistics, video_id)
         
         if saved_stats:
             return {
                 "video_id": video_id,
                 "cantidad_comentarios": saved_stats["total_comments"],
                 "barras_toxicidad": saved_stats["toxicity_stats"],
+                "coocurrencias_toxicidad": saved_stats.get("toxicity_cooccurrence") or {},
                 "sentimientos": {
                     "mean_sentiment_score": saved_stats["mean_sentiment_score"],
                     "sentiment_types_distribution": saved_stats["sentiment_distribution"]
@@ -188,11 +577,20 @@ def get_stats(video_id: str):
         raise HTTPException(status_code=500, detail=f"Error recuperando estadísticas: {str(e)}")
 
 
+@app.delete("/api/sentiment-analyzer/video/{video_id}/comments")
+async def delete_sentiment_analyzer_comments(video_id: str, comment_ids: str = Query(..., description="IDs separados por comas")):
+    """Elimina comentarios concretos de un video y los resta de sus estadísticas"""
+    ids = [c.strip() for c in comment_ids.split(",") if c.strip()]
+    deleted = await run_in_threadpool(delete_comments, video_id, ids)
+    analysis_cache.invalidate(video_id)
+    return {"video_id": video_id, "deleted": deleted}
+
 @app.delete("/api/sentiment-analyzer/video/{video_id}")
-def delete_sentiment_analyzer_by_video_id(video_id: str):
+async def delete_sentiment_analyzer_by_video_id(video_id: str):
     """Elimina todos los comentarios guardados de un video"""
     try:
-        success = delete_comments_by_video(video_id)
+        success = await run_in_threadpool(delete_comments_by_video, video_id)
+        analysis_cache.invalidate(video_id)
         if success:
             return {"message": f"Comentarios del video {video_id} eliminados correctamente"}
         else:
@@ -0,0 +1,246 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Deque, Dict, Optional
+
+# Control de admisión de los análisis. Cada análisis tiene un coste estimado a partir de
+# max_comments (DataFrame, copias y predicciones crecen con el número de comentarios) y la
+# suma de costes en curso está acotada. Lo que no cabe espera en una cola acotada; si la
+# cola está llena se rechaza al momento (429) y si la espera supera el tope, 503. Ambos
+# con Retry-After.
+# Dos carriles: "interactive" (peticiones de un vídeo) pasa siempre antes que "bulk"
+# (jobs de varios vídeos), y bulk nunca ocupa más de ADMISSION_BULK_SHARE de la capacidad.
+
+ANALYSIS_MAX_COMMENTS = int(os.getenv("ANALYSIS_MAX_COMMENTS", "10000"))
+# Modo estimación: comentarios que se pueden descargar (la población; solo se puntúa una muestra).
+# La descarga se cobra entera en admisión: memoria y tiempo crecen con la población
+ESTIMATE_MAX_POPULATION = int(os.getenv("ESTIMATE_MAX_POPULATION", "50000"))
+ADMISSION_CAPACITY = int(os.getenv("ADMISSION_CAPACITY", "20000"))
+# Coste fijo por análisis (peticiones a YouTube, carga del pipeline) en "comentarios"
+ADMISSION_BASE_COST = int(os.getenv("ADMISSION_BASE_COST", "50"))
+ADMISSION_BULK_SHARE = float(os.getenv("ADMISSION_BULK_SHARE", "0.5"))
+ADMISSION_MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "32"))
+ADMISSION_INTERACTIVE_TIMEOUT = float(os.getenv("ADMISSION_INTERACTIVE_TIMEOUT", "15"))
+ADMISSION_BULK_TIMEOUT = float(os.getenv("ADMISSION_BULK_TIMEOUT", "600"))
+
+LANES = ("interactive", "bulk")
+
+
+class AdmissionRejected(Exception):
+    """
+    Análisis rechazado por sobrecarga: status_code 429 (cola llena) o 503 (espera agotada)
+    """
+    def __init__(self, status_code: int, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class _Waiter:
+    def __init__(self, cost: int, lane: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.cost = cost
+        self.lane = lane
+        self.granted = False
+        self.loop = loop
+        # Los hilos (jobs bulk) esperan un Event; las rutas async un Future de su event loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def wake(self):
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        else:
+            self.event.set()
+
+
+def _resolve(future: "asyncio.Future[Any]"):
+    if not future.done():
+        future.set_result(True)
+
+
+class AdmissionController:
+    def __init__(self, capacity: int = ADMISSION_CAPACITY, base_cost: int = ADMISSION_BASE_COST,
+                 bulk_share: float = ADMISSION_BULK_SHARE, max_queued: int = ADMISSION_MAX_QUEUED,
+                 interactive_timeout: float = ADMISSION_INTERACTIVE_TIMEOUT,
+                 bulk_timeout: float = ADMISSION_BULK_TIMEOUT):
+        self.capacity = capacity
+        self.base_cost = base_cost
+        self.bulk_capacity = max(1, int(capacity * bulk_share))
+        self.max_queued = max_queued
+        self.timeouts = {"interactive": interactive_timeout, "bulk": bulk_timeout}
+
+        self._lock = threading.Lock()
+        self._queues: Dict[str, Deque[_Waiter]] = {lane: deque() for lane in LANES}
+        self.in_flight_cost = {lane: 0 for lane in LANES}
+        self.in_flight = {lane: 0 for lane in LANES}
+        # Media móvil de la duración de los análisis, para estimar Retry-After
+        self._mean_duration = 5.0
+
+        self.stats = {lane: {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+                      for lane in LANES}
+
+    def cost_of(self, max_comments: int, lane: str = "interactive") -> int:
+        # Un análisis más grande que la capacidad se recorta: puede correr, pero solo
+        limit = self.bulk_capacity if lane == "bulk" else self.capacity
+        return min(limit, self.base_cost + max(0, max_comments))
+
+    # --- Estado (con el lock tomado) ---
+    def _fits(self, cost: int, lane: str) -> bool:
+        if sum(self.in_flight_cost.values()) + cost > self.capacity:
+            return False
+        return lane != "bulk" or self.in_flight_cost["bulk"] + cost <= self.bulk_capacity
+
+    def _grant(self, cost: int, lane: str):
+        self.in_flight_cost[lane] += cost
+        self.in_flight[lane] += 1
+        self.stats[lane]["admitted"] += 1
+
+    def _try_admit(self, cost: int, lane: str) -> bool:
+        # Sin adelantar a nadie: interactive respeta su cola; bulk además cede ante interactive
+        ahead = self._queues["interactive"] if lane == "interactive" else [*self._queues["interactive"], *self._queues["bulk"]]
+        if not ahead and self._fits(cost, lane):
+            self._grant(cost, lane)
+            return True
+        return False
+
+    def _wake_waiters(self):
+        # Orden estricto: cabeza de interactive; bulk solo cuando no espera ningún interactive
+        for lane in LANES:
+            queue = self._queues[lane]
+            while queue and self._fits(queue[0].cost, lane):
+                waiter = queue.popleft()
+                self._grant(waiter.cost, lane)
+                waiter.granted = True
+                waiter.wake()
+            if queue:
+                return
+
+    def retry_after(self) -> int:
+        queued = sum(len(q) for q in self._queues.values())
+        running = max(1, sum(self.in_flight.values()))
+        return max(1, math.ceil(self._mean_duration * (1 + queued / running)))
+
+    def _enqueue(self, cost: int, lane: str, loop=None) -> Optional[_Waiter]:
+        """
+        Admite ya (None), encola (waiter) o rechaza con 429 si la cola del carril está llena
+        """
+        with self._lock:
+            if self._try_admit(cost, lane):
+                return None
+            if len(self._queues[lane]) >= self.max_queued:
+                self.stats[lane]["rejected_queue_full"] += 1
+                raise AdmissionRejected(429, self.retry_after(),
+                                        f"Servidor saturado: {len(self._queues[lane])} análisis en espera")
+            waiter = _Waiter(cost, lane, loop)
+            self._queues[lane].append(waiter)
+            self.stats[lane]["queued"] += 1
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """
+        Saca de la cola a un waiter que deja de esperar. True si ya había sido admitido
+        """
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._queues[waiter.lane].remove(waiter)
+            # Quitar la cabeza puede desbloquear a los que esperaban detrás
+            self._wake_waiters()
+            return False
+
+    def _timeout_error(self, lane: str) -> AdmissionRejected:
+        with self._lock:
+            self.stats[lane]["rejected_timeout"] += 1
+            return AdmissionRejected(503, self.retry_after(),
+                                     f"Tiempo de espera agotado ({self.timeouts[lane]:.0f}s) por sobrecarga")
+
+    def _release(self, cost: int, lane: str, duration: float):
+        with self._lock:
+            self.in_flight_cost[lane] -= cost
+            self.in_flight[lane] -= 1
+            self._mean_duration = 0.8 * self._mean_duration + 0.2 * duration
+            self._wake_waiters()
+
+    # --- API ---
+    def check_lane(self, lane: str):
+        """
+        Rechazo rápido (429) antes de aceptar trabajo en segundo plano si el carril ya está lleno
+        """
+        with self._lock:
+            if len(self._queues[lane]) >= self.max_queued:
+                self.stats[lane]["rejected_queue_full"] += 1
+                raise AdmissionRejected(429, self.retry_after(), "Servidor saturado, inténtalo más tarde")
+
+    @contextmanager
+    def admit(self, max_comments: int, lane: str = "interactive"):
+        """
+        Versión bloqueante, para hilos (jobs bulk y jobs de análisis)
+        """
+        cost = self.cost_of(max_comments, lane)
+        waiter = self._enqueue(cost, lane)
+        if waiter is not None and not waiter.event.wait(self.timeouts[lane]) and not self._abandon(waiter):
+            raise self._timeout_error(lane)
+        started = time.monotonic()
+        try:
+            yield cost
+        finally:
+            self._release(cost, lane, time.monotonic() - started)
+
+    async def acquire_async(self, max_comments: int, lane: str = "interactive") -> int:
+        """
+        Espera hueco sin ocupar ningún hilo. Devuelve el coste a pasar a release()
+        """
+        cost = self.cost_of(max_comments, lane)
+        waiter = self._enqueue(cost, lane, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.timeouts[lane])
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise self._timeout_error(lane)
+            except asyncio.CancelledError:
+                # Cliente desconectado mientras esperaba: si ya tenía hueco se devuelve
+                if self._abandon(waiter):
+                    self._release(cost, lane, 0.0)
+                raise
+        return cost
+
+    def release(self, cost: int, lane: str, duration: float):
+        self._release(cost, lane, duration)
+
+    @asynccontextmanager
+    async def admit_async(self, max_comments: int, lane: str = "interactive"):
+        """
+        Versión para rutas async
+        """
+        cost = await self.acquire_async(max_comments, lane)
+        started = time.monotonic()
+        try:
+            yield cost
+        finally:
+            self._release(cost, lane, time.monotonic() - started)
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "bulk_capacity": self.bulk_capacity,
+                "max_queued": self.max_queued,
+                "mean_duration_seconds": round(self._mean_duration, 2),
+                "lanes": {
+                    lane: {
+                        "in_flight": self.in_flight[lane],
+                        "in_flight_cost": self.in_flight_cost[lane],
+                        "waiting": len(self._queues[lane]),
+                        **self.stats[lane],
+                    } for lane in LANES
+                },
+            }
+
+
+admission = AdmissionController()
@@ -0,0 +1,76 @@
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from server.database.stats_cache import TTLCache
+
+# Single-flight + caché de resultados de /api/CommentAnalyzer/.
+# Peticiones simultáneas con la misma clave (video_id, max_comments, ...) esperan a un único
+# cálculo en curso en lugar de descargar, puntuar y guardar lo mismo N veces. El resultado
+# se guarda ANALYSIS_CACHE_TTL segundos (0 desactiva la caché, el coalescing se mantiene).
+
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", "300"))
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "256"))
+
+
+class SingleFlightCache:
+    def __init__(self, ttl: float = ANALYSIS_CACHE_TTL, maxsize: int = ANALYSIS_CACHE_SIZE):
+        self.ttl = ttl
+        self.results = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Solo se toca desde el event loop: no hace falta lock
+        self._in_flight: Dict[Hashable, "asyncio.Task[Any]"] = {}
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    async def get_or_compute(self, key: Tuple, compute: Callable[[], Awaitable[Any]],
+                             force_refresh: bool = False) -> Any:
+        """
+        Resultado en caché, el del cálculo en curso para la misma clave o uno nuevo.
+        force_refresh ignora la caché pero se une a un cálculo ya en curso (es igual de reciente).
+        """
+        if not force_refresh and self.ttl > 0:
+            cached = self.results.get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # Tarea propia: si el cliente que la lanzó se desconecta, el resto sigue esperándola
+            task = asyncio.ensure_future(compute())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Tuple, task: "asyncio.Task[Any]"):
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        if self.ttl > 0:
+            self.results.set(key, task.result())
+
+    def invalidate(self, video_id: str):
+        # Las claves empiezan por video_id
+        self.results.delete(*[key for key in self.results.keys() if key[0] == video_id])
+
+    def clear(self):
+        self.results.clear()
+
+    def info(self) -> Dict[str, Any]:
+        total = self.hits + self.coalesced + self.misses
+        return {
+            "entries": len(self.results),
+            "in_flight": len(self._in_flight),
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.coalesced) / total, 3) if total else 0.0,
+        }
+
+
+analysis_cache = SingleFlightCache()
@@ -0,0 +1,273 @@
+import os
+import time
+import uuid
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from etl.youtube_extraction import extract_video_id
+from server.schemas import PredictionResponse
+from server.records import ScoredComments, AnalysisResult, stats_from_complete
+from server.outils.executors import run_cpu_sync, job_executor
+from server.outils.admission import admission
+from server.outils.fast_json import dumps
+from server.outils.logging_config import get_logger
+from server.outils.prediction_pipeline import (
+    _fetch_stage, _clean_stage, _score_stage, _persist_stage,
+    merge_complete_stats,
+)
+
+# Jobs de análisis de un vídeo: POST devuelve el job_id al momento y el análisis sigue en
+# segundo plano. La puntuación se hace por trozos y cada trozo se publica como evento
+# (comentarios puntuados + estadísticas acumuladas), que /api/jobs/{id}/stream reenvía
+# como NDJSON o Server-Sent Events. Los jobs se ejecutan en el pool acotado job_executor y los
+# terminados se conservan ANALYSIS_JOB_TTL segundos; al terminar, los eventos se quedan sin los
+# comentarios (el resultado completo está en /api/jobs/{id}/result) para no guardarlos dos veces.
+
+ANALYSIS_JOB_BATCH_SIZE = int(os.getenv("ANALYSIS_JOB_BATCH_SIZE", "100"))
+ANALYSIS_JOB_TTL = float(os.getenv("ANALYSIS_JOB_TTL", "3600"))
+
+FINAL_STATUSES = ("done", "error", "cancelled")
+
+logger = get_logger(__name__)
+
+_jobs: Dict[str, "AnalysisJob"] = {}
+_jobs_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    """El job se canceló entre dos etapas o dos trozos"""
+
+
+class AnalysisJob:
+    def __init__(self, url_or_id: str, max_comments: int = 100, incremental: bool = False,
+                 durable: bool = False, persist: bool = True):
+        self.job_id = uuid.uuid4().hex
+        self.url_or_id = url_or_id
+        self.max_comments = max_comments
+        self.incremental = incremental
+        self.durable = durable
+        self.persist = persist
+
+        self.video_id: Optional[str] = None
+        self.status = "queued"          # queued | running | done | error | cancelled
+        self.stage: Optional[str] = None  # fetching | cleaning | scoring | saving
+        self.fetched = 0
+        self.cleaned = 0
+        self.scored = 0
+        self._parts: List[ScoredComments] = []
+        self.complete_stats: Dict[str, Any] = {}
+        self.persistence: Optional[str] = None
+        self.error: Optional[str] = None
+
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        self.events: List[Dict[str, Any]] = []
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    # --- Estado ---
+    @property
+    def finished(self) -> bool:
+        return self.status in FINAL_STATUSES
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def _emit(self, event: Dict[str, Any]):
+        with self._lock:
+            self.events.append(event)
+
+    def events_since(self, index: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self.events[index:]
+
+    def set_stage(self, stage: str):
+        self.stage = stage
+        self._emit({"type": "stage", "stage": stage, **self._counts()})
+
+    @property
+    def comments(self) -> ScoredComments:
+        with self._lock:
+            parts = list(self._parts)
+        return ScoredComments.concat(parts)
+
+    def add_batch(self, records: ScoredComments, complete_stats: Dict[str, Any]):
+        with self._lock:
+            self._parts.append(records)
+            self.scored += len(records)
+            self.complete_stats = complete_stats
+        self._emit({
+            "type": "comments",
+            "comments": records.rows(),
+            "stats": stats_from_complete(complete_stats),
+            "complete_stats": complete_stats,
+            **self._counts(),
+        })
+
+    def finish(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        self._compact_events(keep_results=status == "done")
+        self._emit({"type": "end", "status": status, "error": error, "persistence": self.persistence, **self._counts()})
+
+    def _compact_events(self, keep_results: bool):
+        # Los trozos ya emitidos pasan a ser solo progreso y estadísticas; sin resultado
+        # (cancelado o error) tampoco se conservan los comentarios puntuados
+        with self._lock:
+            self.events = [
+                {k: v for k, v in event.items() if k not in ("comments", "complete_stats")}
+                if event["type"] == "comments" else event
+                for event in self.events
+            ]
+            if not keep_results:
+                self._parts = []
+
+    def _counts(self) -> Dict[str, int]:
+        return {"fetched": self.fetched, "cleaned": self.cleaned, "scored": self.scored}
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        return {
+            "job_id": self.job_id,
+            "video_id": self.video_id,
+            "status": self.status,
+            "stage": self.stage,
+            **self._counts(),
+            "progress": round(self.scored / self.cleaned, 3) if self.cleaned else 0.0,
+            "persistence": self.persistence,
+            "error": self.error,
+            "elapsed_seconds": round(elapsed, 2),
+            "expires_at": self.finished_at + ANALYSIS_JOB_TTL if self.finished_at else None,
+        }
+
+    def result(self) -> PredictionResponse:
+        return AnalysisResult(self.video_id, self.comments, self.complete_stats,
+                              self.incremental, self.persistence).to_response()
+
+
+def run_analysis_job(job: AnalysisJob, batch_size: int = ANALYSIS_JOB_BATCH_SIZE) -> AnalysisJob:
+    """
+    Mismas etapas que predict_pipeline, publicando el progreso y los resultados por trozos
+    """
+    try:
+        # Cancelado mientras esperaba en la cola del pool
+        job.check_cancelled()
+        # El job sigue "queued" mientras espera hueco en el control de admisión
+        with admission.admit(job.max_comments, lane="interactive"):
+            _run_stages(job, batch_size)
+        job.finish("done")
+        logger.info(f"✅ Job de análisis {job.job_id[:8]} ({job.video_id}): {job.scored} comentarios")
+    except JobCancelled:
+        job.finish("cancelled")
+        logger.info(f"🛑 Job de análisis {job.job_id[:8]} cancelado en la etapa {job.stage}")
+    except Exception as e:
+        job.finish("error", str(e))
+        logger.error(f"❌ Job de análisis {job.job_id[:8]} falló: {e}")
+    return job
+
+
+def _run_stages(job: AnalysisJob, batch_size: int):
+    job.status = "running"
+    job.started_at = time.time()
+    job.check_cancelled()
+    job.video_id = extract_video_id(job.url_or_id)
+
+    job.set_stage("fetching")
+    comments, previous_stats = _fetch_stage(job.video_id, job.max_comments, job.incremental)
+    job.fetched = len(comments)
+    job.check_cancelled()
+
+    # En modo incremental las estadísticas parten de las ya guardadas
+    running_stats = previous_stats if job.incremental else None
+    if comments:
+        job.set_stage("cleaning")
+        df_clean = run_cpu_sync(_clean_stage, comments)
+        job.cleaned = len(df_clean)
+
+        job.set_stage("scoring")
+        for start in range(0, len(df_clean), batch_size):
+            job.check_cancelled()
+            part = df_clean.iloc[start:start + batch_size]
+            enriched, batch_stats = run_cpu_sync(_score_stage, part, job.video_id)
+            running_stats = merge_complete_stats(running_stats, batch_stats)
+            job.add_batch(enriched, running_stats)
+
+    job.check_cancelled()
+    job.complete_stats = merge_complete_stats(running_stats, {}) if running_stats else {}
+    if job.persist and job.scored:
+        # Un job cancelado no llega aquí: no se guardan resultados parciales
+        job.set_stage("saving")
+        job.persistence = _persist_stage(job.video_id, job.comments, job.durable)
+
+
+def purge_expired(jobs: Dict[str, Any], lock: threading.Lock, ttl: float):
+    """
+    Quita del registro los jobs terminados hace más de ttl segundos (también los jobs bulk)
+    """
+    now = time.time()
+    with lock:
+        expired = [job_id for job_id, job in jobs.items()
+                   if job.finished_at and now - job.finished_at > ttl]
+        for job_id in expired:
+            del jobs[job_id]
+
+
+def _purge_expired():
+    purge_expired(_jobs, _jobs_lock, ANALYSIS_JOB_TTL)
+
+
+def submit_analysis_job(url_or_id: str, max_comments: int = 100, incremental: bool = False,
+                        durable: bool = False) -> AnalysisJob:
+    """
+    Registra el job y lo encola en el pool de jobs
+    """
+    _purge_expired()
+    job = AnalysisJob(url_or_id, max_comments=max_comments, incremental=incremental, durable=durable)
+    with _jobs_lock:
+        _jobs[job.job_id] = job
+    job_executor.submit(run_analysis_job, job)
+    return job
+
+
+def get_analysis_job(job_id: str) -> Optional[AnalysisJob]:
+    _purge_expired()
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def _encode_event(event: Dict[str, Any], fmt: str) -> bytes:
+    if fmt == "sse":
+        return b"event: " + event["type"].encode() + b"\ndata: " + dumps(event) + b"\n\n"
+    return dumps(event) + b"\n"
+
+
+async def stream_job_events(job: AnalysisJob, fmt: str = "ndjson", poll_interval: float = 0.25,
+                            heartbeat: float = 15) -> AsyncIterator[bytes]:
+    """
+    Todos los eventos del job desde el principio y los nuevos según llegan, hasta el evento "end".
+    Si el job ya terminó, los eventos "comments" solo traen progreso y estadísticas.
+    Los heartbeats mantienen abierta la conexión a través de proxies mientras no hay eventos.
+    """
+    index = 0
+    last_sent = time.monotonic()
+    while True:
+        events = job.events_since(index)
+        for event in events:
+            yield _encode_event(event, fmt)
+            if event["type"] == "end":
+                return
+        index += len(events)
+        if events:
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= heartbeat:
+            yield b": keep-alive\n\n" if fmt == "sse" else _encode_event({"type": "heartbeat", **job._counts()}, fmt)
+            last_sent = time.monotonic()
+        await asyncio.sleep(poll_interval)
@@ -0,0 +1,229 @@
+import os
+import sys
+import time
+import uuid
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional
+
+from etl.youtube_extraction import extract_video_id, fetch_playlist_video_ids, fetch_channel_video_ids
+from server.outils.prediction_pipeline import analyze_video
+from server.outils.admission import admission
+from server.outils.analysis_jobs import purge_expired
+from server.records import ScoredComments
+from server.outils.stats_engine import StatsSummary
+from server.database.save_comments import save_comments_batch, to_db_rows
+from server.outils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Tope GLOBAL de análisis simultáneos (compartido por todos los jobs bulk del proceso)
+BULK_MAX_CONCURRENCY = int(os.getenv("BULK_MAX_CONCURRENCY", "4"))
+# Comentarios acumulados antes de mandar una escritura en lote a la BD
+BULK_WRITE_BATCH_SIZE = int(os.getenv("BULK_WRITE_BATCH_SIZE", "1000"))
+# Segundos que se conserva un job terminado para consultar su progreso
+BULK_JOB_TTL = float(os.getenv("BULK_JOB_TTL", "3600"))
+
+_global_slots = threading.BoundedSemaphore(BULK_MAX_CONCURRENCY)
+
+# Jobs en memoria del proceso: job_id -> BulkJob
+JOBS: Dict[str, "BulkJob"] = {}
+_jobs_lock = threading.Lock()
+
+
+def expand_targets(video_ids: Optional[List[str]] = None, playlist_id: Optional[str] = None,
+                   channel_id: Optional[str] = None, max_videos: int = 50) -> List[str]:
+    """
+    Convierte la lista de vídeos / playlist / canal en IDs de vídeo únicos (en orden)
+    """
+    targets = [extract_video_id(v) for v in (video_ids or [])]
+    if playlist_id:
+        targets += fetch_playlist_video_ids(playlist_id, max_videos=max_videos)
+    if channel_id:
+        targets += fetch_channel_video_ids(channel_id, max_videos=max_videos)
+    return list(dict.fromkeys(targets))
+
+
+class BulkWriter:
+    """
+    Acumula comentarios de varios vídeos y los guarda en lotes grandes
+    en lugar de una escritura por vídeo. Las estadísticas de cada vídeo se actualizan al
+    escribir sus comentarios (fold_statistics); aquí se suman además las del job (canal).
+    """
+    def __init__(self, batch_size: int = BULK_WRITE_BATCH_SIZE):
+        self.batch_size = batch_size
+        # Filas de BD ya convertidas: las columnas de cada vídeo se sueltan al añadirlas
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self.rows_written = 0
+        self.summary = StatsSummary()
+
+    def add(self, video_id: str, records: ScoredComments, complete_stats: Dict[str, Any]):
+        delta = StatsSummary.from_complete_stats(complete_stats)
+        rows = to_db_rows(records)
+        with self._lock:
+            self.summary = self.summary.merge(delta)
+            self._buffer.extend(rows)
+            if len(self._buffer) < self.batch_size:
+                return
+            batch, self._buffer = self._buffer, []
+        self._write(batch)
+
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        saved = save_comments_batch(batch, validate=False, fold_statistics=True)
+        with self._lock:
+            self.rows_written += len(saved)
+
+
+class BulkJob:
+    def __init__(self, video_ids: List[str], max_comments: int = 100, incremental: bool = False):
+        self.job_id = uuid.uuid4().hex
+        self.max_comments = max_comments
+        self.incremental = incremental
+        self.status = "pending"
+        self.videos: Dict[str, Dict[str, Any]] = {
+            video_id: {"status": "pending", "comments": 0, "error": None} for video_id in video_ids
+        }
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.writer = BulkWriter()
+        self._lock = threading.Lock()
+
+    @property
+    def total_comments(self) -> int:
+        return sum(v["comments"] for v in self.videos.values())
+
+    @property
+    def elapsed_seconds(self) -> float:
+        if not self.started_at:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def comments_per_second(self) -> float:
+        elapsed = self.elapsed_seconds
+        return self.total_comments / elapsed if elapsed else 0.0
+
+    def set_video(self, video_id: str, **fields):
+        with self._lock:
+            self.videos[video_id].update(fields)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            videos = {k: dict(v) for k, v in self.videos.items()}
+        done = sum(1 for v in videos.values() if v["status"] in ("done", "error"))
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "total_videos": len(videos),
+            "completed_videos": done,
+            "total_comments": self.total_comments,
+            "rows_written": self.writer.rows_written,
+            "elapsed_seconds": round(self.elapsed_seconds, 2),
+            "comments_per_second": round(self.comments_per_second, 2),
+            "expires_at": self.finished_at + BULK_JOB_TTL if self.finished_at else None,
+            # Estadísticas de todos los vídeos del job juntos, sumando sus resúmenes
+            "complete_stats": self.writer.summary.to_complete_stats(),
+            "videos": videos,
+        }
+
+
+def _analyze_one(job: BulkJob, video_id: str):
+    # Carril bulk del control de admisión: cede ante las peticiones interactivas
+    with _global_slots, admission.admit(job.max_comments, lane="bulk"):
+        job.set_video(video_id, status="running")
+        result = analyze_video(
+            video_id,
+            max_comments=job.max_comments,
+            incremental=job.incremental,
+            persist=False,
+        )
+    job.writer.add(video_id, result.records, result.complete_stats)
+    job.set_video(video_id, status="done", comments=result.total_comments)
+
+
+def run_bulk_job(job: BulkJob, max_workers: int = BULK_MAX_CONCURRENCY) -> BulkJob:
+    """
+    Reparte los vídeos del job en un pool de workers y guarda en lotes al terminar
+    """
+    job.status = "running"
+    job.started_at = time.time()
+    logger.info(f"🚀 Job bulk {job.job_id}: {len(job.videos)} vídeos, {max_workers} workers")
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(_analyze_one, job, video_id): video_id for video_id in job.videos}
+            for future in as_completed(futures):
+                video_id = futures[future]
+                try:
+                    future.result()
+                    logger.info(f"✅ [{job.job_id[:8]}] {video_id}: {job.videos[video_id]['comments']} comentarios")
+                except Exception as e:
+                    logger.error(f"❌ [{job.job_id[:8]}] Error analizando {video_id}: {e}")
+                    job.set_video(video_id, status="error", error=str(e))
+
+        job.writer.flush()
+        job.status = "done"
+    except Exception:
+        job.status = "error"
+        raise
+    finally:
+        # Con finished_at el job caduca a los BULK_JOB_TTL segundos
+        job.finished_at = time.time()
+    logger.info(f"🎯 Job {job.job_id}: {job.total_comments} comentarios en {job.elapsed_seconds:.1f}s "
+                f"({job.comments_per_second:.1f} comentarios/s)")
+    return job
+
+
+def start_bulk_job(video_ids: List[str], max_comments: int = 100, incremental: bool = False,
+                   max_workers: int = BULK_MAX_CONCURRENCY) -> BulkJob:
+    """
+    Lanza el job en segundo plano y lo registra para consultar el progreso
+    """
+    _purge_expired()
+    job = BulkJob(video_ids, max_comments=max_comments, incremental=incremental)
+    with _jobs_lock:
+        JOBS[job.job_id] = job
+    threading.Thread(target=run_bulk_job, args=(job, max_workers), daemon=True).start()
+    return job
+
+
+def _purge_expired():
+    purge_expired(JOBS, _jobs_lock, BULK_JOB_TTL)
+
+
+def get_bulk_job(job_id: str) -> Optional[BulkJob]:
+    _purge_expired()
+    with _jobs_lock:
+        return JOBS.get(job_id)
+
+
+if __name__ == "__main__":
+    # python -m server.outils.bulk_analysis --channel UCxxxx --max-videos 20 --workers 4
+    parser = argparse.ArgumentParser(description="Análisis bulk de vídeos, playlists o canales de YouTube")
+    parser.add_argument("--videos", nargs="*", default=[], help="URLs o IDs de vídeos")
+    parser.add_argument("--playlist", help="ID de playlist")
+    parser.add_argument("--channel", help="ID de canal")
+    parser.add_argument("--max-videos", type=int, default=50)
+    parser.add_argument("--max-comments", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=BULK_MAX_CONCURRENCY)
+    parser.add_argument("--incremental", action="store_true")
+    args = parser.parse_args()
+
+    targets = expand_targets(args.videos, args.playlist, args.channel, max_videos=args.max_videos)
+    if not targets:
+        parser.error("Indica al menos --videos, --playlist o --channel")
+
+    job = BulkJob(targets, max_comments=args.max_comments, incremental=args.incremental)
+    run_bulk_job(job, max_workers=args.workers)
+    summary = job.to_dict()
+    print(f"📊 {summary['completed_videos']}/{summary['total_videos']} vídeos, "
+          f"{summary['total_comments']} comentarios, {summary['comments_per_second']} comentarios/s")
+    sys.exit(0 if all(v["status"] == "done" for v in summary["videos"].values()) else 1)
@@ -4,6 +4,11 @@ from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 from transformers import pipeline
 from tqdm import tqdm
 
+from server.outils.logging_config import get_logger
+from server.outils.metrics import CLEANING_STEP_SECONDS
+
+logger = get_logger(__name__)
+
 # Initialize sentiment analysis tools once
 analyzer_en = SentimentIntensityAnalyzer()
 tqdm.pandas()
@@ -146,7 +151,7 @@ def convert_data_types(df):
             else:
                 df_copy[col] = df_copy[col].astype(conversion)
         except Exception as e:
-            print(f"Warning: Could not convert column '{col}': {e}")
+            logger.warning(f"Could not convert column '{col}': {e}")
     
     return df_copy
 # ----------------------------------------------------------------
@@ -291,13 +296,12 @@ def remove_linebreaks_and_spaces(df, text_columns=['text']):
 
 # ----------------------------------------------------------------
 # Sentiment analysis
-def analyze_sentiment(text):
+def sentiment_from_text(text):
+    """
+    (sentiment_type, sentiment_score, sentiment_intensity) of a text, as plain values.
+    """
     if not isinstance(text, str) or not text.strip():
-        return pd.Series({
-            'sentiment_type': 'neutral',
-            'sentiment_score': 0.0,
-            'sentiment_intensity': 'weak'
-        })
+        return 'neutral', 0.0, 'weak'
 
     scores = analyzer_en.polarity_scores(text)
     compound = scores['compound']
@@ -320,33 +324,81 @@ def analyze_sentiment(text):
     else:
         sentiment_intensity = 'weak'
     
+    return sentiment_type, sentiment_score, sentiment_intensity
+
+def analyze_sentiment(text):
+    sentiment_type, sentiment_score, sentiment_intensity = sentiment_from_text(text)
     return pd.Series({
         'sentiment_type': sentiment_type,
         'sentiment_score': sentiment_score,
         'sentiment_intensity': sentiment_intensity
     })
 
+def add_sentiment_columns(df, text_column='text'):
+    """
+    Add sentiment_type / sentiment_score / sentiment_intensity columns
+    (same values as analyze_sentiment, without building one Series per row).
+    """
+    results = [sentiment_from_text(text) for text in df[text_column]]
+    df['sentiment_type'] = [r[0] for r in results]
+    df['sentiment_score'] = [r[1] for r in results]
+    df['sentiment_intensity'] = [r[2] for r in results]
+    return df
+
+# ----------------------------------------------------------------
+# Free text (no YouTube metadata): only the steps that apply to the text itself
+def clean_free_text(df, text_column='text'):
+    timed = CLEANING_STEP_SECONDS.time
+# Step 1 eliminate URLs from text
+    with timed(step="extract_and_remove_urls"):
+        df = extract_and_remove_urls(df, text_column)
+# Step 2  is_self_promotional
+    with timed(step="is_self_promotional"):
+        df['is_self_promotional'] = df[text_column].apply(is_self_promotional)
+# Step 3  detect_tags
+    with timed(step="detect_tags"):
+        df = detect_tags(df, text_column)
+# Step 4  remove_linebreaks_and_spaces
+    with timed(step="remove_linebreaks_and_spaces"):
+        df = remove_linebreaks_and_spaces(df, [text_column])
+# Step 5 analyze_sentiment
+    with timed(step="analyze_sentiment"):
+        df = add_sentiment_columns(df, text_column)
+
+    return df
+
 # ----------------------------------------------------------------
 # Main pipeline function by order of operations
+# Each step is timed in sentiment_analyzer_cleaning_step_seconds{step} (GET /metrics)
 def clean_youtube_data(df):
+    timed = CLEANING_STEP_SECONDS.time
 # Step 1  normalize_column_names
-    df = normalize_column_names(df)
+    with timed(step="normalize_column_names"):
+        df = normalize_column_names(df)
 # Step 2  handle_duplicates
-    df = handle_duplicates(df)
+    with timed(step="handle_duplicates"):
+        df = handle_duplicates(df)
 # Step 3  handle_nulls
-    df = handle_nulls(df)
+    with timed(step="handle_nulls"):
+        df = handle_nulls(df)
 # Step 4  convert_data_types
-    df = convert_data_types(df)
+    with timed(step="convert_data_types"):
+        df = convert_data_types(df)
 # Step 5 eliminate URLs from text
-    df = extract_and_remove_urls(df)
+    with timed(step="extract_and_remove_urls"):
+        df = extract_and_remove_urls(df)
 # Step 6  is_self_promotional
-    df['is_self_promotional'] = df['text'].apply(is_self_promotional)
+    with timed(step="is_self_promotional"):
+        df['is_self_promotional'] = df['text'].apply(is_self_promotional)
 # Step 7  detect_tags
-    df = detect_tags(df)
+    with timed(step="detect_tags"):
+        df = detect_tags(df)
 # Step 8  remove_linebreaks_and_spaces
-    df = remove_linebreaks_and_spaces(df)
+    with timed(step="remove_linebreaks_and_spaces"):
+        df = remove_linebreaks_and_spaces(df)
 # Step 9 analyze_sentiment
-    df[['sentiment_type', 'sentiment_score', 'sentiment_intensity']] = df['text'].apply(analyze_sentiment)
+    with timed(step="analyze_sentiment"):
+        df = add_sentiment_columns(df)
 
     return df
 
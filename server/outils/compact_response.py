@@ -0,0 +1,174 @@
+import io
+import time
+import argparse
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import Response
+
+from server.records import AnalysisResult, ScoredComments, sample_records, COMMENT_FIELDS, FLAG_FIELDS
+from server.database.storage import TOXICITY_CATEGORIES
+from server.outils.fast_json import dumps, FastJSONResponse
+from server.outils import prediction_pipeline
+
+try:
+    import msgpack  # dependencia opcional, solo para format=msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow as pa  # dependencia opcional, solo para format=arrow
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+# Formatos compactos (opt-in) de un análisis grande, directamente desde sus columnas
+# (ScoredComments), sin construir ni volcar un Comment por comentario:
+#   - columnar: JSON con un array por campo en lugar de un objeto de ~30 claves por comentario
+#   - msgpack: lo mismo en MessagePack
+#   - arrow: los comentarios como tabla Arrow IPC (stream); el resto de la respuesta va en
+#     los metadatos del schema, clave "response" (JSON)
+# fields= elige las columnas; sin los is_* la respuesta trae "thresholds" para derivarlos
+# (is_x = x_probability > thresholds[x]). precision= redondea las probabilidades, que son
+# la mayor parte del volumen (17 dígitos cada una).
+
+RESPONSE_FORMATS = ("json", "columnar", "msgpack", "arrow")
+FLOAT_FIELDS = {f"{category}_probability" for category in TOXICITY_CATEGORIES} | {"sentiment_score"}
+
+MEDIA_TYPES = {
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def parse_response_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """
+    "text,toxic_probability" -> lista validada de campos de Comment (None = todos)
+    """
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in COMMENT_FIELDS]
+    if unknown:
+        raise ValueError(f"Campos desconocidos: {', '.join(unknown)}")
+    return requested
+
+
+def _thresholds() -> Dict[str, float]:
+    # Umbrales del modelo que carga prediction_pipeline (None si no se pudo cargar)
+    loader = prediction_pipeline.model_loader
+    return dict(loader.config["thresholds"]) if loader and getattr(loader, "config", None) else {}
+
+
+def _column(records: ScoredComments, field: str, precision: Optional[int]) -> List[Any]:
+    values = records.column(field)
+    if precision is not None and field in FLOAT_FIELDS:
+        rounded = np.round(np.array(values, dtype=float), precision)
+        if np.isnan(rounded).any():
+            return [None if v is None else r for v, r in zip(values, rounded.tolist())]
+        return rounded.tolist()
+    return values
+
+
+def columnar_payload(result: AnalysisResult, fields: Optional[List[str]] = None,
+                     columnar: bool = True, precision: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Campos de PredictionResponse con solo los campos pedidos de cada comentario, por columnas
+    (o por filas con columnar=False).
+    precision redondea probabilidades y sentiment_score a ese número de decimales.
+    """
+    fields = fields or COMMENT_FIELDS
+    records = result.records
+    payload = {
+        "video_id": result.video_id,
+        "total_comments": result.total_comments,
+        "stats": result.stats,
+        "complete_stats": result.complete_stats,
+        "incremental": result.incremental,
+        "new_comments": result.new_comments,
+        "persistence": result.persistence,
+        "estimate": result.estimate,
+        "fields": fields,
+    }
+    columns = {field: _column(records, field, precision) for field in fields}
+    if columnar:
+        payload["comments"] = columns
+    else:
+        payload["comments"] = [dict(zip(fields, row)) for row in zip(*columns.values())]
+    if any(flag not in fields for flag in FLAG_FIELDS):
+        payload["thresholds"] = _thresholds()
+    return payload
+
+
+def _arrow_bytes(payload: Dict[str, Any]) -> bytes:
+    columns = payload.pop("comments")
+    table = pa.table(columns).replace_schema_metadata({"response": dumps(payload)})
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def encode_prediction(result: AnalysisResult, response_format: str = "json",
+                      fields: Optional[List[str]] = None, precision: Optional[int] = None) -> Response:
+    """
+    Respuesta HTTP de un análisis en el formato pedido.
+    ValueError si el formato no existe o su dependencia opcional no está instalada.
+    """
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(f"Formato desconocido: {response_format} (usa {', '.join(RESPONSE_FORMATS)})")
+    payload = columnar_payload(result, fields, columnar=response_format != "json", precision=precision)
+    if response_format in ("json", "columnar"):
+        return FastJSONResponse(payload)
+    if response_format == "msgpack":
+        if msgpack is None:
+            raise ValueError("format=msgpack necesita el paquete msgpack")
+        return Response(msgpack.packb(payload, use_bin_type=True), media_type=MEDIA_TYPES["msgpack"])
+    if pa is None:
+        raise ValueError("format=arrow necesita el paquete pyarrow")
+    return Response(_arrow_bytes(payload), media_type=MEDIA_TYPES["arrow"])
+
+
+## Medición de tamaño y tiempo de codificación
+
+def _fake_result(n_comments: int) -> AnalysisResult:
+    return AnalysisResult("video000001", sample_records(n_comments), {})
+
+
+def measure_formats(n_comments: int = 10000, repeat: int = 5) -> Dict[str, Dict[str, float]]:
+    """
+    Bytes y ms de codificación: respuesta por defecto de FastAPI frente a los formatos compactos
+    """
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    result = _fake_result(n_comments)
+    no_flags = [f for f in COMMENT_FIELDS if f not in FLAG_FIELDS]
+    cases = {
+        "json (FastAPI)": lambda: JSONResponse(jsonable_encoder(result._build_response())).body,
+        "columnar": lambda: encode_prediction(result, "columnar").body,
+        "columnar sin is_*": lambda: encode_prediction(result, "columnar", no_flags).body,
+        "columnar sin is_*, precision=4": lambda: encode_prediction(result, "columnar", no_flags, 4).body,
+    }
+    if msgpack is not None:
+        cases["msgpack sin is_*"] = lambda: encode_prediction(result, "msgpack", no_flags, 4).body
+    if pa is not None:
+        cases["arrow"] = lambda: encode_prediction(result, "arrow").body
+
+    report = {}
+    for name, encode in cases.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            body = encode()
+        report[name] = {"bytes": len(body), "ms": (time.perf_counter() - start) * 1000 / repeat}
+    return report
+
+
+if __name__ == "__main__":
+    # python -m server.outils.compact_response --comments 10000
+    parser = argparse.ArgumentParser(description="Tamaño y coste de codificación de PredictionResponse")
+    parser.add_argument("--comments", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for name, row in measure_formats(args.comments, args.repeat).items():
+        print(f"{name:>32}: {row['bytes'] / 1024:9.1f} KiB  {row['ms']:8.1f} ms")
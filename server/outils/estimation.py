@@ -0,0 +1,170 @@
+import os
+import math
+import random
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from server.records import ScoredComments
+from server.outils.stats_engine import FLAG_KEYS
+
+# Modo estimación de predict_pipeline: en vídeos enormes no se puntúa todo para enseñar
+# porcentajes. Se descarga la población (hasta max_comments), se divide en estratos
+# (primer nivel / respuestas × franjas de tiempo de igual tamaño) y solo se limpian y
+# puntúan los comentarios de una muestra estratificada con asignación proporcional.
+# El tamaño de la muestra sale del margen de error pedido (peor caso p = 0.5, con
+# corrección de población finita), y cada proporción se devuelve con su intervalo de
+# confianza (estimador estratificado, aproximación normal).
+
+# Margen de error objetivo (en proporción: 0.03 = ±3 puntos) y nivel de confianza
+ESTIMATE_ERROR_BOUND = float(os.getenv("ESTIMATE_ERROR_BOUND", "0.03"))
+ESTIMATE_CONFIDENCE = float(os.getenv("ESTIMATE_CONFIDENCE", "0.95"))
+# Franjas de tiempo por tipo de comentario (estratos = 2 × ESTIMATE_TIME_STRATA como máximo)
+ESTIMATE_TIME_STRATA = int(os.getenv("ESTIMATE_TIME_STRATA", "4"))
+
+
+def z_value(confidence: float = ESTIMATE_CONFIDENCE) -> float:
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def sample_size(population: int, error_bound: float = ESTIMATE_ERROR_BOUND,
+                confidence: float = ESTIMATE_CONFIDENCE) -> int:
+    """
+    Comentarios a puntuar para estimar cualquier proporción con ese margen (peor caso p = 0.5)
+    """
+    if population <= 0:
+        return 0
+    n0 = z_value(confidence) ** 2 * 0.25 / error_bound ** 2
+    return min(population, math.ceil(n0 / (1 + (n0 - 1) / population)))
+
+
+def _stratum_keys(comments: List[Dict[str, Any]], time_strata: int) -> List[Tuple[str, int]]:
+    # Franjas de igual tamaño por orden de publicación (las fechas ISO ordenan como texto)
+    keys: List[Tuple[str, int]] = [("", 0)] * len(comments)
+    for kind in ("top", "reply"):
+        members = [i for i, c in enumerate(comments) if bool(c.get("isReply")) == (kind == "reply")]
+        dated = sorted((i for i in members if comments[i].get("publishedAtComment")),
+                       key=lambda i: str(comments[i]["publishedAtComment"]))
+        for rank, i in enumerate(dated):
+            keys[i] = (kind, rank * time_strata // len(dated))
+        for i in members:
+            if not comments[i].get("publishedAtComment"):
+                keys[i] = (kind, -1)     # sin fecha: estrato propio
+    return keys
+
+
+def draw_sample(comments: List[Dict[str, Any]], n: int, time_strata: int = ESTIMATE_TIME_STRATA,
+                seed: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """
+    Muestra estratificada de n comentarios (asignación proporcional, mínimo 2 por estrato).
+    Devuelve la muestra y, por estrato, su tamaño en la población y los comment_id elegidos.
+    """
+    rng = random.Random(seed)
+    groups: Dict[Tuple[str, int], List[int]] = {}
+    for i, key in enumerate(_stratum_keys(comments, time_strata)):
+        groups.setdefault(key, []).append(i)
+
+    total = len(comments)
+    strata: Dict[str, Dict[str, Any]] = {}
+    chosen: List[int] = []
+    for (kind, slot), members in sorted(groups.items()):
+        n_h = min(len(members), max(2, round(n * len(members) / total)))
+        picked = rng.sample(members, n_h)
+        chosen.extend(picked)
+        strata[f"{kind}:{'sin_fecha' if slot < 0 else slot}"] = {
+            "population": len(members),
+            "comment_ids": {comments[i].get("commentId") for i in picked},
+        }
+    chosen.sort()
+    return [comments[i] for i in chosen], strata
+
+
+def _interval(estimate: float, variance: float, z: float, scale: float = 1.0,
+              low: float = 0.0, high: float = 1.0) -> Dict[str, float]:
+    half = z * math.sqrt(max(variance, 0.0))
+    return {
+        "estimate": estimate * scale,
+        "lower": max(low, estimate - half) * scale,
+        "upper": min(high, estimate + half) * scale,
+        "margin": half * scale,
+    }
+
+
+def estimate_from_sample(records: ScoredComments, strata: Dict[str, Dict[str, Any]],
+                         confidence: float = ESTIMATE_CONFIDENCE,
+                         error_bound: float = ESTIMATE_ERROR_BOUND) -> Dict[str, Any]:
+    """
+    Estimaciones estratificadas con intervalo de confianza a partir de la muestra puntuada.
+    Los comentarios que la limpieza descarta o el modelo no puntúa reducen el n de su estrato.
+    """
+    z = z_value(confidence)
+    comment_ids = records.column("comment_id")
+    scored = records.scored
+    stratum_of = {cid: name for name, info in strata.items() for cid in info["comment_ids"]}
+    rows_by_stratum: Dict[str, List[int]] = {}
+    for i, cid in enumerate(comment_ids):
+        if scored[i] and cid in stratum_of:
+            rows_by_stratum.setdefault(stratum_of[cid], []).append(i)
+
+    # Solo cuentan los estratos con muestra: su peso se reparte sobre la población cubierta
+    covered = {name: rows for name, rows in rows_by_stratum.items() if rows}
+    population = sum(info["population"] for info in strata.values())
+    covered_population = sum(strata[name]["population"] for name in covered)
+
+    sentiment_types = sorted({t or "neutral" for t in records.column("sentiment_type")})
+    scores = np.asarray([np.nan if v is None else v for v in records.column("sentiment_score")], dtype=float)
+
+    def stratified(values: np.ndarray, proportion: bool = True) -> Tuple[float, float]:
+        # Media estratificada y su varianza: Σ W_h·ȳ_h y Σ W_h²·(1 - n_h/N_h)·s_h²/n_h
+        mean, variance = 0.0, 0.0
+        for name, rows in covered.items():
+            weight = strata[name]["population"] / covered_population
+            sample = values[rows]
+            sample = sample[~np.isnan(sample)]
+            if not len(sample):
+                continue
+            n_h, n_pop = len(sample), strata[name]["population"]
+            mean_h = float(sample.mean())
+            if proportion:
+                s2 = mean_h * (1 - mean_h) * n_h / (n_h - 1) if n_h > 1 else 0.25
+            else:
+                s2 = float(sample.var(ddof=1)) if n_h > 1 else 1.0
+            mean += weight * mean_h
+            variance += weight ** 2 * (1 - n_h / n_pop) * s2 / n_h
+        return mean, variance
+
+    if not covered:
+        return {"population": population, "sample_size": 0, "confidence": confidence,
+                "error_bound": error_bound, "achieved_margin": None}
+
+    flags = records.flags.astype(float)
+    toxic, toxic_var = stratified(records.flags.any(axis=1).astype(float))
+    categories = {}
+    for j, key in enumerate(FLAG_KEYS):
+        rate, var = stratified(flags[:, j])
+        categories[key] = _interval(rate, var, z, scale=100)
+    sentiment = {}
+    types = np.asarray([t or "neutral" for t in records.column("sentiment_type")])
+    for stype in sentiment_types:
+        rate, var = stratified((types == stype).astype(float))
+        sentiment[stype] = _interval(rate, var, z, scale=100)
+    mean_score, score_var = stratified(scores, proportion=False)
+
+    percentage_toxicity = _interval(toxic, toxic_var, z, scale=100)
+    margins = [percentage_toxicity["margin"]] + [c["margin"] for c in categories.values()] + \
+              [s["margin"] for s in sentiment.values()]
+    return {
+        "population": population,
+        "sample_size": sum(len(rows) for rows in covered.values()),
+        "confidence": confidence,
+        "error_bound": error_bound,
+        # Mayor semiamplitud obtenida (en puntos porcentuales): comparable con error_bound·100
+        "achieved_margin": max(margins),
+        "percentage_toxicity": percentage_toxicity,
+        "toxicity_rates": categories,
+        "sentiment_distribution": sentiment,
+        "mean_sentiment_score": _interval(mean_score, score_var, z, low=-1.0, high=1.0),
+        "strata": {name: {"population": info["population"], "sampled": len(covered.get(name, []))}
+                   for name, info in strata.items()},
+    }
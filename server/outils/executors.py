@@ -0,0 +1,52 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from server.outils.profiling import bind, PROFILING_ENABLED
+
+# Pools dedicados del análisis, separados del threadpool de AnyIO que atiende las rutas:
+#   - io: descarga de comentarios de YouTube y escrituras durables en BD (esperas de red)
+#   - cpu: limpieza (pandas/spaCy) e inferencia (torch), con tamaño acotado para no
+#     saturar la CPU; lo comparten las peticiones interactivas y los jobs bulk
+#   - job: hilo conductor de cada job de análisis (/api/jobs/); los que no caben esperan
+#     en la cola del pool en estado "queued"
+# Así un análisis largo no ocupa hilos de la app y /api/, /api/stats/ o las lecturas
+# de estadísticas siguen respondiendo mientras tanto.
+
+ANALYSIS_CPU_WORKERS = int(os.getenv("ANALYSIS_CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+ANALYSIS_IO_WORKERS = int(os.getenv("ANALYSIS_IO_WORKERS", "16"))
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "4"))
+
+cpu_executor = ThreadPoolExecutor(max_workers=ANALYSIS_CPU_WORKERS, thread_name_prefix="analysis-cpu")
+io_executor = ThreadPoolExecutor(max_workers=ANALYSIS_IO_WORKERS, thread_name_prefix="analysis-io")
+job_executor = ThreadPoolExecutor(max_workers=ANALYSIS_JOB_WORKERS, thread_name_prefix="analysis-job")
+
+
+def _task(fn, args, kwargs):
+    task = functools.partial(fn, *args, **kwargs)
+    # Petición perfilada (server/outils/profiling.py): el hilo del pool se muestrea mientras trabaja
+    return bind(task) if PROFILING_ENABLED else task
+
+
+def run_cpu_sync(fn, *args, **kwargs):
+    """
+    Ejecuta fn en el pool de CPU y espera el resultado (desde código síncrono, p. ej. jobs bulk)
+    """
+    return cpu_executor.submit(fn, *args, **kwargs).result()
+
+
+async def run_cpu(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor, _task(fn, args, kwargs))
+
+
+async def run_io(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, _task(fn, args, kwargs))
+
+
+def shutdown_executors():
+    job_executor.shutdown(wait=False, cancel_futures=True)
+    io_executor.shutdown(wait=False, cancel_futures=True)
+    cpu_executor.shutdown(wait=True)
@@ -0,0 +1,130 @@
+import json
+import math
+import argparse
+import datetime
+import random
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson  # dependencia opcional: sin ella se usa json de la librería estándar
+except ImportError:
+    orjson = None
+
+# Respuesta JSON rápida para los endpoints de lectura masiva (listados de comentarios y
+# de video_statistics). Devolver FastJSONResponse(...) desde el endpoint evita además el
+# paso de jsonable_encoder que FastAPI aplica a los dicts devueltos: los datos ya vienen
+# de la BD con tipos JSON nativos.
+
+
+def _default(value: Any) -> Any:
+    # Igual que orjson: escalares de numpy como números, fechas en ISO 8601 y el resto como texto
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def _without_nan(content: Any) -> Any:
+    # NaN/Infinity no son JSON válido: null, como orjson
+    if isinstance(content, (float, np.floating)):
+        return content if math.isfinite(content) else None
+    if isinstance(content, dict):
+        return {key: _without_nan(value) for key, value in content.items()}
+    if isinstance(content, (list, tuple)):
+        return [_without_nan(value) for value in content]
+    return content
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    try:
+        text = json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default, allow_nan=False)
+    except ValueError:
+        # Solo si hay NaN: recorrer todo el contenido cuesta, así que no se hace de antemano
+        text = json.dumps(_without_nan(content), ensure_ascii=False, separators=(",", ":"), default=_default)
+    return text.encode("utf-8")
+
+
+def loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+## Medición de CPU en JSON del listado /api/video-statistics/all
+
+def _fake_stats(n_videos: int, as_text: bool) -> List[Dict[str, Any]]:
+    rng = random.Random(0)
+    categories = ["toxic", "hatespeech", "abusive", "provocative", "racist", "obscene",
+                  "threat", "religious_hate", "nationalist", "sexist", "homophobic", "radicalism"]
+    rows = []
+    for i in range(n_videos):
+        distribution = {"positive": rng.randint(0, 500), "neutral": rng.randint(0, 500), "negative": rng.randint(0, 500)}
+        toxicity = {c: {"true": rng.randint(0, 50), "false": rng.randint(0, 500)} for c in categories}
+        rows.append({
+            "id": i, "video_id": f"video{i:06d}", "created_at": "2025-07-10T12:00:00+00:00",
+            "total_comments": rng.randint(1, 1000), "percentage_toxicity": rng.random() * 100,
+            "mean_likes": rng.random() * 20, "max_likes": rng.randint(0, 5000), "total_likes": rng.randint(0, 20000),
+            "self_promotional": rng.randint(0, 10), "mean_sentiment_score": rng.uniform(-1, 1),
+            "sentiment_distribution": json.dumps(distribution) if as_text else distribution,
+            "toxicity_stats": json.dumps(toxicity) if as_text else toxicity,
+        })
+    return rows
+
+
+def measure_listing_cpu(n_videos: int = 1000, repeat: int = 20) -> Dict[str, float]:
+    """
+    ms de CPU por petición: antes (texto JSON -> json.loads por fila -> jsonable_encoder + json)
+    y después (JSONB ya decodificado -> FastJSONResponse)
+    """
+    text_rows = _fake_stats(n_videos, as_text=True)
+    native_rows = _fake_stats(n_videos, as_text=False)
+
+    def before():
+        parsed = []
+        for row in text_rows:
+            stats = row.copy()
+            stats["sentiment_distribution"] = json.loads(stats["sentiment_distribution"])
+            stats["toxicity_stats"] = json.loads(stats["toxicity_stats"])
+            parsed.append(stats)
+        body = {"total_videos": len(parsed), "video_statistics": parsed, "source": "video_statistics_table"}
+        return JSONResponse(jsonable_encoder(body)).body
+
+    def after():
+        body = {"total_videos": len(native_rows), "video_statistics": native_rows, "source": "video_statistics_table"}
+        return FastJSONResponse(body).body
+
+    results = {}
+    for name, fn in (("before_ms", before), ("after_ms", after)):
+        fn()
+        started = time.process_time()
+        for _ in range(repeat):
+            fn()
+        results[name] = round((time.process_time() - started) / repeat * 1000, 2)
+    results["speedup"] = round(results["before_ms"] / results["after_ms"], 1) if results["after_ms"] else 0.0
+    results["encoder"] = "orjson" if orjson is not None else "json"
+    return results
+
+
+if __name__ == "__main__":
+    # python -m server.outils.fast_json --videos 1000
+    parser = argparse.ArgumentParser(description="CPU de JSON por petición del listado de estadísticas")
+    parser.add_argument("--videos", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(f"📏 {measure_listing_cpu(args.videos, args.repeat)}")
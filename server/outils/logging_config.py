@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import logging
+from datetime import datetime, timezone
+
+# Logs de la app en lugar de print(): nivel por LOG_LEVEL (DEBUG muestra el detalle por página
+# de YouTube, por trozo de BD o los logits del modelo; INFO, el resumen de cada etapa) y formato
+# por LOG_FORMAT: "text" para leerlos en consola o "json" (una línea por evento, con los campos
+# pasados en extra=) para el agregador de logs en producción.
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+
+# Atributos propios de LogRecord: el resto son los campos estructurados de extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        event.update({k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS})
+        if record.exc_info:
+            event["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+_configured = False
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """
+    Handler único en el logger raíz (también recoge los logs de etl/ y del loader del modelo).
+    Si la app ya configuró logging (uvicorn --log-config, tests) solo se ajusta el nivel.
+    """
+    global _configured
+    root = logging.getLogger()
+    if not _configured and not root.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JSONFormatter() if fmt == "json" else
+                             logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        root.addHandler(handler)
+    root.setLevel(level)
+    _configured = True
+
+
+def get_logger(name: str) -> logging.Logger:
+    if not _configured:
+        configure_logging()
+    return logging.getLogger(name)
@@ -0,0 +1,222 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Métricas de la app en formato de texto de Prometheus (GET /metrics), sin dependencias:
+# latencia por etapa (página de YouTube, cada paso de limpieza, tokenización, extracción de
+# features, forward, estadísticas, escrituras en BD), comentarios procesados, errores por etapa
+# y tamaño de los lotes del modelo. Los aciertos de las cachés y la cola de escritura ya llevan
+# sus contadores: se leen al servir /metrics (collectors) en lugar de duplicarlos aquí.
+
+# Segundos: de una página de YouTube o un paso de limpieza hasta un análisis entero
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BATCH_SIZE_BUCKETS = (1, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por serie: cuentas por bucket (no acumuladas, +Inf al final), suma y número de observaciones
+        self._series: Dict[Labels, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(str(labels[name]) for name in self.labelnames))
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+# Collector: función que devuelve (nombre, tipo, ayuda, [(labels, valor)]) leyendo un estado ajeno
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Collector] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Collector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception:
+                # Un collector roto no puede tumbar /metrics entero
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} "
+                                 f"{_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "sentiment_analyzer_stage_seconds",
+    "Latencia de cada etapa del análisis (youtube_fetch_page, tokenization, feature_extraction, "
+    "forward, stats, db_write, ...)",
+    ["stage"],
+))
+CLEANING_STEP_SECONDS = registry.register(Histogram(
+    "sentiment_analyzer_cleaning_step_seconds",
+    "Latencia de cada paso de la limpieza de comentarios",
+    ["step"],
+))
+MODEL_BATCH_SIZE = registry.register(Histogram(
+    "sentiment_analyzer_model_batch_size",
+    "Textos por forward del modelo",
+    buckets=BATCH_SIZE_BUCKETS,
+))
+COMMENTS_PROCESSED = registry.register(Counter(
+    "sentiment_analyzer_comments_processed_total",
+    "Comentarios o textos puntuados por el modelo",
+    ["source"],
+))
+ERRORS = registry.register(Counter(
+    "sentiment_analyzer_errors_total",
+    "Errores por etapa (excepciones y filas que el modelo o la BD no pudieron procesar)",
+    ["stage"],
+))
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """
+    Mide una etapa en STAGE_SECONDS y cuenta en ERRORS las excepciones que la atraviesan
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+
+def observe_model_stage(stage: str, seconds: float, batch_size: int):
+    # Hook del loader del modelo (models/ no depende del servidor): una llamada por etapa y lote
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    if stage == "forward":
+        MODEL_BATCH_SIZE.observe(batch_size)
+
+
+def observe_fetch_page(seconds: float, items: int):
+    # Hook de etl/youtube_extraction.py: una llamada por página de commentThreads
+    STAGE_SECONDS.observe(seconds, stage="youtube_fetch_page")
+
+
+def cache_collector(caches: Dict[str, Callable[[], Any]]) -> Collector:
+    """
+    Contadores de las cachés con hits/misses (y coalesced) propios, leídos al servir /metrics.
+    Una sola familia para todas: {nombre: función que devuelve la caché actual}
+    """
+    def collect():
+        samples = []
+        for name, get_cache in caches.items():
+            cache = get_cache()
+            samples.append(({"cache": name, "result": "hit"}, cache.hits))
+            samples.append(({"cache": name, "result": "miss"}, cache.misses))
+            if hasattr(cache, "coalesced"):
+                samples.append(({"cache": name, "result": "coalesced"}, cache.coalesced))
+        return [("sentiment_analyzer_cache_requests_total", "counter",
+                 "Consultas a la caché por resultado", samples)]
+    return collect
+
+
+def render_metrics() -> str:
+    return registry.render()
@@ -1,228 +1,319 @@
+import logging
+import os
+import numpy as np
 import pandas as pd
+import etl.youtube_extraction as youtube_extraction
 from etl.youtube_extraction import extract_video_id, fetch_comment_threads
 from server.outils.cleaning_pipeline import clean_youtube_data
 import sys
 from pathlib import Path
-from server.schemas import Comment, PredictionStats, PredictionResponse
-from server.database.save_comments import save_comments_batch
+from server.schemas import PredictionResponse
+from server.records import ScoredComments, AnalysisResult
+from server.outils.stats_engine import compute_complete_stats, merge_complete_stats
+from server.database.save_comments import (
+    write_comments, get_video_statistics, get_video_sync_state, get_known_threads, rebuild_video_statistics,
+)
+from server.database.write_queue import write_queue
+from server.outils.executors import run_cpu, run_io, run_cpu_sync
+from server.outils.estimation import sample_size, draw_sample, estimate_from_sample, ESTIMATE_ERROR_BOUND
+from server.outils.admission import ANALYSIS_MAX_COMMENTS
+from server.outils.logging_config import get_logger
+from server.outils.profiling import torch_operator_timings
+from server.outils.metrics import stage_timer, observe_model_stage, observe_fetch_page, COMMENTS_PROCESSED, ERRORS
 from typing import List, Dict, Any
 
+# Espera máxima a la cola de escritura antes de un análisis incremental (ocupa un hilo de I/O)
+INCREMENTAL_FLUSH_TIMEOUT = float(os.getenv("INCREMENTAL_FLUSH_TIMEOUT", "10"))
+
 MODEL_DIR = Path("models/bilstm_advanced")
 sys.path.append(str(MODEL_DIR))
 
 from multitoxic_v1_0_20250709_003639_loader import MultitoxicLoader
 
-print("🔄 Inicializando modelo MULTITOXIC...")
+logger = get_logger(__name__)
+
+logger.info("🔄 Inicializando modelo MULTITOXIC...")
 try:
     model_loader = MultitoxicLoader(MODEL_DIR)
     model_loader.load_model()
-    print("✅ Modelo MULTITOXIC cargado exitosamente")
+    # Tokenización, extracción de features y forward de cada lote, en /metrics
+    model_loader.stage_observer = observe_model_stage
+    logger.info("✅ Modelo MULTITOXIC cargado exitosamente")
 except Exception as e:
-    print(f"❌ Error cargando modelo MULTITOXIC: {e}")
+    logger.error(f"❌ Error cargando modelo MULTITOXIC: {e}")
+    ERRORS.inc(stage="model_load")
     model_loader = None
 
+# Latencia de cada página de YouTube, en /metrics
+youtube_extraction.page_observer = observe_fetch_page
+
 TOXICITY_FIELDS = [
     "toxic", "hatespeech", "abusive", "provocative", "racist", 
     "obscene", "threat", "religious_hate", "nationalist", 
     "sexist", "homophobic", "radicalism"
 ]
 
-def _create_comment_from_error(video_id: str, row: pd.Series) -> Comment:
-    return Comment(
-        video_id=video_id,
-        text=row["text"],
-        # Todos los Optional van a None automáticamente por Pydantic
-        sentiment_type=row.get("sentiment_type", "neutral"),
-        sentiment_score=row.get("sentiment_score", 0.0),
-        sentiment_intensity=row.get("sentiment_intensity", "weak"), 
-        total_likes_comment=row.get("like_count_comment", 0),
-    )
-
-def _calculate_toxicity_stats(comments: List[Comment]) -> Dict[str, PredictionStats]:
-    """
-    Calcula estadísticas de toxicidad usando objetos Comment
-    """
-    total_comments = len(comments)
-    stats = {}
-    
-    for field in TOXICITY_FIELDS:
-        # ✅ USAR ATRIBUTOS DE OBJETOS COMMENT
-        positives = sum(1 for c in comments if getattr(c, f"is_{field}", False))
-        stats[f"is_{field}"] = PredictionStats(
-            count=positives,
-            percentage=(positives / total_comments * 100) if total_comments else 0
-        )
-    
-    return stats
-
-
-def _calculate_sentiment_stats(comments: List[Comment]) -> Dict[str, Any]:
-  
-    # ✅ USAR ATRIBUTOS DE OBJETOS COMMENT
-    sentiment_scores = [c.sentiment_score for c in comments 
-                       if c.sentiment_score is not None]  # ← ANTES: sentiment_intensity
-    mean_sentiment_score = (sum(sentiment_scores) / len(sentiment_scores) 
-                           if sentiment_scores else 0.0)  # ← ANTES: mean_sentiment_intensity
-    
-    sentiment_counts = {}
-    for c in comments:
-        stype = c.sentiment_type or "neutral"
-        sentiment_counts[stype] = sentiment_counts.get(stype, 0) + 1
-    
-
-    return {
-        "mean_sentiment_score": mean_sentiment_score,
-        "sentiment_types_distribution": sentiment_counts,
-    }
+def _model_order():
+    # Columnas de predict_batch (orden de class_names del modelo) -> orden de TOXICITY_FIELDS
+    class_names = model_loader.config["classes"]["class_names"]
+    order = [class_names.index(field) for field in TOXICITY_FIELDS]
+    thresholds = np.array([model_loader.config["thresholds"][field] for field in TOXICITY_FIELDS])
+    return order, thresholds
+
+def model_probabilities(texts: List[str]):
+    """
+    Probabilidades [N, 12] en float64 (orden de TOXICITY_FIELDS) y detecciones (> umbral).
+    Los textos que el modelo no pudo procesar quedan en NaN y sin detecciones.
+    """
+    order, thresholds = _model_order()
+    # En peticiones perfiladas, tiempos por operador de torch de los forward
+    with torch_operator_timings():
+        probabilities = model_loader.predict_batch(texts)[:, order].astype(np.float64)
+    return probabilities, probabilities > thresholds
+
+def _to_iso(value) -> str | None:
+    # pandas Timestamp / NaT -> ISO string serializable para la BD
+    if value is None or pd.isna(value):
+        return None
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
 
-def _calculate_basic_stats(comments: List[Comment]) -> Dict[str, Any]:
-    """
-    Calcula estadísticas básicas que van directamente a la tabla video_statistics
-    """
-    total_comments = len(comments)
-    
-    # Likes
-    total_likes = sum(c.total_likes_comment or 0 for c in comments)
-    mean_likes = total_likes / total_comments if total_comments else 0
-    max_likes = max((c.total_likes_comment or 0 for c in comments), default=0)
-    
-    # Self promotion
-    # self_promotion = sum(1 for c in comments if c.is_self_promotional)
-    
-    # Toxicity percentage
-    tagged_comments = sum(1 for c in comments 
-                         if any(getattr(c, f"is_{field}", False) for field in TOXICITY_FIELDS))
-    percentage_toxicity = (tagged_comments / total_comments * 100) if total_comments else 0
-    
-    return {
-        "total_comments": total_comments,
-        "total_likes": total_likes,
-        "mean_likes": mean_likes,
-        "max_likes": max_likes,
-        # "self_promotion": self_promotion,
-        "percentage_toxicity": percentage_toxicity
+def _none_if_nan(value):
+    # parent_comment_id es NaN en los comentarios de primer nivel tras pasar por pandas
+    return None if value is None or pd.isna(value) else value
+
+def _int_or_zero(value) -> int:
+    return 0 if value is None or pd.isna(value) else int(value)
+
+def _score_comments(df_clean: pd.DataFrame, video_id: str) -> ScoredComments:
+    """
+    Predicción por lotes del DataFrame limpio con MULTITOXIC. Sin un Comment por fila:
+    las columnas del DataFrame y la matriz de probabilidades pasan tal cual a ScoredComments.
+    """
+    n_comments = len(df_clean)
+
+    def column(name, default=None):
+        return df_clean[name].tolist() if name in df_clean.columns else [default] * n_comments
+
+    probabilities, detected = model_probabilities(column("text"))
+    COMMENTS_PROCESSED.inc(n_comments, source="youtube")
+    failed = int(np.isnan(probabilities[:, 0]).sum()) if n_comments else 0
+    if failed:
+        # Comentarios sin predicciones (None en la respuesta y en BD), como antes por fila
+        ERRORS.inc(failed, stage="prediction")
+        logger.warning(f"⚠️ Error prediciendo {failed} comentarios, se guardan sin predicciones",
+                       extra={"video_id": video_id, "failed": failed})
+
+    columns = {
+        "video_id": [video_id] * n_comments,
+        "comment_id": column("comment_id"),
+        "thread_id": column("thread_id"),
+        "parent_comment_id": [_none_if_nan(v) for v in column("parent_comment_id")],
+        "published_at_comment": [_to_iso(v) for v in column("published_at_comment")],
+        "text": column("text"),
+        # Análisis de sentimientos (del cleaning pipeline)
+        "sentiment_type": column("sentiment_type", "neutral"),
+        "sentiment_score": column("sentiment_score", 0.0),
+        "sentiment_intensity": column("sentiment_intensity", "weak"),
+        "total_likes_comment": [_int_or_zero(v) for v in column("like_count_comment", 0)],
+        "is_self_promotional": [bool(v) for v in column("is_self_promotional", False)],
     }
+    return ScoredComments(columns, probabilities, detected)
 
-#Vamos a poner el orden del pipeline para las predicciones: 
-def predict_pipeline(youtube_url_or_id: str, max_comments: int = 100) -> PredictionResponse:
-    # 1. Extracción
-    video_id = extract_video_id(youtube_url_or_id)
-    comments = fetch_comment_threads(video_id, max_total=max_comments)
-    
-    if not comments:
-        return PredictionResponse(
-            video_id=video_id,
-            total_comments=0,
-            stats={},
-            complete_stats={},
-            comments=[]
-            
-        )
-    
+# Etapas del pipeline. predict_pipeline las encadena de forma síncrona (jobs bulk, CLI) y
+# predict_pipeline_async las reparte entre los pools de server/outils/executors.py (API).
+
+def _fetch_stage(video_id: str, max_comments: int, incremental: bool):
+    """
+    1. Extracción (I/O): comentarios de YouTube y, en modo incremental, el estado previo
+    """
+    previous_stats = None
+    options = {}
+    if incremental:
+        # El estado previo tiene que incluir lo que aún esté en la cola de escritura: sin eso
+        # se leería un estado sin esas filas y se volverían a sumar
+        if not write_queue.flush(timeout=INCREMENTAL_FLUSH_TIMEOUT):
+            raise Exception(f"La cola de escritura no se vació a tiempo para el análisis incremental de {video_id}")
+        # Solo comentarios nuevos desde el último análisis (order=time hasta llegar a un hilo
+        # conocido) y respuestas nuevas a los hilos conocidos de esa página
+        sync_state = get_video_sync_state(video_id)
+        previous_stats = get_video_statistics(video_id) if sync_state["has_comments"] else None
+        if previous_stats and previous_stats.get("needs_rebuild"):
+            # Fila anterior a los resúmenes: no se puede sumar, se recalcula antes (escritura)
+            if rebuild_video_statistics(video_id) is None:
+                raise Exception(f"No se pudieron recalcular las estadísticas de {video_id}")
+            previous_stats = get_video_statistics(video_id)
+        options = {
+            "order": "time",
+            "known_threads": lambda thread_ids: get_known_threads(video_id, thread_ids),
+            "since": sync_state["last_published_at"],
+        }
+    # Descarga completa (cada página, aparte, en youtube_fetch_page)
+    with stage_timer("youtube_fetch"):
+        comments = fetch_comment_threads(video_id, max_total=max_comments, **options)
+    return comments, previous_stats
+
+
+def _clean_stage(comments: List[Dict[str, Any]]):
+    """
+    2-4. DataFrame, limpieza y comprobación del modelo (CPU)
+    """
     # 2. Guardar en DataFrame EN MEMORIA 
     df = pd.DataFrame(comments)
 
-    # 3. Función de limpieza
-    df_clean = clean_youtube_data(df)
+    # 3. Función de limpieza (cada paso, en /metrics)
+    with stage_timer("cleaning"):
+        df_clean = clean_youtube_data(df)
 
-    print(f"🔍 Columnas después de cleaning: {df_clean.columns.tolist()}")
-    print(f"🔍 Sample like_count_comment: {df_clean['like_count_comment'].head().tolist()}")
-    print(f"🔍 Total likes en DataFrame: {df_clean['like_count_comment'].sum()}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"🔍 Columnas después de cleaning: {df_clean.columns.tolist()}")
+        logger.debug(f"🔍 Sample like_count_comment: {df_clean['like_count_comment'].head().tolist()}")
+        logger.debug(f"🔍 Total likes en DataFrame: {df_clean['like_count_comment'].sum()}")
     # 4. Verificar que el modelo esté cargado
     if not model_loader:
         raise Exception("Modelo MULTITOXIC no disponible")
-    
-    self_promotional_count = df_clean['is_self_promotional'].sum() if 'is_self_promotional' in df_clean.columns else 0
-    
-    # 5. Predicción fila por fila del DataFrame
-    enriched_comments: List[Comment] = []        
-    for _, row in df_clean.iterrows():  
-        try:
-            # Predicción individual con MULTITOXIC
-            prediction = model_loader.predict(
-                row["text"], 
-                return_probabilities=True, 
-                return_categories=False
-            )
-            
-            # Extraer resultados del modelo
-            probs = prediction.get("probabilities", {})
-            detected_types = prediction.get("detected_types", [])
-
-            # Construir comentario enriquecido
-            comment_obj = Comment(
-                video_id=video_id,
-                text=row["text"],
-                # USAR DICT COMPREHENSION PARA PROBABILIDADES
-                **{f"{field}_probability": probs.get(field, 0.0) for field in TOXICITY_FIELDS},
-                # USAR DICT COMPREHENSION PARA BOOLEANOS
-                **{f"is_{field}": field in detected_types for field in TOXICITY_FIELDS},
-                # Análisis de sentimientos (del cleaning pipeline)
-                sentiment_type=row.get("sentiment_type"),
-                sentiment_score=row.get("sentiment_score"),
-                sentiment_intensity=row.get("sentiment_intensity"), 
-                total_likes_comment=row.get("like_count_comment", 0),
-            )
-            enriched_comments.append(comment_obj)
-
-        except Exception as e:
-            print(f"⚠️ Error prediciendo comentario: {e}")
-            # Comentario sin predicciones en caso de error
-            error_comment = _create_comment_from_error(video_id, row)
-            enriched_comments.append(error_comment)
-
-    # 6. Calcular estadísticas desde los comentarios enriquecidos
-    toxicity_stats = _calculate_toxicity_stats(enriched_comments)
-    sentiment_stats = _calculate_sentiment_stats(enriched_comments)
-    basic_stats = _calculate_basic_stats(enriched_comments)
-    stats_dict = {k: {"count": v.count, "percentage": v.percentage} 
-                  for k, v in toxicity_stats.items()}
-
-
-    complete_stats = {
-        # Campos directos para video_statistics
-        "total_comments": basic_stats["total_comments"],
-        "mean_likes": basic_stats["mean_likes"],
-        "max_likes": basic_stats["max_likes"],
-        "total_likes": basic_stats["total_likes"],
-        "self_promotional": int(self_promotional_count), 
-        "percentage_toxicity": basic_stats["percentage_toxicity"],
-        
-        # Campos JSON para video_statistics
-        "sentiment_distribution": sentiment_stats["sentiment_types_distribution"],
-        "toxicity_stats": {
-            f"is_{field}": {
-                "true": toxicity_stats[f"is_{field}"].count, 
-                "false": len(enriched_comments) - toxicity_stats[f"is_{field}"].count
-            } for field in TOXICITY_FIELDS
-        },
-        "mean_sentiment_score": sentiment_stats["mean_sentiment_score"],
+    return df_clean
+
+
+def _score_stage(df_clean: pd.DataFrame, video_id: str):
+    """
+    5-6. Predicción y estadísticas de un DataFrame limpio (o de un trozo) (CPU)
+    """
+    # 5. Predicción por lotes del DataFrame
+    with stage_timer("prediction"):
+        records = _score_comments(df_clean, video_id)
+
+    # 6. Calcular estadísticas desde los comentarios puntuados
+    with stage_timer("stats"):
+        complete_stats = compute_complete_stats(records)
+    return records, complete_stats
+
+
+def _analyze_stage(comments: List[Dict[str, Any]], video_id: str, incremental: bool,
+                   previous_stats: Dict[str, Any] | None):
+    """
+    2-6. Limpieza, predicción y estadísticas (CPU)
+    """
+    df_clean = _clean_stage(comments)
+    records, complete_stats = _score_stage(df_clean, video_id)
+    if incremental:
+        # Se suman los nuevos comentarios a los agregados ya guardados del video
+        complete_stats = merge_complete_stats(previous_stats, complete_stats)
+    return records, complete_stats
+
+
+def _persist_stage(video_id: str, records: ScoredComments, durable: bool) -> str:
+    """
+    7. Guardar comentarios en BD: en la cola write-behind o, con durable, ya.
+    video_statistics se actualiza al escribirlos, sumando el resumen de lo escrito
+    """
+    if not durable:
+        write_queue.enqueue_comments(records)
+        logger.info(f"📥 {len(records)} comentarios encolados para guardar en segundo plano",
+                    extra={"video_id": video_id, "comments": len(records)})
+        return "queued"
+
+    # Durabilidad síncrona: si la BD falla, la petición falla en lugar de ocultar el error
+    logger.info(f"🔄 Guardando {len(records)} comentarios en BD...")
+    # Filas sacadas de las columnas, sin pasar por Comment: son datos del propio pipeline
+    report = write_comments(records, fold_statistics=True)
+    if report.failed_chunks:
+        raise Exception(f"No se pudieron guardar {len(report.failed_rows)} comentarios en BD")
+    # Comentarios guardados pero resumen sin actualizar: un reintento los saltaría como "sin
+    # cambios", así que se recalcula ya y, si tampoco se puede, la petición falla
+    stale = [v for v in report.stale_statistics if rebuild_video_statistics(v) is None]
+    if stale:
+        raise Exception(f"No se pudieron actualizar las estadísticas de {', '.join(stale)}")
+    logger.info(f"✅ {report.rows_written} comentarios y estadísticas del video guardados en BD",
+                extra={"video_id": video_id, "comments": report.rows_written})
+    return "durable"
+
+
+def _estimate_stage(comments: List[Dict[str, Any]], video_id: str, error_bound: float):
+    """
+    Modo estimación: 2-6 solo sobre una muestra estratificada, más los intervalos de confianza
+    """
+    n = sample_size(len(comments), error_bound)
+    sample, strata = draw_sample(comments, n)
+    logger.info(f"🎯 Estimación: {len(sample)} de {len(comments)} comentarios (margen ±{error_bound * 100:.1f} puntos)",
+                extra={"video_id": video_id, "sample": len(sample), "population": len(comments)})
+    records, complete_stats = _analyze_stage(sample, video_id, False, None)
+    estimation = estimate_from_sample(records, strata, error_bound=error_bound)
+    # Escalar a un análisis completo: la misma petición sin estimate (como job si es grande)
+    estimation["full_analysis"] = {
+        "endpoint": "/api/CommentAnalyzer/" if len(comments) <= ANALYSIS_MAX_COMMENTS else "/api/jobs/CommentAnalyzer/",
+        "body": {"url_or_id": video_id, "max_comments": min(len(comments), ANALYSIS_MAX_COMMENTS), "estimate": False},
     }
+    return records, complete_stats, estimation
+
 
-    
-    # 7. Guardar comentarios en supabase
-    try:
-        print(f"🔄 Guardando {len(enriched_comments)} comentarios en BD...")
-        enriched_dicts = [comment.model_dump() for comment in enriched_comments]
-        saved_comments = save_comments_batch(enriched_dicts)
-        print(f"✅ {len(saved_comments)} comentarios guardados exitosamente en BD")
-    except Exception as e:
-        print(f"⚠️ Error guardando en BD (el pipeline continúa): {e}")
-
-    try:
-        from server.database.save_comments import save_video_statistics
-        print(f"📊 Guardando estadísticas del video...")
-        saved_stats = save_video_statistics(video_id, complete_stats)
-        print(f"✅ Estadísticas del video guardadas exitosamente")
-    except Exception as e:
-        print(f"⚠️ Error guardando estadísticas del video (el pipeline continúa): {e}")
+def _empty_result(video_id: str, incremental: bool, previous_stats: Dict[str, Any] | None) -> AnalysisResult:
+    complete_stats = merge_complete_stats(previous_stats, {}) if previous_stats else {}
+    return AnalysisResult(video_id, ScoredComments.empty(), complete_stats, incremental=incremental)
 
+
+#Vamos a poner el orden del pipeline para las predicciones: 
+def analyze_video(youtube_url_or_id: str, max_comments: int = 100, incremental: bool = False,
+                  persist: bool = True, durable: bool = False, estimate: bool = False,
+                  error_bound: float | None = None) -> AnalysisResult:
+    # persist=False: el llamador se encarga de guardar (p. ej. escrituras en lote de los jobs bulk)
+    # durable=False: se guarda en segundo plano (write_queue); True espera a la BD antes de responder
+    # estimate=True: puntúa solo una muestra y no guarda nada (una muestra dispersa rompería
+    # el análisis incremental y las estadísticas del vídeo); para escalar, repetir sin estimate
+    video_id = extract_video_id(youtube_url_or_id)
+    comments, previous_stats = _fetch_stage(video_id, max_comments, incremental and not estimate)
+    if not comments:
+        return _empty_result(video_id, incremental, previous_stats)
+
+    if estimate:
+        records, complete_stats, estimation = run_cpu_sync(
+            _estimate_stage, comments, video_id, error_bound or ESTIMATE_ERROR_BOUND)
+        return AnalysisResult(video_id, records, complete_stats, estimate=estimation)
+
+    # La CPU se reparte en el mismo pool acotado que usa la API
+    records, complete_stats = run_cpu_sync(_analyze_stage, comments, video_id, incremental, previous_stats)
+    persistence = _persist_stage(video_id, records, durable) if persist else None
     # 8. Resultado final
-    return PredictionResponse(
-        video_id=video_id,
-        total_comments=len(enriched_comments),
-        stats=stats_dict,
-        complete_stats=complete_stats,
-        comments=enriched_comments  
-    )
+    return AnalysisResult(video_id, records, complete_stats, incremental, persistence)
+
+
+async def analyze_video_async(youtube_url_or_id: str, max_comments: int = 100, incremental: bool = False,
+                              persist: bool = True, durable: bool = False, estimate: bool = False,
+                              error_bound: float | None = None) -> AnalysisResult:
+    """
+    Igual que analyze_video, sin bloquear el event loop ni el threadpool de las rutas
+    """
+    video_id = extract_video_id(youtube_url_or_id)
+    comments, previous_stats = await run_io(_fetch_stage, video_id, max_comments, incremental and not estimate)
+    if not comments:
+        return _empty_result(video_id, incremental, previous_stats)
+
+    if estimate:
+        records, complete_stats, estimation = await run_cpu(
+            _estimate_stage, comments, video_id, error_bound or ESTIMATE_ERROR_BOUND)
+        return AnalysisResult(video_id, records, complete_stats, estimate=estimation)
+
+    records, complete_stats = await run_cpu(_analyze_stage, comments, video_id, incremental, previous_stats)
+    persistence = None
+    if persist:
+        # Fuera del event loop: la escritura durable espera a la BD y encolar puede
+        # bloquear si la cola está llena (backpressure)
+        persistence = await run_io(_persist_stage, video_id, records, durable)
+    return AnalysisResult(video_id, records, complete_stats, incremental, persistence)
+
+
+def predict_pipeline(youtube_url_or_id: str, max_comments: int = 100, incremental: bool = False,
+                     persist: bool = True, durable: bool = False, estimate: bool = False,
+                     error_bound: float | None = None) -> PredictionResponse:
+    """
+    analyze_video con la respuesta de la API (un Comment validado por comentario)
+    """
+    return analyze_video(youtube_url_or_id, max_comments, incremental, persist, durable,
+                         estimate, error_bound).to_response()
+
 
+async def predict_pipeline_async(youtube_url_or_id: str, max_comments: int = 100, incremental: bool = False,
+                                 persist: bool = True, durable: bool = False, estimate: bool = False,
+                                 error_bound: float | None = None) -> PredictionResponse:
+    result = await analyze_video_async(youtube_url_or_id, max_comments, incremental, persist, durable,
+                                       estimate, error_bound)
+    return await run_cpu(result.to_response)
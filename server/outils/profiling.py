@@ -0,0 +1,290 @@
+import os
+import sys
+import time
+import hmac
+import json
+import uuid
+import random
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Perfilado bajo demanda de /api/CommentAnalyzer/: cuando un análisis concreto va lento, se
+# repite con la cabecera X-Profile (o ?profile=) con el token de admin, o se deja que
+# PROFILE_SAMPLE_RATE perfile una fracción de las peticiones. Mientras dura la petición, un
+# hilo muestrea cada PROFILE_INTERVAL segundos las pilas de los hilos de los pools que
+# trabajan para ella (profiler estadístico: vale para la limpieza con pandas/spaCy y para el
+# modelo) y los forward del modelo se miden además por operador de torch. El resultado se
+# guarda en PROFILE_DIR con un id: pilas colapsadas (entrada de flamegraph.pl / speedscope)
+# y un resumen JSON, que se consultan en /api/admin/profiles/{id}.
+# Sin PROFILE_ADMIN_TOKEN ni PROFILE_SAMPLE_RATE no se registra el middleware ni se envuelve
+# nada en los pools: coste cero cuando está desactivado.
+
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".cache/profiles")
+PROFILE_MAX_ARTIFACTS = int(os.getenv("PROFILE_MAX_ARTIFACTS", "50"))
+PROFILE_MAX_DEPTH = int(os.getenv("PROFILE_MAX_DEPTH", "128"))
+# Operadores de torch en el resumen (ordenados por tiempo propio)
+PROFILE_TORCH_TOP = int(os.getenv("PROFILE_TORCH_TOP", "30"))
+
+PROFILING_ENABLED = bool(PROFILE_ADMIN_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+# Sesión de la petición en curso (event loop) y del trabajo que ejecuta cada hilo de los pools
+_current: contextvars.ContextVar[Optional["ProfileSession"]] = contextvars.ContextVar("profile_session", default=None)
+_thread = threading.local()
+# El profiler de torch es global al proceso: un solo forward medido a la vez
+_torch_lock = threading.Lock()
+
+
+def is_admin(token: Optional[str]) -> bool:
+    return bool(PROFILE_ADMIN_TOKEN) and bool(token) and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN)
+
+
+def profile_trigger(header: Optional[str], query: Optional[str],
+                    sample_rate: float = PROFILE_SAMPLE_RATE) -> Optional[str]:
+    """
+    Motivo para perfilar la petición (header | query | sample) o None
+    """
+    if header is not None and is_admin(header):
+        return "header"
+    if query is not None and is_admin(query):
+        return "query"
+    if sample_rate > 0 and random.random() < sample_rate:
+        return "sample"
+    return None
+
+
+def _frame_name(code) -> str:
+    # Formato de pilas colapsadas: los ';' separan marcos y el último espacio, el número de muestras
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})".replace(";", ",")
+
+
+def _collapse(frame, max_depth: int = PROFILE_MAX_DEPTH) -> str:
+    names = []
+    while frame is not None and len(names) < max_depth:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class ProfileSession:
+    def __init__(self, trigger: str, label: str = "", interval: float = PROFILE_INTERVAL):
+        self.profile_id = uuid.uuid4().hex
+        self.trigger = trigger
+        self.label = label
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        # Operador de torch -> {count, cpu_time_us, self_cpu_time_us}, sumado entre forwards
+        self.torch_ops: Dict[str, Dict[str, float]] = {}
+        self.torch_passes = 0
+        self.threads: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self.started_at = 0.0
+        self._started = 0.0
+        self.duration = 0.0
+
+    # --- Ciclo de vida ---
+    def start(self) -> "ProfileSession":
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample, name=f"profiler-{self.profile_id[:8]}", daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join(timeout=1)
+        self.duration = time.perf_counter() - self._started
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                idents = list(self.threads)
+            if not idents:
+                continue
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[_collapse(frame)] += 1
+                    self.samples += 1
+
+    # --- Hilos que trabajan para la petición ---
+    def wrap(self, fn: Callable) -> Callable:
+        def profiled(*args, **kwargs):
+            ident = threading.get_ident()
+            with self._lock:
+                self.threads[ident] = self.threads.get(ident, 0) + 1
+            _thread.session = self
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _thread.session = None
+                with self._lock:
+                    self.threads[ident] -= 1
+                    if not self.threads[ident]:
+                        del self.threads[ident]
+        return profiled
+
+    def add_torch_ops(self, key_averages):
+        with self._lock:
+            self.torch_passes += 1
+            for event in key_averages:
+                op = self.torch_ops.setdefault(event.key, {"count": 0, "cpu_time_us": 0.0, "self_cpu_time_us": 0.0})
+                op["count"] += event.count
+                op["cpu_time_us"] += event.cpu_time_total
+                op["self_cpu_time_us"] += event.self_cpu_time_total
+
+    # --- Artefactos ---
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, top: int = 25) -> Dict[str, Any]:
+        self_samples: Counter = Counter()
+        total_samples: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            self_samples[frames[-1]] += count
+            for name in set(frames):
+                total_samples[name] += count
+
+        def share(items):
+            return [{"function": name, "samples": count,
+                     "percent": round(100 * count / self.samples, 2) if self.samples else 0.0}
+                    for name, count in items]
+
+        torch_ops = sorted(self.torch_ops.items(), key=lambda item: -item[1]["self_cpu_time_us"])
+        return {
+            "profile_id": self.profile_id,
+            "trigger": self.trigger,
+            "label": self.label,
+            "started_at": self.started_at,
+            "duration_seconds": round(self.duration, 6),
+            "interval_seconds": self.interval,
+            "samples": self.samples,
+            "top_self": share(self_samples.most_common(top)),
+            "top_total": share(total_samples.most_common(top)),
+            "torch": {
+                "forward_passes": self.torch_passes,
+                "operators": [{"operator": name, **{k: round(v, 3) for k, v in stats.items()}}
+                              for name, stats in torch_ops[:PROFILE_TORCH_TOP]],
+            },
+        }
+
+
+def active_session() -> Optional[ProfileSession]:
+    return _current.get()
+
+
+@contextmanager
+def profile_request(trigger: str, label: str = ""):
+    """
+    Perfila todo lo que la petición lance en los pools mientras dura el bloque
+    """
+    session = ProfileSession(trigger, label).start()
+    token = _current.set(session)
+    try:
+        yield session
+    finally:
+        _current.reset(token)
+        session.stop()
+
+
+def bind(fn: Callable) -> Callable:
+    """
+    Para run_cpu / run_io: si la petición se está perfilando, el hilo del pool se muestrea
+    mientras ejecuta fn. Sin sesión devuelve fn tal cual.
+    """
+    session = _current.get()
+    return fn if session is None else session.wrap(fn)
+
+
+@contextmanager
+def torch_operator_timings():
+    """
+    Tiempos por operador de torch de los forward que se ejecuten dentro del bloque, solo en
+    hilos que trabajan para una petición perfilada (torch es dependencia opcional aquí)
+    """
+    session = getattr(_thread, "session", None)
+    if session is None or not _torch_lock.acquire(blocking=False):
+        yield
+        return
+    try:
+        try:
+            from torch.profiler import profile, ProfilerActivity
+        except ImportError:
+            yield
+            return
+        with profile(activities=[ProfilerActivity.CPU]) as prof:
+            yield
+        session.add_torch_ops(prof.key_averages())
+    finally:
+        _torch_lock.release()
+
+
+class ProfileStore:
+    """
+    Artefactos en disco por id: {id}.folded (pilas colapsadas) y {id}.json (resumen).
+    Se conservan los PROFILE_MAX_ARTIFACTS más recientes.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR, max_artifacts: int = PROFILE_MAX_ARTIFACTS):
+        self.directory = Path(directory)
+        self.max_artifacts = max_artifacts
+
+    def _path(self, profile_id: str, suffix: str) -> Optional[Path]:
+        # Ids propios (hex): nada de rutas arbitrarias desde la URL
+        if not profile_id.isalnum():
+            return None
+        return self.directory / f"{profile_id}.{suffix}"
+
+    def save(self, session: ProfileSession, extra: Optional[Dict[str, Any]] = None) -> str:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        summary = {**session.summary(), **(extra or {})}
+        self._path(session.profile_id, "folded").write_text(session.folded(), encoding="utf-8")
+        self._path(session.profile_id, "json").write_text(json.dumps(summary, default=str), encoding="utf-8")
+        self._prune()
+        return session.profile_id
+
+    def _prune(self):
+        summaries = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for path in summaries[self.max_artifacts:]:
+            path.unlink(missing_ok=True)
+            path.with_suffix(".folded").unlink(missing_ok=True)
+
+    def list(self) -> List[Dict[str, Any]]:
+        if not self.directory.exists():
+            return []
+        profiles = []
+        for path in sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True):
+            try:
+                summary = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError):
+                continue
+            profiles.append({k: summary.get(k) for k in
+                             ("profile_id", "trigger", "label", "started_at", "duration_seconds", "samples", "status_code")})
+        return profiles
+
+    def get_summary(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        path = self._path(profile_id, "json")
+        if path is None or not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def get_folded(self, profile_id: str) -> Optional[str]:
+        path = self._path(profile_id, "folded")
+        if path is None or not path.exists():
+            return None
+        return path.read_text(encoding="utf-8")
+
+
+profile_store = ProfileStore()
@@ -0,0 +1,514 @@
+import os
+import hashlib
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from server.records import ScoredComments
+from server.database.storage import TOXICITY_CATEGORIES
+
+# Estadísticas de un análisis calculadas sobre las matrices de ScoredComments, en una sola
+# pasada por columna: conteos por categoría (flags.sum), comentarios con alguna categoría
+# (flags.any), co-ocurrencias (flagsᵀ · flags), likes y sentimiento como arrays de numpy.
+#
+# Se guardan como StatsSummary: solo conteos y sumas (también de cuadrados), que se pueden
+# sumar y restar. Un lote nuevo se incorpora con trabajo O(lote), los resúmenes de varios
+# vídeos se combinan en uno de canal o global sin leer comentarios, y un borrado resta las
+# filas borradas. complete_stats (medias, porcentajes...) se deriva siempre del resumen.
+#
+# Las distribuciones van en el mismo resumen con tamaño fijo, sin importar cuántos comentarios
+# haya: histogramas de bins fijos (cada probabilidad y sentiment_score), que se suman y restan
+# igual que los conteos, y una muestra bottom-k para el scatter: los SAMPLE_SIZE comentarios
+# con menor hash de su comment_id. Es uniforme, la unión de dos muestras es la muestra de la
+# unión, y un borrado solo puede afectar a los k menores hashes de lo borrado.
+
+FLAG_KEYS = [f"is_{category}" for category in TOXICITY_CATEGORIES]
+SUMMARY_VERSION = 2
+
+# Bins fijos: cambiarlos invalida los histogramas ya guardados (se descartan al leerlos)
+PROBABILITY_BINS = 50       # [0, 1]
+SENTIMENT_BINS = 50         # [-1, 1]
+# Puntos de la muestra para scatter plots (por vídeo, canal o global)
+STATS_SAMPLE_SIZE = int(os.getenv("STATS_SAMPLE_SIZE", "200"))
+# Cuantiles que devuelve distribution()
+DEFAULT_QUANTILES = (0.5, 0.75, 0.9, 0.95, 0.99)
+
+
+def cooccurrence_matrix(flags: np.ndarray) -> np.ndarray:
+    """
+    [12, 12]: comentarios con las categorías i y j a la vez (diagonal = positivos de i)
+    """
+    as_int = flags.astype(np.int64)
+    return as_int.T @ as_int
+
+
+def cooccurrence_dict(matrix: np.ndarray) -> Dict[str, Dict[str, int]]:
+    # Solo pares distintos y con algún comentario: es el JSON que se guarda en video_statistics
+    result: Dict[str, Dict[str, int]] = {}
+    for i, j in zip(*np.nonzero(matrix)):
+        if i != j:
+            result.setdefault(FLAG_KEYS[i], {})[FLAG_KEYS[j]] = int(matrix[i, j])
+    return result
+
+
+def _sample_hash(key: str) -> float:
+    # Hash estable entre procesos (hash() de Python cambia con cada arranque), en [0, 1)
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+
+def _histogram(values: np.ndarray, low: float, high: float, bins: int) -> np.ndarray:
+    """
+    Conteos por bin de cada columna de `values` [N, C] -> [C, bins] (una sola bincount)
+    """
+    index = np.clip(((values - low) / (high - low) * bins).astype(np.int64), 0, bins - 1)
+    offsets = np.arange(values.shape[1]) * bins
+    return np.bincount((index + offsets).ravel(), minlength=values.shape[1] * bins).reshape(values.shape[1], bins)
+
+
+def _bottom_k(points: Dict[str, List[Any]], k: int) -> Dict[str, List[Any]]:
+    # point = [hash, sentiment_score, máx. probabilidad, likes, tóxico, sentiment_type]
+    if len(points) <= k:
+        return points
+    return dict(sorted(points.items(), key=lambda item: item[1][0])[:k])
+
+
+def histogram_quantiles(counts: np.ndarray, low: float, high: float,
+                        quantiles: Iterable[float] = DEFAULT_QUANTILES) -> Dict[str, Optional[float]]:
+    """
+    Cuantiles aproximados de un histograma (interpolación lineal dentro del bin; error < 1 bin)
+    """
+    counts = np.maximum(np.asarray(counts, dtype=float), 0)
+    total = counts.sum()
+    result: Dict[str, Optional[float]] = {}
+    cumulative = np.cumsum(counts)
+    width = (high - low) / len(counts)
+    for q in quantiles:
+        if not total:
+            result[f"p{round(q * 100):g}"] = None
+            continue
+        target = q * total
+        i = int(np.searchsorted(cumulative, target))
+        i = min(i, len(counts) - 1)
+        before = cumulative[i - 1] if i else 0.0
+        inside = (target - before) / counts[i] if counts[i] else 0.0
+        result[f"p{round(q * 100):g}"] = float(low + (i + inside) * width)
+    return result
+
+
+class StatsSummary:
+    """
+    Resumen sumable de un conjunto de comentarios (un lote, un vídeo, un canal o todo).
+    max_likes no se puede restar: tras un borrado queda como cota superior.
+    """
+    __slots__ = ("count", "scored", "toxic", "self_promotional", "likes_sum", "likes_sumsq", "likes_max",
+                 "sentiment_count", "sentiment_sum", "sentiment_sumsq", "sentiment_types",
+                 "positives", "cooccurrence", "probability_sums", "probability_sumsq",
+                 "probability_histogram", "sentiment_histogram", "sample", "sample_removed")
+
+    def __init__(self):
+        n_categories = len(TOXICITY_CATEGORIES)
+        self.count = 0
+        self.scored = 0             # comentarios con predicción (base de las medias de probabilidad)
+        self.toxic = 0              # comentarios con al menos una categoría
+        self.self_promotional = 0
+        self.likes_sum = 0
+        self.likes_sumsq = 0.0
+        self.likes_max = 0
+        self.sentiment_count = 0
+        self.sentiment_sum = 0.0
+        self.sentiment_sumsq = 0.0
+        self.sentiment_types: Counter = Counter()
+        self.positives = np.zeros(n_categories, dtype=np.int64)
+        self.cooccurrence = np.zeros((n_categories, n_categories), dtype=np.int64)
+        self.probability_sums = np.zeros(n_categories)
+        self.probability_sumsq = np.zeros(n_categories)
+        self.probability_histogram = np.zeros((n_categories, PROBABILITY_BINS), dtype=np.int64)
+        self.sentiment_histogram = np.zeros(SENTIMENT_BINS, dtype=np.int64)
+        # Muestra bottom-k: comment_id -> punto; en un delta, sample_removed son las claves
+        # de las filas restadas que hay que quitar de la muestra al sumarlo
+        self.sample: Dict[str, List[Any]] = {}
+        self.sample_removed: List[str] = []
+
+    # --- Construcción ---
+    @classmethod
+    def _from_arrays(cls, probabilities: np.ndarray, flags: np.ndarray, likes: Iterable[Any],
+                     sentiment_scores: Iterable[Any], sentiment_types: Iterable[Any],
+                     self_promotional: Iterable[Any], keys: Iterable[Any]) -> "StatsSummary":
+        summary = cls()
+        summary.count = len(probabilities)
+        if not summary.count:
+            return summary
+        scored = ~np.isnan(probabilities).any(axis=1)
+        known = probabilities[scored]
+        summary.scored = int(scored.sum())
+        summary.toxic = int(flags.any(axis=1).sum())
+        summary.positives = flags.sum(axis=0).astype(np.int64)
+        summary.cooccurrence = cooccurrence_matrix(flags)
+        summary.probability_sums = known.sum(axis=0)
+        summary.probability_sumsq = (known ** 2).sum(axis=0)
+
+        likes = np.asarray([v or 0 for v in likes], dtype=np.int64)
+        summary.likes_sum = int(likes.sum())
+        summary.likes_sumsq = float((likes.astype(float) ** 2).sum())
+        summary.likes_max = int(likes.max())
+
+        all_scores = np.asarray(list(sentiment_scores), dtype=float)
+        scores = all_scores[~np.isnan(all_scores)]
+        summary.sentiment_count = len(scores)
+        summary.sentiment_sum = float(scores.sum())
+        summary.sentiment_sumsq = float((scores ** 2).sum())
+        sentiment_types = [stype or "neutral" for stype in sentiment_types]
+        summary.sentiment_types = Counter(sentiment_types)
+        summary.self_promotional = sum(1 for v in self_promotional if v)
+
+        summary.probability_histogram = _histogram(known, 0.0, 1.0, PROBABILITY_BINS)
+        summary.sentiment_histogram = _histogram(scores[:, None], -1.0, 1.0, SENTIMENT_BINS)[0]
+        summary.sample = _bottom_k(
+            cls._sample_points(keys, all_scores, probabilities, flags, likes, sentiment_types), STATS_SAMPLE_SIZE
+        )
+        return summary
+
+    @staticmethod
+    def _sample_points(keys, scores, probabilities, flags, likes, sentiment_types) -> Dict[str, List[Any]]:
+        # Solo se construyen puntos para los candidatos: los SAMPLE_SIZE menores hashes
+        # Sin comment_id no hay clave estable para reemplazarlo o borrarlo: queda fuera
+        keys = [None if key is None else str(key) for key in keys]
+        hashes = np.array([2.0 if key is None else _sample_hash(key) for key in keys])
+        chosen = np.argsort(hashes)[:STATS_SAMPLE_SIZE]
+        chosen = chosen[hashes[chosen] < 2.0]
+        if not len(chosen):
+            return {}
+        max_probability = np.nan_to_num(probabilities[chosen], nan=0.0).max(axis=1)
+        any_flag = flags[chosen].any(axis=1)
+        return {
+            keys[i]: [float(hashes[i]), 0.0 if np.isnan(scores[i]) else float(scores[i]),
+                      float(p), int(likes[i]), bool(toxic), sentiment_types[i]]
+            for i, p, toxic in zip(chosen.tolist(), max_probability.tolist(), any_flag.tolist())
+        }
+
+    @classmethod
+    def from_records(cls, records: ScoredComments) -> "StatsSummary":
+        columns = records.columns
+        return cls._from_arrays(
+            records.probabilities, records.flags, columns["total_likes_comment"],
+            columns["sentiment_score"], columns["sentiment_type"],
+            columns.get("is_self_promotional") or (), columns["comment_id"],
+        )
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]]) -> "StatsSummary":
+        """
+        Desde filas de BD (las versiones anteriores de comentarios reescritos o borrados)
+        """
+        probabilities = np.array([[row.get(f"{c}_probability") for c in TOXICITY_CATEGORIES] for row in rows],
+                                 dtype=float).reshape(len(rows), len(TOXICITY_CATEGORIES))
+        flags = np.array([[bool(row.get(key)) for key in FLAG_KEYS] for row in rows],
+                         dtype=bool).reshape(len(rows), len(FLAG_KEYS))
+        return cls._from_arrays(
+            probabilities, flags, [row.get("total_likes_comment") for row in rows],
+            [row.get("sentiment_score") for row in rows], [row.get("sentiment_type") for row in rows],
+            [row.get("is_self_promotional") for row in rows], [row.get("comment_id") for row in rows],
+        )
+
+    @classmethod
+    def from_complete_stats(cls, complete_stats: Optional[Dict[str, Any]]) -> "StatsSummary":
+        """
+        Resumen guardado en complete_stats["summary"]. Las filas de video_statistics anteriores
+        a los resúmenes solo guardan medias del último análisis: no se aproximan, hay que
+        recalcularlas desde los comentarios (ver needs_rebuild)
+        """
+        if not complete_stats:
+            return cls()
+        if needs_rebuild(complete_stats):
+            raise ValueError("Estadísticas sin resumen sumable: recalcular con rebuild_video_statistics")
+        return cls.from_dict(complete_stats["summary"])
+
+    # --- Álgebra ---
+    def _combine(self, other: "StatsSummary", sign: int) -> "StatsSummary":
+        result = StatsSummary()
+        for name in ("count", "scored", "toxic", "self_promotional", "likes_sum", "likes_sumsq",
+                     "sentiment_count", "sentiment_sum", "sentiment_sumsq"):
+            setattr(result, name, getattr(self, name) + sign * getattr(other, name))
+        for name in ("positives", "cooccurrence", "probability_sums", "probability_sumsq",
+                     "probability_histogram", "sentiment_histogram"):
+            setattr(result, name, getattr(self, name) + sign * getattr(other, name))
+        result.likes_max = max(self.likes_max, other.likes_max) if sign > 0 else self.likes_max
+        if sign > 0:
+            # Se quitan las bajas del otro y las versiones nuevas sustituyen a las anteriores
+            removed = set(other.sample_removed)
+            sample = {k: v for k, v in self.sample.items() if k not in removed}
+            sample.update(other.sample)
+            result.sample = _bottom_k(sample, STATS_SAMPLE_SIZE)
+        else:
+            # Delta (nuevas - anteriores): basta con los k menores hashes de lo restado, que
+            # son los únicos que pueden estar en la muestra guardada. Lo reescrito se queda
+            # en sample con su versión nueva.
+            result.sample = dict(self.sample)
+            removed = set(self.sample_removed) | (set(other.sample) - set(self.sample))
+            result.sample_removed = sorted(removed)
+        types = Counter(self.sentiment_types)
+        if sign > 0:
+            types.update(other.sentiment_types)
+        else:
+            types.subtract(other.sentiment_types)
+        # Un delta (nuevas - anteriores) puede tener conteos negativos: se conservan
+        result.sentiment_types = Counter({k: v for k, v in types.items() if v != 0})
+        return result
+
+    def merge(self, other: "StatsSummary") -> "StatsSummary":
+        return self._combine(other, 1)
+
+    def subtract(self, other: "StatsSummary") -> "StatsSummary":
+        return self._combine(other, -1)
+
+    __add__ = merge
+    __sub__ = subtract
+
+    @classmethod
+    def merge_all(cls, summaries: Iterable["StatsSummary"]) -> "StatsSummary":
+        total = cls()
+        for summary in summaries:
+            total = total.merge(summary)
+        return total
+
+    # --- Serialización ---
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": SUMMARY_VERSION,
+            "categories": TOXICITY_CATEGORIES,
+            "count": self.count,
+            "scored": self.scored,
+            "toxic": self.toxic,
+            "self_promotional": self.self_promotional,
+            "likes": {"sum": self.likes_sum, "sumsq": self.likes_sumsq, "max": self.likes_max},
+            "sentiment": {"count": self.sentiment_count, "sum": self.sentiment_sum,
+                          "sumsq": self.sentiment_sumsq, "types": dict(self.sentiment_types)},
+            "positives": self.positives.tolist(),
+            "cooccurrence": self.cooccurrence.tolist(),
+            "probability_sums": self.probability_sums.tolist(),
+            "probability_sumsq": self.probability_sumsq.tolist(),
+            "bins": {"probability": PROBABILITY_BINS, "sentiment": SENTIMENT_BINS},
+            "probability_histogram": self.probability_histogram.tolist(),
+            "sentiment_histogram": self.sentiment_histogram.tolist(),
+            "sample": self.sample,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StatsSummary":
+        summary = cls()
+        # Las columnas por categoría se reordenan por nombre por si cambia TOXICITY_CATEGORIES
+        order = [data["categories"].index(c) if c in data["categories"] else None for c in TOXICITY_CATEGORIES]
+
+        def per_category(values, matrix=False):
+            values = np.asarray(values, dtype=float)
+            out = np.zeros((len(order),) * (2 if matrix else 1))
+            for i, src in enumerate(order):
+                if src is None:
+                    continue
+                if matrix:
+                    for j, src_j in enumerate(order):
+                        if src_j is not None:
+                            out[i, j] = values[src, src_j]
+                else:
+                    out[i] = values[src]
+            return out
+
+        summary.count = data["count"]
+        summary.scored = data["scored"]
+        summary.toxic = data["toxic"]
+        summary.self_promotional = data["self_promotional"]
+        summary.likes_sum = data["likes"]["sum"]
+        summary.likes_sumsq = data["likes"]["sumsq"]
+        summary.likes_max = data["likes"]["max"]
+        summary.sentiment_count = data["sentiment"]["count"]
+        summary.sentiment_sum = data["sentiment"]["sum"]
+        summary.sentiment_sumsq = data["sentiment"]["sumsq"]
+        summary.sentiment_types = Counter(data["sentiment"]["types"])
+        summary.positives = per_category(data["positives"]).astype(np.int64)
+        summary.cooccurrence = per_category(data["cooccurrence"], matrix=True).astype(np.int64)
+        summary.probability_sums = per_category(data["probability_sums"])
+        summary.probability_sumsq = per_category(data["probability_sumsq"])
+        # Resúmenes de la versión 1 (o con otros bins) no traen histogramas válidos: empiezan vacíos
+        bins = data.get("bins") or {}
+        if bins.get("probability") == PROBABILITY_BINS:
+            summary.probability_histogram = np.array(
+                [data["probability_histogram"][src] if src is not None else [0] * PROBABILITY_BINS for src in order],
+                dtype=np.int64)
+        if bins.get("sentiment") == SENTIMENT_BINS:
+            summary.sentiment_histogram = np.asarray(data["sentiment_histogram"], dtype=np.int64)
+        summary.sample = _bottom_k(dict(data.get("sample") or {}), STATS_SAMPLE_SIZE)
+        return summary
+
+    def to_complete_stats(self) -> Dict[str, Any]:
+        """
+        complete_stats (lo que se guarda en video_statistics) derivado del resumen
+        """
+        n = self.count
+
+        def mean(total, count):
+            return total / count if count else 0.0
+
+        def std(total, sumsq, count):
+            # max(0, ·): las restas en coma flotante pueden dejar varianzas de -1e-12
+            return float(np.sqrt(max(0.0, sumsq / count - (total / count) ** 2))) if count else 0.0
+
+        return {
+            # Campos directos para video_statistics
+            "total_comments": n,
+            "mean_likes": mean(self.likes_sum, n),
+            "max_likes": self.likes_max,
+            "total_likes": self.likes_sum,
+            "self_promotional": self.self_promotional,
+            "percentage_toxicity": mean(self.toxic * 100, n),
+
+            # Campos JSON para video_statistics
+            "sentiment_distribution": {k: v for k, v in self.sentiment_types.items() if v > 0},
+            "toxicity_stats": {
+                key: {"true": int(count), "false": n - int(count)} for key, count in zip(FLAG_KEYS, self.positives)
+            },
+            "toxicity_cooccurrence": cooccurrence_dict(self.cooccurrence),
+            "mean_sentiment_score": mean(self.sentiment_sum, self.sentiment_count),
+
+            # Derivados que solo son posibles con sumas de cuadrados
+            "std_likes": std(self.likes_sum, self.likes_sumsq, n),
+            "std_sentiment_score": std(self.sentiment_sum, self.sentiment_sumsq, self.sentiment_count),
+            "mean_probabilities": {
+                category: mean(total, self.scored)
+                for category, total in zip(TOXICITY_CATEGORIES, self.probability_sums.tolist())
+            },
+            "summary": self.to_dict(),
+        }
+
+
+def distribution(summary: StatsSummary, quantiles: Iterable[float] = DEFAULT_QUANTILES,
+                 sample_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Distribuciones de un resumen en tamaño constante: bins, cuantiles y una muestra acotada
+    """
+    quantiles = tuple(quantiles)
+    probability_edges = np.linspace(0.0, 1.0, PROBABILITY_BINS + 1).round(4).tolist()
+    sentiment_edges = np.linspace(-1.0, 1.0, SENTIMENT_BINS + 1).round(4).tolist()
+    points = sorted(summary.sample.values(), key=lambda point: point[0])[:sample_size or STATS_SAMPLE_SIZE]
+    return {
+        "total_comments": summary.count,
+        "probabilities": {
+            category: {
+                "mean": float(total / summary.scored) if summary.scored else 0.0,
+                "quantiles": histogram_quantiles(counts, 0.0, 1.0, quantiles),
+                "counts": counts.tolist(),
+            }
+            for category, total, counts in zip(TOXICITY_CATEGORIES, summary.probability_sums.tolist(),
+                                               np.maximum(summary.probability_histogram, 0))
+        },
+        "probability_bin_edges": probability_edges,
+        "sentiment_score": {
+            "mean": float(summary.sentiment_sum / summary.sentiment_count) if summary.sentiment_count else 0.0,
+            "quantiles": histogram_quantiles(summary.sentiment_histogram, -1.0, 1.0, quantiles),
+            "counts": np.maximum(summary.sentiment_histogram, 0).tolist(),
+            "bin_edges": sentiment_edges,
+        },
+        "sentiment_distribution": {k: v for k, v in summary.sentiment_types.items() if v > 0},
+        # Puntos del scatter sentimiento / toxicidad (el formato de CorrelationScatter)
+        "sample": [
+            {"x": point[1], "y": point[2], "size": max(point[3], 1), "isToxic": point[4], "sentiment_type": point[5]}
+            for point in points
+        ],
+    }
+
+
+def needs_rebuild(complete_stats: Optional[Dict[str, Any]]) -> bool:
+    """
+    Fila de video_statistics escrita antes de los resúmenes (migrations/007): sus números son
+    solo los de la última petición y no se pueden sumar
+    """
+    return bool(complete_stats) and not complete_stats.get("summary")
+
+
+def compute_complete_stats(records: ScoredComments) -> Dict[str, Any]:
+    """
+    complete_stats de un conjunto de comentarios puntuados
+    """
+    return StatsSummary.from_records(records).to_complete_stats()
+
+
+def merge_complete_stats(existing: Optional[Dict[str, Any]], delta: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Combina dos complete_stats sumando sus resúmenes (O(1), sin tocar comentarios)
+    """
+    if not existing and not delta:
+        return {}
+    return StatsSummary.from_complete_stats(existing).merge(StatsSummary.from_complete_stats(delta)).to_complete_stats()
+
+
+# --- Rollups por franjas de tiempo (published_at_comment) ---
+# Por vídeo y franja (hora / día): comentarios, tóxicos, likes y suma de sentiment_score.
+# Son contadores: se suman por lote y se restan al reescribir o borrar, como StatsSummary.
+TIME_BUCKET_FREQUENCIES = {"hour": "h", "day": "D"}
+TIME_BUCKET_COUNTERS = ("comments", "toxic", "likes", "sentiment_count", "sentiment_sum")
+
+
+def bucket_key(value: Any) -> Optional[str]:
+    # Misma clave venga de SQLite ("...Z"), de Supabase ("...+00:00") o de pandas
+    timestamp = pd.Timestamp(value)
+    timestamp = timestamp.tz_localize("UTC") if timestamp.tzinfo is None else timestamp.tz_convert("UTC")
+    return timestamp.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def time_bucket_rollups(rows: List[Dict[str, Any]], sign: int = 1) -> Dict[tuple, Dict[str, float]]:
+    """
+    (video_id, granularity, bucket_start) -> contadores de esas filas de BD (sign=-1 para restar).
+    Las filas sin fecha no entran en ninguna franja.
+    """
+    if not rows:
+        return {}
+    published = pd.to_datetime(pd.Series([row.get("published_at_comment") for row in rows]),
+                               utc=True, errors="coerce", format="ISO8601")
+    scores = pd.to_numeric(pd.Series([row.get("sentiment_score") for row in rows]), errors="coerce")
+    frame = pd.DataFrame({
+        "video_id": [row["video_id"] for row in rows],
+        "comments": 1,
+        "toxic": [int(any(row.get(key) for key in FLAG_KEYS)) for row in rows],
+        "likes": [row.get("total_likes_comment") or 0 for row in rows],
+        "sentiment_count": scores.notna().astype(int),
+        "sentiment_sum": scores.fillna(0.0),
+    })[published.notna().to_numpy()]
+    published = published[published.notna()]
+
+    rollups: Dict[tuple, Dict[str, float]] = {}
+    for granularity, frequency in TIME_BUCKET_FREQUENCIES.items():
+        grouped = frame.groupby([frame["video_id"], published.dt.floor(frequency).to_numpy()])[list(TIME_BUCKET_COUNTERS)].sum()
+        for (video_id, start), values in zip(grouped.index, grouped.to_dict("records")):
+            rollups[(video_id, granularity, bucket_key(start))] = {
+                name: sign * (float(value) if name == "sentiment_sum" else int(value)) for name, value in values.items()
+            }
+    return rollups
+
+
+def merge_rollups(*parts: Dict[tuple, Dict[str, float]]) -> Dict[tuple, Dict[str, float]]:
+    merged: Dict[tuple, Dict[str, float]] = {}
+    for part in parts:
+        for key, values in part.items():
+            target = merged.setdefault(key, dict.fromkeys(TIME_BUCKET_COUNTERS, 0))
+            for name, value in values.items():
+                target[name] += value
+    return merged
+
+
+def bucket_view(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fila de video_time_buckets -> punto del timeline con tasas y medias
+    """
+    comments = row.get("comments") or 0
+    sentiment_count = row.get("sentiment_count") or 0
+    return {
+        "bucket_start": bucket_key(row["bucket_start"]),
+        "comments": comments,
+        "toxic": row.get("toxic") or 0,
+        "toxicity_rate": (row.get("toxic") or 0) / comments * 100 if comments else 0.0,
+        "mean_sentiment_score": (row.get("sentiment_sum") or 0.0) / sentiment_count if sentiment_count else 0.0,
+        "likes": row.get("likes") or 0,
+        "mean_likes": (row.get("likes") or 0) / comments if comments else 0.0,
+    }
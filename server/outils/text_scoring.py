@@ -0,0 +1,95 @@
+import os
+import asyncio
+from typing import Any, AsyncIterator, Dict, List
+
+import pandas as pd
+
+from server.outils.cleaning_pipeline import clean_free_text
+from server.outils.prediction_pipeline import model_loader, model_probabilities, TOXICITY_FIELDS
+from server.outils.executors import run_cpu
+from server.outils.fast_json import dumps, loads
+from server.outils.metrics import COMMENTS_PROCESSED
+
+# Puntuación de textos sueltos (de nuestro warehouse u otras plataformas), sin YouTube ni BD:
+# limpieza de texto libre + sentimiento + toxicidad con un forward del modelo por trozo.
+# Los resultados salen como NDJSON trozo a trozo, en el orden de entrada.
+
+SCORE_MAX_TEXTS = int(os.getenv("SCORE_MAX_TEXTS", "50000"))
+SCORE_CHUNK_SIZE = int(os.getenv("SCORE_CHUNK_SIZE", "512"))
+
+
+def parse_score_payload(body: bytes, content_type: str = "") -> List[Dict[str, Any]]:
+    """
+    Acepta JSON (lista de textos u objetos {"id", "text"}, o {"texts": [...]}) o NDJSON
+    (una línea por texto u objeto). Devuelve [{"id", "text"}]; ValueError si no es válido.
+    """
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        items = [loads(line) for line in body.splitlines() if line.strip()]
+    else:
+        payload = loads(body)
+        items = payload.get("texts") if isinstance(payload, dict) else payload
+        if not isinstance(items, list):
+            raise ValueError("Se espera una lista de textos o {\"texts\": [...]}")
+
+    records = []
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            records.append({"id": i, "text": item})
+        elif isinstance(item, dict) and isinstance(item.get("text"), str):
+            records.append({"id": item.get("id", i), "text": item["text"]})
+        else:
+            raise ValueError(f"Elemento {i}: se espera un texto o un objeto con 'text'")
+    return records
+
+
+def score_records(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Limpieza, sentimiento y toxicidad de un trozo de textos (CPU)
+    """
+    if not model_loader:
+        raise Exception("Modelo MULTITOXIC no disponible")
+
+    df = clean_free_text(pd.DataFrame({"text": [r["text"] for r in records]}))
+    texts = df["text"].tolist()
+    probabilities, detected = model_probabilities(texts)
+    COMMENTS_PROCESSED.inc(len(texts), source="texts")
+    # float32 del modelo: sin redondear, 0.1 saldría como 0.10000000149011612 en el JSON
+    probabilities = probabilities.round(6)
+
+    results = []
+    for record, text, probs, flags, s_type, s_score, s_intensity, promo, url, tag in zip(
+        records, texts, probabilities.tolist(), detected.tolist(),
+        df["sentiment_type"], df["sentiment_score"], df["sentiment_intensity"],
+        df["is_self_promotional"], df["has_url"], df["has_tag"],
+    ):
+        result = {"id": record["id"], "text": text}
+        for field, prob, flag in zip(TOXICITY_FIELDS, probs, flags):
+            result[f"{field}_probability"] = prob
+            result[f"is_{field}"] = flag
+        result.update({
+            "sentiment_type": s_type,
+            "sentiment_score": float(s_score),
+            "sentiment_intensity": s_intensity,
+            "is_self_promotional": bool(promo),
+            "has_url": bool(url),
+            "has_tag": bool(tag),
+        })
+        results.append(result)
+    return results
+
+
+async def stream_scores(records: List[Dict[str, Any]], chunk_size: int = SCORE_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """
+    NDJSON de los resultados. El trozo siguiente se puntúa mientras se envía el actual.
+    """
+    chunks = [records[i:i + chunk_size] for i in range(0, len(records), chunk_size)]
+    pending = asyncio.ensure_future(run_cpu(score_records, chunks[0])) if chunks else None
+    try:
+        for i in range(len(chunks)):
+            results = await pending
+            pending = asyncio.ensure_future(run_cpu(score_records, chunks[i + 1])) if i + 1 < len(chunks) else None
+            yield b"".join(dumps(result) + b"\n" for result in results)
+    finally:
+        # Cliente desconectado: no seguir puntuando para nadie
+        if pending is not None:
+            pending.cancel()
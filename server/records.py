@@ -0,0 +1,247 @@
+import time
+import argparse
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from server.schemas import Comment, PredictionResponse
+from server.database.storage import TOXICITY_CATEGORIES
+
+# Comentarios puntuados de un análisis, por columnas: las 12 probabilidades en una matriz
+# [N, 12] (NaN = no se pudo puntuar), los is_* en otra de booleanos y el resto en listas.
+# predict_pipeline, las estadísticas, la cola de escritura y la BD trabajan con
+# ScoredComments (datos que genera el propio servidor, sin validar). Los Comment de Pydantic
+# solo se construyen en el borde de la API, al responder en el formato por defecto.
+
+PROBABILITY_FIELDS = [f"{category}_probability" for category in TOXICITY_CATEGORIES]
+FLAG_FIELDS = [f"is_{category}" for category in TOXICITY_CATEGORIES]
+# Columnas que no son probabilidades ni is_*
+VALUE_FIELDS = [name for name in Comment.model_fields if name not in PROBABILITY_FIELDS and name not in FLAG_FIELDS]
+COMMENT_FIELDS = list(Comment.model_fields)
+
+
+class ScoredComments:
+    __slots__ = ("columns", "probabilities", "flags")
+
+    def __init__(self, columns: Dict[str, List[Any]], probabilities: np.ndarray, flags: np.ndarray):
+        self.columns = columns
+        self.probabilities = probabilities
+        self.flags = flags
+
+    @classmethod
+    def empty(cls) -> "ScoredComments":
+        n_categories = len(TOXICITY_CATEGORIES)
+        return cls({name: [] for name in VALUE_FIELDS},
+                   np.empty((0, n_categories)), np.empty((0, n_categories), dtype=bool))
+
+    @classmethod
+    def concat(cls, parts: Iterable["ScoredComments"]) -> "ScoredComments":
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return cls.empty()
+        if len(parts) == 1:
+            return parts[0]
+        return cls(
+            {name: [v for p in parts for v in p.column(name)] for name in VALUE_FIELDS},
+            np.concatenate([p.probabilities for p in parts]),
+            np.concatenate([p.flags for p in parts]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.probabilities)
+
+    def slice(self, start: int, stop: int) -> "ScoredComments":
+        return ScoredComments({name: values[start:stop] for name, values in self.columns.items()},
+                              self.probabilities[start:stop], self.flags[start:stop])
+
+    @property
+    def scored(self) -> np.ndarray:
+        # Filas con predicción (las que fallaron quedan con probabilidades NaN)
+        return ~np.isnan(self.probabilities[:, 0]) if len(self) else np.zeros(0, dtype=bool)
+
+    def column(self, name: str) -> List[Any]:
+        """
+        Valores de un campo de Comment; None en probabilidades e is_* de filas sin predicción
+        """
+        if name in self.columns:
+            return self.columns[name]
+        if name in VALUE_FIELDS:
+            # Columnas opcionales que no trae este conjunto (p. ej. is_self_promotional)
+            return [None] * len(self)
+        if name in PROBABILITY_FIELDS:
+            values = self.probabilities[:, PROBABILITY_FIELDS.index(name)]
+        elif name in FLAG_FIELDS:
+            values = self.flags[:, FLAG_FIELDS.index(name)]
+        else:
+            raise KeyError(name)
+        scored = self.scored
+        if scored.all():
+            return values.tolist()
+        return [v if ok else None for v, ok in zip(values.tolist(), scored.tolist())]
+
+    def rows(self, fields: Optional[Iterable[str]] = None, exclude_none: bool = False) -> List[Dict[str, Any]]:
+        """
+        Un dict por comentario (filas de BD con exclude_none=True, como model_dump)
+        """
+        fields = list(fields or COMMENT_FIELDS)
+        columns = [self.column(name) for name in fields]
+        if exclude_none:
+            return [{k: v for k, v in zip(fields, values) if v is not None} for values in zip(*columns)]
+        return [dict(zip(fields, values)) for values in zip(*columns)]
+
+    def to_comments(self) -> List[Comment]:
+        """
+        Borde de la API: aquí sí se validan con Pydantic
+        """
+        return [Comment.model_validate(row) for row in self.rows()]
+
+
+def stats_from_complete(complete_stats: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """
+    Conteo y porcentaje por categoría a partir de toxicity_stats (true/false)
+    """
+    total = complete_stats.get("total_comments", 0)
+    return {
+        key: {"count": counts.get("true", 0),
+              "percentage": (counts.get("true", 0) / total * 100) if total else 0}
+        for key, counts in complete_stats.get("toxicity_stats", {}).items()
+    }
+
+
+@dataclass
+class AnalysisResult:
+    """
+    Resultado interno de un análisis; to_response() lo convierte en PredictionResponse
+    """
+    video_id: str
+    records: ScoredComments
+    complete_stats: Dict[str, Any]
+    incremental: bool = False
+    persistence: Optional[str] = None
+    # Modo estimación: población, muestra e intervalos de confianza (estimation.py)
+    estimate: Optional[Dict[str, Any]] = None
+    # La respuesta se construye una vez aunque la pidan varias peticiones (caché de análisis)
+    _response: Optional[PredictionResponse] = field(default=None, repr=False, compare=False)
+
+    @property
+    def total_comments(self) -> int:
+        return len(self.records)
+
+    @property
+    def new_comments(self) -> Optional[int]:
+        return len(self.records) if self.incremental else None
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return stats_from_complete(self.complete_stats)
+
+    def to_response(self) -> PredictionResponse:
+        if self._response is None:
+            self._response = self._build_response()
+        return self._response
+
+    def _build_response(self) -> PredictionResponse:
+        return PredictionResponse(
+            video_id=self.video_id,
+            total_comments=self.total_comments,
+            stats=self.stats,
+            complete_stats=self.complete_stats,
+            comments=self.records.to_comments(),
+            incremental=self.incremental,
+            new_comments=self.new_comments,
+            persistence=self.persistence,
+            estimate=self.estimate,
+        )
+
+
+## Microbenchmark: coste por comentario de Comment (Pydantic) frente a ScoredComments
+
+def sample_records(n_comments: int, seed: int = 0) -> ScoredComments:
+    rng = np.random.default_rng(seed)
+    probabilities = rng.random((n_comments, len(TOXICITY_CATEGORIES)))
+    columns = {
+        "video_id": ["video000001"] * n_comments,
+        "comment_id": [f"comment{i:07d}" for i in range(n_comments)],
+        "thread_id": [f"comment{i:07d}" for i in range(n_comments)],
+        "parent_comment_id": [None] * n_comments,
+        "published_at_comment": ["2025-07-10T12:00:00+00:00"] * n_comments,
+        "text": [f"comentario de prueba número {i}" for i in range(n_comments)],
+        "sentiment_type": ["neutral"] * n_comments,
+        "sentiment_score": rng.uniform(-1, 1, n_comments).tolist(),
+        "sentiment_intensity": ["weak"] * n_comments,
+        "total_likes_comment": rng.integers(0, 100, n_comments).tolist(),
+        "is_self_promotional": (rng.random(n_comments) < 0.05).tolist(),
+    }
+    return ScoredComments(columns, probabilities, probabilities > 0.5)
+
+
+def measure_records(n_comments: int = 10000) -> Dict[str, Dict[str, float]]:
+    """
+    Por comentario: µs de CPU desde el DataFrame limpio y la salida del modelo hasta las filas
+    de BD, y bytes que ocupan los comentarios puntuados en memoria. Los dos caminos parten
+    del mismo DataFrame y de la misma matriz de probabilidades.
+    Antes: un Comment(**kw) por fila del DataFrame + model_dump(include, exclude_none).
+    Ahora: columnas del DataFrame + matriz [N, 12] y ScoredComments.rows(exclude_none=True).
+    """
+    import pandas as pd
+    # Importación diferida: save_comments importa este módulo
+    from server.database.save_comments import DB_COLUMNS
+
+    source = sample_records(n_comments)
+    video_id = source.columns["video_id"][0]
+    # Como sale de clean_youtube_data: sin video_id y con los likes en like_count_comment
+    df_clean = pd.DataFrame({k: v for k, v in source.columns.items() if k != "video_id"})\
+        .rename(columns={"total_likes_comment": "like_count_comment"})
+    probabilities, flags = source.probabilities, source.flags
+    value_columns = [name for name in VALUE_FIELDS if name in df_clean.columns]
+    include = set(DB_COLUMNS)
+
+    def build_comments():
+        return [
+            Comment(video_id=video_id, total_likes_comment=row["like_count_comment"],
+                    **{name: row[name] for name in value_columns},
+                    **dict(zip(PROBABILITY_FIELDS, probabilities[i].tolist())),
+                    **dict(zip(FLAG_FIELDS, flags[i].tolist())))
+            for i, row in enumerate(df_clean.to_dict("records"))
+        ]
+
+    def build_records():
+        columns = {name: df_clean[name].tolist() for name in value_columns}
+        columns["video_id"] = [video_id] * len(df_clean)
+        columns["total_likes_comment"] = df_clean["like_count_comment"].tolist()
+        return ScoredComments(columns, probabilities, flags)
+
+    paths = {
+        "Comment (Pydantic)": (build_comments,
+                               lambda comments: [c.model_dump(include=include, exclude_none=True) for c in comments]),
+        "ScoredComments": (build_records, lambda records: records.rows(DB_COLUMNS, exclude_none=True)),
+    }
+
+    report = {}
+    for name, (build, to_rows) in paths.items():
+        start = time.perf_counter()
+        to_rows(build())
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        built = build()
+        allocated, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del built
+
+        report[name] = {
+            "us_per_comment": elapsed * 1e6 / n_comments,
+            "bytes_per_comment": allocated / n_comments,
+        }
+    return report
+
+
+if __name__ == "__main__":
+    # python -m server.records --comments 10000
+    parser = argparse.ArgumentParser(description="Coste por comentario de Comment frente a ScoredComments")
+    parser.add_argument("--comments", type=int, default=10000)
+    args = parser.parse_args()
+    for name, row in measure_records(args.comments).items():
+        print(f"{name:>20}: {row['us_per_comment']:7.2f} µs/comentario  {row['bytes_per_comment']:7.0f} bytes/comentario")
@@ -1,44 +1,74 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime
+from server.outils.admission import ANALYSIS_MAX_COMMENTS, ESTIMATE_MAX_POPULATION
 
 class VideoRequest(BaseModel):
     url_or_id: str
-    max_comments: int = 100 
+    # Con estimate es la población a descargar (hasta ESTIMATE_MAX_POPULATION), no lo que se puntúa
+    max_comments: int = Field(100, ge=1, le=ESTIMATE_MAX_POPULATION)
+    # Solo descarga y puntúa comentarios nuevos desde el último análisis
+    incremental: bool = Field(False, description=(
+        "Solo comentarios nuevos desde el último análisis. Las respuestas nuevas se recogen en los "
+        "hilos de la última página descargada; las de hilos más antiguos requieren un análisis completo."))
+    durable: bool = False       # esperar a que los comentarios estén guardados en BD antes de responder
+    force_refresh: bool = False # ignorar el resultado en caché y volver a analizar
+    estimate: bool = False      # puntuar solo una muestra y devolver estimaciones con intervalos de confianza
+    error_bound: Optional[float] = Field(None, gt=0, lt=0.5)  # margen objetivo del modo estimate (0.03 = ±3 puntos)
+
+    @model_validator(mode="after")
+    def _check_max_comments(self):
+        if not self.estimate and self.max_comments > ANALYSIS_MAX_COMMENTS:
+            raise ValueError(f"max_comments no puede superar {ANALYSIS_MAX_COMMENTS} sin estimate=true")
+        return self
+
+class BulkRequest(BaseModel):
+    # Cualquier combinación: lista de vídeos, una playlist y/o un canal
+    video_ids: List[str] = []
+    playlist_id: Optional[str] = None
+    channel_id: Optional[str] = None
+    max_videos: int = 50         # por playlist / canal
+    max_comments: int = Field(100, ge=1, le=ANALYSIS_MAX_COMMENTS)  # por vídeo
+    incremental: bool = False
 
 class Comment(BaseModel):
     video_id: str
+    comment_id: Optional[str] = None
+    thread_id: Optional[str] = None
+    parent_comment_id: Optional[str] = None
+    published_at_comment: Optional[str] = None
     text: str
-    toxic_probability: Optional[float]
-    is_toxic: Optional[bool]
-    hatespeech_probability: Optional[float]
-    is_hatespeech: Optional[bool]
-    abusive_probability: Optional[float]
-    is_abusive: Optional[bool]
-    provocative_probability: Optional[float]
-    is_provocative: Optional[bool]
-    racist_probability: Optional[float]
-    is_racist: Optional[bool]
-    obscene_probability: Optional[float]
-    is_obscene: Optional[bool]
-    threat_probability: Optional[float]
-    is_threat: Optional[bool]
-    religious_hate_probability: Optional[float]
-    is_religious_hate: Optional[bool]
-    nationalist_probability: Optional[float]
-    is_nationalist: Optional[bool]
-    sexist_probability: Optional[float]
-    is_sexist: Optional[bool]
-    homophobic_probability: Optional[float]
-    is_homophobic: Optional[bool]
-    radicalism_probability: Optional[float]
-    is_radicalism: Optional[bool]
+    toxic_probability: Optional[float] = None
+    is_toxic: Optional[bool] = None
+    hatespeech_probability: Optional[float] = None
+    is_hatespeech: Optional[bool] = None
+    abusive_probability: Optional[float] = None
+    is_abusive: Optional[bool] = None
+    provocative_probability: Optional[float] = None
+    is_provocative: Optional[bool] = None
+    racist_probability: Optional[float] = None
+    is_racist: Optional[bool] = None
+    obscene_probability: Optional[float] = None
+    is_obscene: Optional[bool] = None
+    threat_probability: Optional[float] = None
+    is_threat: Optional[bool] = None
+    religious_hate_probability: Optional[float] = None
+    is_religious_hate: Optional[bool] = None
+    nationalist_probability: Optional[float] = None
+    is_nationalist: Optional[bool] = None
+    sexist_probability: Optional[float] = None
+    is_sexist: Optional[bool] = None
+    homophobic_probability: Optional[float] = None
+    is_homophobic: Optional[bool] = None
+    radicalism_probability: Optional[float] = None
+    is_radicalism: Optional[bool] = None
 
     # sentimientos
     sentiment_type: Optional[str] = None
     sentiment_score: Optional[float] = None
     sentiment_intensity: Optional[str] = None
     total_likes_comment: Optional[int] = 0
+    is_self_promotional: Optional[bool] = None
     
     class Config:
         extra = "allow"
@@ -52,10 +82,14 @@ class VideoStatistics(BaseModel):
     mean_sentiment_score: Optional[float] = None
     sentiment_distribution: Dict[str, int] = {}
     toxicity_stats: Dict[str, Dict[str, int]] = {}
+    # Pares de categorías detectadas en el mismo comentario: {"is_toxic": {"is_racist": 3}}
+    toxicity_cooccurrence: Dict[str, Dict[str, int]] = {}
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
     total_likes: Optional[int] = 0
     self_promotional: Optional[int] = 0
+    # Conteos y sumas sumables (StatsSummary.to_dict) de los que se derivan los campos anteriores
+    summary: Optional[Dict[str, Any]] = None
 
 class PredictionStats(BaseModel):
     count: int
@@ -67,6 +101,11 @@ class PredictionResponse(BaseModel):
     stats: Dict[str, Any]
     complete_stats: Dict[str, Any] 
     comments: List[Comment]
+    incremental: bool = False
+    new_comments: Optional[int] = None
+    persistence: Optional[str] = None   # "durable" (ya en BD), "queued" (cola write-behind) o None
+    # Solo en modo estimación: comments es la muestra y aquí van las estimaciones de la población
+    estimate: Optional[Dict[str, Any]] = None
 
 class SavedStatisticsResponse(BaseModel):
     video_id: str
@@ -5,15 +5,20 @@ from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 from typing import List, Dict, Any
 from unittest.mock import patch, MagicMock
 from etl.youtube_extraction import fetch_comment_threads
+from etl.response_cache import ResponseCache, CacheMiss
+from server.database.stats_cache import StatsCache, TTLCache, InMemorySharedBackend, video_key
+from server.database.storage import SupabaseStorage, SQLiteStorage, set_storage, TOXICITY_CATEGORIES
+from server.database import write_queue
 import server.database.connection_db as connection_db
 import server.database.save_comments as save_comments
 from server.database import save_comments
-from server.outils.pipeline_prediction import predict_pipeline 
+from server.outils.prediction_pipeline import predict_pipeline
 from server.database.save_comments import save_comment,save_comments_batch,get_comments_by_video,delete_comments_by_video
-from server.outils.pipeline_cleaning import clean_youtube_data, analyze_sentiment
-from server.outils.pipeline_unified import UnifiedPipeline
+from server.outils.cleaning_pipeline import clean_youtube_data, analyze_sentiment
 # ==============================  Cleaning Pipeline  ==============================
 def test_pipeline():
+    # UnifiedPipeline no existe en el repo: sin este import a nivel de módulo, pytest recoge el resto
+    UnifiedPipeline = pytest.importorskip("server.outils.pipeline_unified").UnifiedPipeline
     print("🚀 Iniciando pruebas del UnifiedPipeline...")
     pipeline = UnifiedPipeline()
     
@@ -47,7 +52,7 @@ def test_pipeline():
     return True
 
 # =============================  YouTube Extraction  =============================
-@patch("etl.youtube_extraction.requests.get")
+@patch("etl.response_cache.http.get")
 def test_fetch_comment_threads(mock_get):
     # Simular respuesta de la API de YouTube
     mock_response = MagicMock()
@@ -81,6 +86,70 @@ def test_fetch_comment_threads(mock_get):
     assert comments[0]["author"] == "Test User"
     assert comments[0]["text"] == "This is a test comment."
 
+@patch("etl.response_cache.http.get")
+def test_fetch_comment_threads_incremental_stops_at_known(mock_get):
+    def thread(thread_id, published, replies=0):
+        return {
+            "id": thread_id,
+            "snippet": {
+                "topLevelComment": {"snippet": {"publishedAt": published, "textDisplay": thread_id, "likeCount": 0}},
+                "totalReplyCount": replies
+            }
+        }
+
+    def response(data):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = data
+        return mock_response
+
+    threads = {
+        "items": [thread("new", "2024-01-03T00:00:00Z"), thread("old", "2024-01-01T00:00:00Z", replies=2),
+                  thread("older", "2023-12-31T00:00:00Z")],
+        "nextPageToken": "next"
+    }
+    # Respuestas del hilo conocido "old": r1 ya estaba guardada, r2 es nueva
+    replies = {"items": [{"id": rid, "snippet": {"parentId": "old", "textDisplay": rid}} for rid in ("r1", "r2")]}
+    mock_get.side_effect = lambda url, **kwargs: response(replies if url.endswith("/comments") else threads)
+
+    comments = fetch_comment_threads("dQw4w9WgXcQ", max_total=100, delay=0, order="time",
+                                     known_threads=lambda ids: {"old": {"r1"}} if "old" in ids else {})
+
+    assert [c["commentId"] for c in comments] == ["new", "r2"]
+    assert comments[1]["isReply"] and comments[1]["threadId"] == "old"
+    assert mock_get.call_count == 2
+    assert mock_get.call_args_list[0].kwargs["params"]["order"] == "time"
+    assert mock_get.call_args_list[1].kwargs["params"]["parentId"] == "old"
+
+@patch("etl.response_cache.http.get")
+def test_response_cache_record_replay_and_etag(mock_get, tmp_path):
+    endpoint = "https://www.googleapis.com/youtube/v3/commentThreads"
+    params = {"videoId": "abc", "pageToken": "p2", "key": "secret"}
+
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.headers = {"ETag": "etag-1"}
+    mock_response.json.return_value = {"items": [{"id": "c1"}]}
+    mock_get.return_value = mock_response
+
+    recorder = ResponseCache(cache_dir=tmp_path, mode="record")
+    assert recorder.get_json(endpoint, params) == {"items": [{"id": "c1"}]}
+    # La API key no forma parte de la clave ni se guarda en disco
+    assert recorder.make_key(endpoint, params) == recorder.make_key(endpoint, {**params, "key": "otra"})
+    assert "secret" not in next(tmp_path.glob("*.json")).read_text()
+
+    replay = ResponseCache(cache_dir=tmp_path, mode="replay")
+    assert replay.get_json(endpoint, params) == {"items": [{"id": "c1"}]}
+    with pytest.raises(CacheMiss):
+        replay.get_json(endpoint, {**params, "pageToken": "p3"})
+
+    # TTL vencido: revalida con If-None-Match y reutiliza el cuerpo si llega 304
+    cache = ResponseCache(cache_dir=tmp_path, mode="cache", ttl=0)
+    mock_response.status_code = 304
+    assert cache.get_json(endpoint, params) == {"items": [{"id": "c1"}]}
+    assert mock_get.call_args.kwargs["headers"] == {"If-None-Match": "etag-1"}
+    assert cache.revalidated == 1
+
 # # =================================  Predictions  =================================
 # def test_predict_pipeline_mock_output_structure():
 #     result = predict_pipeline("dummy_url", max_comments=5)
@@ -110,17 +179,17 @@ def test_sentiment_vader():
     # Positive text
     result = analyze_sentiment("I love this product!")
     assert result['sentiment_type'] == 'positive'
-    assert result['sentiment_intensity'] > 0
+    assert result['sentiment_score'] > 0
 
     # Negative text
     result = analyze_sentiment("I hate this so much.")
     assert result['sentiment_type'] == 'negative'
-    assert result['sentiment_intensity'] < 0
+    assert result['sentiment_score'] < 0
 
     # Neutral text
     result = analyze_sentiment("It is a product.")
     assert result['sentiment_type'] == 'neutral'
-    assert abs(result['sentiment_intensity']) < 0.05
+    assert abs(result['sentiment_score']) < 0.05
 
     # Empty string or non-string input should be neutral
     result = analyze_sentiment("")
@@ -129,17 +198,40 @@ def test_sentiment_vader():
     assert result['sentiment_type'] == 'neutral'
 # =============================  Data Base  =============================
 # Data Base Connection -------------------------------------------------------------------------
-@patch.object(connection_db.supabase, "table")
-def test_connection_success(mock_table):
+@patch.object(connection_db, "supabase")
+def test_connection_success(mock_client):
+    # Cliente simulado: sin SUPABASE_URL / SUPABASE_KEY connection_db.supabase es None
     mock_execute = MagicMock()
     mock_execute.data = [{}]
-    mock_table.return_value.select.return_value.execute.return_value = mock_execute
+    mock_client.table.return_value.select.return_value.execute.return_value = mock_execute
 
     result = connection_db.test_connection()
     assert result is True
 
+# Backend de almacenamiento: cliente de Supabase simulado o SQLite en memoria
+@pytest.fixture
+def mock_supabase():
+    client = MagicMock()
+    set_storage(SupabaseStorage(client))
+    yield client
+    set_storage(None)
+
+@pytest.fixture
+def sqlite_storage():
+    storage = SQLiteStorage(":memory:")
+    set_storage(storage)
+    save_comments.stats_cache.clear()
+    yield storage
+    set_storage(None)
+    save_comments.stats_cache.clear()
+
+def scored_comment(comment_id: str, video_id: str = "v1", text: str = "hola", **fields) -> Dict[str, Any]:
+    """Fila de comentario sin ninguna categoría detectada; fields sobrescribe columnas"""
+    scores = {**{f"is_{c}": False for c in TOXICITY_CATEGORIES},
+              **{f"{c}_probability": 0.1 for c in TOXICITY_CATEGORIES}}
+    return {"video_id": video_id, "comment_id": comment_id, "text": text, **scores, **fields}
+
 # Data Base Insertion -------------------------------------------------------------------------
-@patch("server.database.save_comments.supabase")
 def test_save_comment_valid(mock_supabase):
     # Mock response: simula lo que Supabase devuelve tras insertar
     mock_response = MagicMock()
@@ -163,7 +255,7 @@ def test_save_comment_valid(mock_supabase):
     assert result["video_id"] == "test_video"
     assert result["text"] == "Comentario válido"
 # ----------------------------------------------
-def test_save_comment_invalid():
+def test_save_comment_invalid(mock_supabase):
     comment = {
         "text": "Falta el video_id"  # video_id es obligatorio según schema por lo que debería de ser inválido esto
     }
@@ -172,29 +264,743 @@ def test_save_comment_invalid():
 
     assert result is None
 # ----------------------------------------------
+def test_write_comments_skips_unchanged_rows(mock_supabase):
+    comments = [scored_comment("same"), scored_comment("changed", text="adios")]
+    stored = [
+        scored_comment("same", total_likes_comment=0),
+        scored_comment("changed", text="adios", total_likes_comment=0, toxic_probability=0.9),
+    ]
+    table = mock_supabase.table.return_value
+    table.select.return_value.eq.return_value.in_.return_value.execute.return_value.data = stored
+    table.upsert.return_value.execute.return_value.data = [{"comment_id": "changed"}]
+
+    report = save_comments.write_comments(comments)
+
+    assert report.unchanged == 1
+    assert report.rows_written == 1
+    upserted = table.upsert.call_args.args[0]
+    assert [row["comment_id"] for row in upserted] == ["changed"]
+    assert table.upsert.call_args.kwargs["on_conflict"] == "video_id,comment_id"
+# ----------------------------------------------
 # Get comment by video_id
 # def test_get_comments_by_video_id (video_id:str)  -> List[Dict[str, Any]]:
 #     try:
 
 # ----------------------------------------------
-@patch.object(connection_db.supabase, "table")
-def test_get_comments_by_video(mock_table):
-    mock_response = MagicMock()
-    mock_response.data = [{"text": "Comentario 1"}, {"text": "Comentario 2"}]
-    mock_table.return_value.select.return_value.eq.return_value.execute.return_value = mock_response
+def test_get_comments_by_video(mock_supabase, monkeypatch):
+    from server.database import storage
+    monkeypatch.setattr(storage, "SUPABASE_PAGE_SIZE", 2)
+    pages = [[{"id": 1, "text": "Comentario 1"}, {"id": 2, "text": "Comentario 2"}], [{"id": 3, "text": "Comentario 3"}]]
+    by_video = mock_supabase.table.return_value.select.return_value.eq.return_value
+    by_video.gt.return_value.order.return_value.limit.return_value.execute.side_effect = [MagicMock(data=page) for page in pages]
 
+    # Todas las páginas, no solo el máximo de filas de una respuesta de PostgREST
     result = save_comments.get_comments_by_video("video_test")
-    assert len(result) == 2
-    assert result[0]["text"] == "Comentario 1"
+    assert [c["text"] for c in result] == ["Comentario 1", "Comentario 2", "Comentario 3"]
+    assert [call.args for call in by_video.gt.call_args_list] == [("id", 0), ("id", 2)]
 # ----------------------------------------------
-@patch.object(connection_db.supabase, "table")
-def test_delete_comments_by_video(mock_table):
+def test_delete_comments_by_video(mock_supabase):
     mock_response = MagicMock()
-    mock_table.return_value.delete.return_value.eq.return_value.execute.return_value = mock_response
+    mock_supabase.table.return_value.delete.return_value.eq.return_value.execute.return_value = mock_response
 
     result = save_comments.delete_comments_by_video("video_test")
     assert result is True
 # ----------------------------------------------
+def test_sqlite_storage_roundtrip(sqlite_storage):
+    from server.outils.stats_engine import StatsSummary
+
+    comments = [
+        scored_comment(f"c{i}", text=f"comentario {i}", total_likes_comment=i,
+                       is_toxic=i % 2 == 0, toxic_probability=0.9 if i % 2 == 0 else 0.1)
+        for i in range(5)
+    ]
+    assert len(save_comments.save_comments_batch(comments)) == 5
+    # Re-análisis: UPSERT por (video_id, comment_id), sin duplicados
+    comments[0]["toxic_probability"] = 0.5
+    assert len(save_comments.save_comments_batch(comments)) == 1
+
+    page = save_comments.get_comments_page(video_id="v1", limit=2, toxic_only=True, fields=["text"])
+    assert [c["text"] for c in page["comments"]] == ["comentario 0", "comentario 2"]
+    page = save_comments.get_comments_page(video_id="v1", cursor=page["next_cursor"], limit=2, toxic_only=True)
+    assert [c["comment_id"] for c in page["comments"]] == ["c4"] and page["next_cursor"] is None
+    assert page["comments"][0]["is_toxic"] is True
+
+    complete_stats = StatsSummary.from_rows(save_comments.get_comments_by_video("v1")).to_complete_stats()
+    save_comments.save_video_statistics("v1", complete_stats)
+    assert save_comments.get_video_statistics("v1")["toxicity_stats"] == complete_stats["toxicity_stats"]
+    assert save_comments.get_video_sync_state("v1") == {"has_comments": True, "last_published_at": None}
+    assert save_comments.get_known_threads("v1", ["c0", "c9"]) == {"c0": set()}
+
+    assert save_comments.delete_comments_by_video("v1") is True
+    assert save_comments.get_comments_by_video("v1") == []
+# ----------------------------------------------
+def test_comments_page_keyset_by_likes_and_cursor_order_mismatch(sqlite_storage, tmp_path):
+    # Likes con empates: el keyset (likes, id) no repite ni salta comentarios entre páginas.
+    # Sin likes (None) se guarda 0 y va con los demás 0 por id, igual en los dos backends
+    likes = [5, 3, 5, 0, 3, 5, 1, None]
+    save_comments.save_comments_batch([{"video_id": "v1", "comment_id": f"c{i}", "text": str(i),
+                                        "total_likes_comment": n} for i, n in enumerate(likes)])
+    assert save_comments.get_comments_page(video_id="v1", fields=["total_likes_comment"],
+                                           order_by="likes")["comments"][-1]["total_likes_comment"] == 0
+    seen, cursor = [], None
+    while True:
+        page = save_comments.get_comments_page(video_id="v1", cursor=cursor, limit=2,
+                                               fields=["comment_id"], order_by="likes")
+        seen += [row["comment_id"] for row in page["comments"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ["c5", "c2", "c0", "c4", "c1", "c6", "c7", "c3"]
+
+    # Ficheros SQLite con likes NULL de antes: se pasan a 0 al abrirlos
+    legacy = SQLiteStorage(str(tmp_path / "legacy.db"))
+    legacy.upsert_comments([{"video_id": "v1", "comment_id": f"c{i}", "text": str(i)} for i in range(2)])
+    with legacy._conn:
+        legacy._conn.execute("UPDATE sentiment_analyzer SET total_likes_comment = NULL WHERE comment_id = 'c0'")
+    legacy.close()
+    reopened = SQLiteStorage(str(tmp_path / "legacy.db"))
+    assert [row["total_likes_comment"] for row in reopened.query_comments(order_by="likes")] == [0, 0]
+    reopened.close()
+
+    # Un cursor de order_by=id reutilizado con order_by=likes es un error del cliente, no un KeyError
+    id_cursor = save_comments.get_comments_page(video_id="v1", limit=2)["next_cursor"]
+    with pytest.raises(ValueError):
+        save_comments.get_comments_page(video_id="v1", cursor=id_cursor, order_by="likes")
+    with pytest.raises(ValueError):
+        save_comments.get_comments_page(video_id="v1", cursor=save_comments.encode_cursor({"id": "1"}))
+# ----------------------------------------------
+def test_write_queue_retries_and_folds_statistics(sqlite_storage, monkeypatch):
+    comments = [scored_comment(f"c{i}") for i in range(3)]
+
+    # La BD falla las dos primeras escrituras; la cola reintenta sin perder comentarios
+    upsert, failures = sqlite_storage.upsert_comments_returning_previous, [1, 2]
+    def flaky_upsert(rows):
+        if failures:
+            failures.pop()
+            raise Exception("BD no disponible")
+        return upsert(rows)
+    monkeypatch.setattr(sqlite_storage, "upsert_comments_returning_previous", flaky_upsert)
+    monkeypatch.setattr(write_queue, "write_comments",
+                        lambda c, **kw: save_comments.write_comments(c, **{**kw, "max_retries": 0}))
+
+    queue = write_queue.WriteBehindQueue(flush_interval=0.2, backoff=0)
+    queue.enqueue_comments(comments)
+    assert queue.flush(timeout=5)
+
+    info = queue.info()
+    assert info["written_comments"] == 3 and info["failed_comments"] == 0
+    assert info["retries"] == 2
+    assert save_comments.get_video_statistics("v1")["total_comments"] == 3
+    queue.stop()
+# ----------------------------------------------
+def test_write_comments_retries_and_discards_only_the_failing_chunk(sqlite_storage, monkeypatch):
+    comments = [scored_comment(f"c{i}") for i in range(6)]
+
+    # Trozo c2-c3: falla siempre; trozo c4-c5: falla una vez y el reintento pasa
+    upsert, flaky = sqlite_storage.upsert_comments, [1]
+    def partial_upsert(rows):
+        ids = {row["comment_id"] for row in rows}
+        if "c2" in ids or ("c4" in ids and flaky and flaky.pop()):
+            raise Exception("BD no disponible")
+        return upsert(rows)
+    monkeypatch.setattr(sqlite_storage, "upsert_comments", partial_upsert)
+    monkeypatch.setattr(save_comments.time, "sleep", lambda seconds: None)
+
+    report = save_comments.write_comments(comments, chunk_size=2, max_workers=1, max_retries=2)
+
+    assert report.rows_written == 4 and report.failed_chunks == 1
+    assert [row["comment_id"] for row in report.failed_rows] == ["c2", "c3"]
+    # 1 reintento del trozo recuperado + 2 del descartado
+    assert report.retries == 3
+    assert sorted(c["comment_id"] for c in save_comments.get_comments_by_video("v1")) == ["c0", "c1", "c4", "c5"]
+# ----------------------------------------------
+def test_failed_statistics_fold_is_rebuilt_not_lost(sqlite_storage, monkeypatch):
+    from server.outils import prediction_pipeline
+    from server.records import sample_records
+
+    records = sample_records(3)
+    video_id = records.columns["video_id"][0]
+    cas, failures = sqlite_storage.compare_and_set_video_statistics, []
+    def flaky_cas(record, version):
+        if failures:
+            failures.pop()
+            raise Exception("BD no disponible")
+        return cas(record, version)
+    monkeypatch.setattr(sqlite_storage, "compare_and_set_video_statistics", flaky_cas)
+
+    # El fold falla después del UPSERT: el informe lo marca y reintentar no lo arregla
+    failures[:] = [1]
+    report = save_comments.write_comments(records, fold_statistics=True)
+    assert report.rows_written == 3 and report.stale_statistics == [video_id]
+    assert save_comments.write_comments(records, fold_statistics=True).rows_written == 0
+
+    # La cola recalcula el vídeo desde sus comentarios
+    failures[:] = [1]
+    queue = write_queue.WriteBehindQueue(flush_interval=0.05, backoff=0)
+    queue.enqueue_comments(sample_records(5))
+    assert queue.flush(timeout=5)
+    assert queue.info()["failed_statistics"] == 0
+    assert save_comments.get_video_statistics(video_id)["total_comments"] == 5
+    queue.stop()
+
+    # Durable: si ni recalculando se puede, la petición falla en lugar de responder "durable"
+    failures[:] = [1] * 100
+    with pytest.raises(Exception, match="estadísticas"):
+        prediction_pipeline._persist_stage(video_id, sample_records(8), durable=True)
+# ----------------------------------------------
+def test_incremental_fetch_fails_if_write_queue_not_flushed(monkeypatch):
+    from server.outils import prediction_pipeline
+
+    monkeypatch.setattr(prediction_pipeline.write_queue, "flush", lambda timeout=None: False)
+    fetch = MagicMock()
+    monkeypatch.setattr(prediction_pipeline, "fetch_comment_threads", fetch)
+
+    # Sin las filas encoladas, el estado previo las volvería a sumar: falla sin descargar
+    with pytest.raises(Exception, match="cola de escritura"):
+        prediction_pipeline._fetch_stage("v1", 10, incremental=True)
+    fetch.assert_not_called()
+# ----------------------------------------------
+def test_global_aggregates_match_scan_and_are_cached(sqlite_storage, monkeypatch):
+    from server.database import aggregates
+    from server.records import sample_records
+
+    def write_video(index, n):
+        records = sample_records(n, seed=index)
+        records.columns["video_id"] = [f"video{index}"] * n
+        records.columns["comment_id"] = [f"video{index}-{i}" for i in range(n)]
+        save_comments.write_comments(records, fold_statistics=True)
+
+    write_video(0, 40)
+    write_video(1, 25)
+    # La consulta SQL y el recorrido por páginas dan el mismo resultado sobre las mismas filas
+    params = (1, 10, 90.0)
+    assert aggregates._format_aggregates(sqlite_storage.global_aggregates(*params), 10) == \
+        aggregates._format_aggregates(aggregates._scan_aggregates(*params), 10)
+
+    calls = []
+    computed = sqlite_storage.global_aggregates
+    monkeypatch.setattr(sqlite_storage, "global_aggregates", lambda *args: calls.append(args) or computed(*args))
+    first = aggregates.get_global_aggregates()
+    assert aggregates.get_global_aggregates() == first and len(calls) == 1
+    # Otros parámetros, otra entrada; una escritura invalida todas
+    aggregates.get_global_aggregates(bins=5)
+    assert len(calls) == 2
+    write_video(2, 5)
+    assert aggregates.get_global_aggregates()["totals"]["total_comments"] == 70
+    assert len(calls) == 3
+# =============================  Stats cache  =============================
+def test_ttl_cache_evicts_lru_and_expired():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)          # expulsa "b", el menos usado
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    cache.set("d", 4, ttl=-1)  # ya caducado
+    assert cache.get("d") is None
+# ----------------------------------------------
+def test_stats_cache_invalidation_is_shared_between_workers():
+    shared = InMemorySharedBackend()
+    worker_a = StatsCache(shared=shared, shared_local_ttl=60)
+    worker_b = StatsCache(shared=shared, shared_local_ttl=60)
+
+    worker_a.set(video_key("v1"), {"total_comments": 10})
+    assert worker_b.get(video_key("v1")) == {"total_comments": 10}
+
+    worker_b.invalidate("v1")
+    assert worker_b.get(video_key("v1")) is None
+    assert shared.get(video_key("v1")) is None
+
+    # Read-through con una invalidación (de este u otro worker) entre la lectura y el set:
+    # el valor leído puede ser anterior y no se guarda
+    for invalidating in (worker_a, worker_b):
+        generation = worker_a.generation(video_key("v1"))
+        invalidating.invalidate("v1")
+        worker_a.set(video_key("v1"), {"total_comments": 10}, generation=generation)
+        assert worker_a.get(video_key("v1")) is None and shared.get(video_key("v1")) is None
+    worker_a.set(video_key("v1"), {"total_comments": 11}, generation=worker_a.generation(video_key("v1")))
+    assert worker_b.get(video_key("v1")) == {"total_comments": 11}
+# ----------------------------------------------
+def test_single_flight_cache_coalesces_concurrent_requests():
+    import asyncio
+    from server.outils.analysis_cache import SingleFlightCache
+
+    cache = SingleFlightCache(ttl=60)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"total_comments": 5}
+
+    async def run():
+        key = ("v1", 100, False, False)
+        results = await asyncio.gather(*[cache.get_or_compute(key, compute) for _ in range(10)])
+        cached = await cache.get_or_compute(key, compute)
+        refreshed = await cache.get_or_compute(key, compute, force_refresh=True)
+        cache.invalidate("v1")
+        await cache.get_or_compute(key, compute)
+        return results, cached, refreshed
+
+    results, cached, refreshed = asyncio.run(run())
+    assert all(r == {"total_comments": 5} for r in results) and cached == refreshed
+    assert len(calls) == 3
+    info = cache.info()
+    assert info["coalesced"] == 9 and info["hits"] == 1 and info["misses"] == 3
+# ----------------------------------------------
+def test_admission_rejects_when_queue_is_full_and_prioritizes_interactive():
+    import threading
+    from server.outils.admission import AdmissionController, AdmissionRejected
+
+    controller = AdmissionController(capacity=100, base_cost=0, max_queued=1, bulk_timeout=5)
+    order = []
+
+    def run(lane):
+        with controller.admit(100, lane=lane):
+            order.append(lane)
+
+    with controller.admit(100, lane="interactive"):
+        bulk = threading.Thread(target=run, args=("bulk",))
+        bulk.start()
+        while not controller.info()["lanes"]["bulk"]["waiting"]:
+            pass
+        interactive = threading.Thread(target=run, args=("interactive",))
+        interactive.start()
+        while not controller.info()["lanes"]["interactive"]["waiting"]:
+            pass
+        # Cola interactive llena: rechazo inmediato con Retry-After
+        with pytest.raises(AdmissionRejected) as rejected:
+            with controller.admit(10, lane="interactive"):
+                pass
+        assert rejected.value.status_code == 429 and rejected.value.retry_after >= 1
+    bulk.join()
+    interactive.join()
+    # El interactive encolado después pasa antes que el bulk
+    assert order == ["interactive", "bulk"]
+# =============================  Text scoring  =============================
+def test_parse_score_payload_json_ndjson_and_invalid_items(monkeypatch):
+    import json
+    from fastapi.testclient import TestClient
+    from server.main import app
+    from server.outils import text_scoring
+    from server.outils.admission import admission
+
+    parse = text_scoring.parse_score_payload
+    assert parse(b'["hola", {"id": "x", "text": "adios"}]') == [{"id": 0, "text": "hola"}, {"id": "x", "text": "adios"}]
+    assert parse(b'{"texts": ["a", "b"]}') == [{"id": 0, "text": "a"}, {"id": 1, "text": "b"}]
+    assert parse(b'"a"\n\n{"id": 7, "text": "b"}\n', "application/x-ndjson") == [{"id": 0, "text": "a"}, {"id": 7, "text": "b"}]
+    for body in (b'{"text": "a"}', b'["a", 3]', b'[{"id": 1}]'):
+        with pytest.raises(ValueError):
+            parse(body)
+
+    client = TestClient(app)
+    assert client.post("/api/score", content=b'["a", {"text": null}]').status_code == 400
+    # Respuesta completa: el hueco de admisión se libera al terminar el stream
+    monkeypatch.setattr(text_scoring, "score_records", lambda records: [{"id": r["id"]} for r in records])
+    response = client.post("/api/score", content=b'["a", "b"]')
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == [0, 1]
+    assert admission.info()["lanes"]["interactive"]["in_flight_cost"] == 0
+# ----------------------------------------------
+def test_stream_scores_keeps_input_order_across_chunks(monkeypatch):
+    import json
+    import time
+    import asyncio
+    from server.outils import text_scoring
+
+    def score_records(records):
+        # El primer trozo es el más lento: el orden de salida no puede depender de quién acaba antes
+        time.sleep(0.05 if records[0]["id"] == 0 else 0)
+        return [{"id": r["id"]} for r in records]
+
+    monkeypatch.setattr(text_scoring, "score_records", score_records)
+    records = [{"id": i, "text": str(i)} for i in range(10)]
+
+    async def run():
+        return [chunk async for chunk in text_scoring.stream_scores(records, chunk_size=3)]
+
+    chunks = asyncio.run(run())
+    assert len(chunks) == 4
+    assert [json.loads(line)["id"] for chunk in chunks for line in chunk.splitlines()] == list(range(10))
+# ----------------------------------------------
+def test_analysis_jobs_stream_cancel_and_purge(monkeypatch):
+    import json
+    import time
+    import asyncio
+    import threading
+    from server.outils import analysis_jobs
+    from server.outils.stats_engine import compute_complete_stats
+    from server.records import sample_records
+
+    records = sample_records(5)
+    release = threading.Event()
+    monkeypatch.setattr(analysis_jobs, "extract_video_id", lambda url: url)
+    monkeypatch.setattr(analysis_jobs, "_fetch_stage", lambda video_id, n, incremental: ([{}] * len(records), None))
+    monkeypatch.setattr(analysis_jobs, "_clean_stage", lambda comments: pd.DataFrame({"i": range(len(comments))}))
+
+    def score(part, video_id):
+        release.wait(5)
+        batch = records.slice(part["i"].iloc[0], part["i"].iloc[-1] + 1)
+        return batch, compute_complete_stats(batch)
+
+    monkeypatch.setattr(analysis_jobs, "_score_stage", score)
+
+    # Stream de un job terminado: trozos con progreso y estadísticas, sin los comentarios
+    release.set()
+    job = analysis_jobs.AnalysisJob("v1", max_comments=5, persist=False)
+    analysis_jobs.run_analysis_job(job, batch_size=2)
+    assert job.status == "done" and len(job.result().comments) == 5
+
+    async def collect(fmt):
+        return [chunk async for chunk in analysis_jobs.stream_job_events(job, fmt, poll_interval=0)]
+
+    events = [json.loads(chunk) for chunk in asyncio.run(collect("ndjson"))]
+    assert [e["type"] for e in events] == ["stage", "stage", "stage", "comments", "comments", "comments", "end"]
+    assert events[-2]["scored"] == 5 and "comments" not in events[-2] and "stats" in events[-2]
+    assert asyncio.run(collect("sse"))[-1].startswith(b"event: end\n")
+
+    # Cancelado entre dos trozos: sin resultado ni comentarios retenidos
+    release.clear()
+    job = analysis_jobs.submit_analysis_job("v2", max_comments=5)
+    job.cancel()
+    release.set()
+    for _ in range(100):
+        if job.finished:
+            break
+        time.sleep(0.05)
+    assert job.status == "cancelled" and job.scored < 5 and len(job.comments) == 0
+
+    # Caducados: fuera del registro pasado el TTL
+    assert analysis_jobs.get_analysis_job(job.job_id) is job
+    monkeypatch.setattr(analysis_jobs, "ANALYSIS_JOB_TTL", 0)
+    job.finished_at -= 1
+    assert analysis_jobs.get_analysis_job(job.job_id) is None
+# ----------------------------------------------
+def test_bulk_expand_targets_writer_batches_and_job_purge(monkeypatch):
+    import time
+    from server.outils import bulk_analysis
+    from server.outils.stats_engine import compute_complete_stats
+    from server.records import sample_records
+
+    monkeypatch.setattr(bulk_analysis, "fetch_playlist_video_ids", lambda pid, max_videos: ["dQw4w9WgXcQ", "p2"])
+    monkeypatch.setattr(bulk_analysis, "fetch_channel_video_ids", lambda cid, max_videos: ["p2", "c1"])
+    targets = bulk_analysis.expand_targets(["https://www.youtube.com/watch?v=dQw4w9WgXcQ"], "PL1", "UC1")
+    assert targets == ["dQw4w9WgXcQ", "p2", "c1"]
+
+    # Lotes de batch_size filas (o más, si un vídeo lo supera); flush escribe el resto
+    batches = []
+    monkeypatch.setattr(bulk_analysis, "save_comments_batch", lambda rows, **kwargs: batches.append(len(rows)) or rows)
+    writer = bulk_analysis.BulkWriter(batch_size=5)
+    for n in (3, 3, 2):
+        records = sample_records(n)
+        writer.add("v1", records, compute_complete_stats(records))
+    assert batches == [6]
+    writer.flush()
+    assert batches == [6, 2] and writer.rows_written == 8
+    assert writer.summary.to_complete_stats()["total_comments"] == 8
+
+    job = bulk_analysis.BulkJob(["v1"])
+    job.finished_at = time.time() - bulk_analysis.BULK_JOB_TTL - 1
+    bulk_analysis.JOBS[job.job_id] = job
+    assert bulk_analysis.get_bulk_job(job.job_id) is None
+# ----------------------------------------------
+def test_durable_request_shares_the_analysis_and_persists_it(monkeypatch):
+    from fastapi.testclient import TestClient
+    import server.main as main
+    from server.records import AnalysisResult, sample_records
+    from server.outils.stats_engine import compute_complete_stats
+
+    records = sample_records(3)
+    runs, persisted = [], []
+
+    async def analyze_video_async(video_id, durable=False, **kwargs):
+        runs.append(durable)
+        return AnalysisResult(video_id, records, compute_complete_stats(records), persistence="durable" if durable else "queued")
+
+    monkeypatch.setattr(main, "analyze_video_async", analyze_video_async)
+    monkeypatch.setattr(main, "_persist_stage", lambda video_id, recs, durable: persisted.append(len(recs)) or "durable")
+    main.analysis_cache.clear()
+    client = TestClient(main.app)
+
+    body = {"url_or_id": "dQw4w9WgXcQ", "max_comments": 3}
+    assert client.post("/api/CommentAnalyzer/", json=body).json()["persistence"] == "queued"
+    # Misma clave de caché: no se repite el análisis, pero sus comentarios se guardan ya
+    assert client.post("/api/CommentAnalyzer/", json={**body, "durable": True}).json()["persistence"] == "durable"
+    assert runs == [False] and persisted == [3]
+    main.analysis_cache.clear()
+# ----------------------------------------------
+def test_columnar_payload_fields_precision_and_thresholds(monkeypatch):
+    from server.outils import prediction_pipeline
+    from server.outils.compact_response import columnar_payload, parse_response_fields
+    from server.records import AnalysisResult, sample_records, FLAG_FIELDS
+
+    loader = MagicMock()
+    loader.config = {"thresholds": {"toxic": 0.4}}
+    monkeypatch.setattr(prediction_pipeline, "model_loader", loader)
+    result = AnalysisResult("v1", sample_records(3), {})
+
+    fields = parse_response_fields("comment_id, toxic_probability")
+    payload = columnar_payload(result, fields, precision=2)
+    assert payload["fields"] == ["comment_id", "toxic_probability"]
+    assert list(payload["comments"]) == fields
+    assert payload["comments"]["toxic_probability"] == [round(p, 2) for p in result.records.column("toxic_probability")]
+    # Sin los is_*: umbrales para derivarlos en el cliente
+    assert payload["thresholds"] == {"toxic": 0.4}
+
+    rows = columnar_payload(result, ["comment_id", *FLAG_FIELDS], columnar=False)
+    assert "thresholds" not in rows and rows["comments"][0]["comment_id"] == "comment0000000"
+    with pytest.raises(ValueError):
+        parse_response_fields("text,unknown")
+# ----------------------------------------------
+def test_fast_json_response_matches_stdlib_json(monkeypatch):
+    import json
+    import datetime
+    import numpy as np
+    from server.outils import fast_json
+
+    published = datetime.datetime(2025, 7, 10, 12, 30, tzinfo=datetime.timezone.utc)
+    payload = {"total": np.int64(5), "score": np.float32(0.25), "toxic": np.bool_(True),
+               "rates": [np.float64(0.5), float("nan"), np.float32("nan")],
+               "published_at": published, "day": published.date()}
+    # Lo mismo en JSON estándar escrito a mano: NaN como null y fechas en ISO 8601
+    expected = json.loads(json.dumps({"total": 5, "score": 0.25, "toxic": True, "rates": [0.5, None, None],
+                                      "published_at": "2025-07-10T12:30:00+00:00", "day": "2025-07-10"}))
+
+    # Con orjson (si está instalado) y con la alternativa de la librería estándar
+    for encoder in {fast_json.orjson, None}:
+        monkeypatch.setattr(fast_json, "orjson", encoder)
+        assert json.loads(fast_json.FastJSONResponse(payload).body) == expected
+# ----------------------------------------------
+def test_scored_comments_rows_without_pydantic_and_validated_at_the_boundary():
+    import numpy as np
+    from server.records import ScoredComments
+
+    probabilities = np.full((2, 12), 0.2)
+    probabilities[0, 0] = 0.9
+    probabilities[1] = np.nan   # comentario que el modelo no pudo puntuar
+    columns = {
+        "video_id": ["v1", "v1"], "comment_id": ["c1", "c2"], "thread_id": ["c1", "c2"],
+        "parent_comment_id": [None, None], "published_at_comment": [None, None],
+        "text": ["idiota", "hola"], "sentiment_type": ["negative", "neutral"],
+        "sentiment_score": [-0.5, 0.0], "sentiment_intensity": ["strong", "weak"],
+        "total_likes_comment": [3, 0],
+    }
+    records = ScoredComments(columns, probabilities, probabilities > 0.5)
+
+    rows = save_comments.to_db_rows(records)
+    assert rows[0]["is_toxic"] is True and rows[0]["toxic_probability"] == 0.9
+    assert "toxic_probability" not in rows[1] and "is_toxic" not in rows[1]
+    assert "parent_comment_id" not in rows[0]
+
+    comments = records.to_comments()
+    assert comments[0].is_toxic and comments[1].toxic_probability is None
+    assert len(ScoredComments.concat([records.slice(0, 1), records.slice(1, 2)])) == 2
+# ----------------------------------------------
+def test_stats_engine_counts_and_cooccurrence():
+    import numpy as np
+    from server.records import ScoredComments
+    from server.outils.stats_engine import compute_complete_stats
+
+    probabilities = np.zeros((3, 12))
+    probabilities[0, [0, 4]] = 0.9   # toxic + racist
+    probabilities[1, 0] = 0.9        # solo toxic
+    columns = {
+        "video_id": ["v1"] * 3, "comment_id": ["c1", "c2", "c3"], "thread_id": ["c1", "c2", "c3"],
+        "parent_comment_id": [None] * 3, "published_at_comment": [None] * 3, "text": ["a", "b", "c"],
+        "sentiment_type": ["negative", "negative", None], "sentiment_score": [-0.6, -0.3, 0.0],
+        "sentiment_intensity": ["strong", "weak", "weak"], "total_likes_comment": [4, 0, 2],
+        "is_self_promotional": [False, False, True],
+    }
+    stats = compute_complete_stats(ScoredComments(columns, probabilities, probabilities > 0.5))
+
+    assert stats["toxicity_stats"]["is_toxic"] == {"true": 2, "false": 1}
+    assert stats["toxicity_cooccurrence"] == {"is_toxic": {"is_racist": 1}, "is_racist": {"is_toxic": 1}}
+    assert stats["percentage_toxicity"] == pytest.approx(200 / 3)
+    assert stats["sentiment_distribution"] == {"negative": 2, "neutral": 1}
+    assert stats["total_likes"] == 6 and stats["max_likes"] == 4 and stats["self_promotional"] == 1
+    assert stats["mean_sentiment_score"] == pytest.approx(-0.3)
+# ----------------------------------------------
+def test_video_statistics_folded_on_write_and_delete(sqlite_storage):
+    from server.outils.stats_engine import StatsSummary
+
+    comments = [
+        scored_comment(f"c{i}", text=f"comentario {i}", total_likes_comment=i, sentiment_type="positive",
+                       sentiment_score=0.5, published_at_comment=f"2025-07-0{1 + i // 2}T1{i}:30:00+00:00")
+        for i in range(4)
+    ]
+    save_comments.write_comments(comments[:2], fold_statistics=True)
+    save_comments.write_comments(comments[2:], fold_statistics=True)
+    # Re-análisis de c0: se resta su versión anterior y se suma la nueva
+    comments[0] = {**comments[0], "is_toxic": True, "toxic_probability": 0.9, "sentiment_type": "negative"}
+    save_comments.write_comments(comments[:1], fold_statistics=True)
+    assert save_comments.delete_comments("v1", ["c3"]) == 1
+
+    stats = save_comments.get_video_statistics("v1")
+    assert stats["total_comments"] == 3 and stats["total_likes"] == 3
+    assert stats["toxicity_stats"]["is_toxic"] == {"true": 1, "false": 2}
+    assert stats["sentiment_distribution"] == {"positive": 2, "negative": 1}
+    # Igual que recalcular desde todas las filas
+    rebuilt = StatsSummary.from_rows(save_comments.get_comments_by_video("v1")).to_dict()
+    assert stats["summary"]["probability_sums"] == pytest.approx(rebuilt["probability_sums"])
+    assert stats["summary"]["likes"]["sumsq"] == rebuilt["likes"]["sumsq"]
+
+    # Franjas por día: c0 (ahora tóxico) y c1 el 1 de julio, c2 el 2 (c3 borrado)
+    timeline = save_comments.get_timeline("v1", "day")
+    assert [(b["bucket_start"], b["comments"], b["toxic"]) for b in timeline] == \
+        [("2025-07-01T00:00:00Z", 2, 1), ("2025-07-02T00:00:00Z", 1, 0)]
+    assert [b["comments"] for b in save_comments.get_timeline("v1", "hour", start="2025-07-01T11:00:00Z")] == [1, 1]
+
+    # Resumen de canal: suma de los resúmenes de sus vídeos
+    save_comments.write_comments([{**comments[1], "video_id": "v2"}], fold_statistics=True)
+    channel = save_comments.get_summary_statistics(["v1", "v2"])
+    assert channel["total_comments"] == 4 and channel["videos"] == 2
+# ----------------------------------------------
+def test_legacy_statistics_rows_are_rebuilt_not_approximated(sqlite_storage):
+    from server.records import sample_records
+
+    save_comments.write_comments(sample_records(30))
+    # Fila anterior a los resúmenes: solo los números de la última petición (10 comentarios)
+    sqlite_storage.compare_and_set_video_statistics({"video_id": "video000001", "total_comments": 10}, None)
+    save_comments.write_comments([{**row, "total_likes_comment": 1000} for row in save_comments.to_db_rows(sample_records(1))],
+                                 validate=False, fold_statistics=True)
+    stats = save_comments.get_video_statistics("video000001")
+    assert stats["total_comments"] == 30 and stats["summary"]["count"] == 30 and stats["max_likes"] == 1000
+
+    # Las lecturas no recalculan: la fila se devuelve marcada y queda fuera de las sumas
+    sqlite_storage.compare_and_set_video_statistics({"video_id": "other", "total_comments": 3}, None)
+    assert save_comments.get_video_statistics("other")["needs_rebuild"] is True
+    assert save_comments.get_summary_statistics()["needs_rebuild"] == ["other"]
+    assert save_comments.get_summary_statistics()["total_comments"] == 30
+    assert save_comments.backfill_video_statistics() == {"legacy": 1, "rebuilt": 1}
+    stats = save_comments.get_all_video_statistics()[1]
+    assert stats["total_comments"] == 0 and "needs_rebuild" not in stats
+# ----------------------------------------------
+def test_concurrent_writes_fold_statistics_once(tmp_path, monkeypatch):
+    import threading
+    from server.records import sample_records
+
+    # Dos workers (conexiones distintas al mismo fichero) escriben a la vez los mismos comentarios
+    path = str(tmp_path / "sentiment_analyzer.db")
+    workers = [SQLiteStorage(path), SQLiteStorage(path)]
+    local = threading.local()
+    monkeypatch.setattr(save_comments, "get_storage", lambda: getattr(local, "storage", workers[0]))
+    save_comments.stats_cache.clear()
+    barrier = threading.Barrier(2)
+
+    def write(storage):
+        local.storage = storage
+        barrier.wait()
+        save_comments.write_comments(sample_records(50), fold_statistics=True)
+
+    threads = [threading.Thread(target=write, args=(storage,)) for storage in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = workers[0].get_video_statistics("video000001")
+    assert stats["total_comments"] == 50 and stats["summary"]["count"] == 50
+    assert [b["comments"] for b in workers[1].get_time_buckets("video000001", "hour")] == [50]
+    save_comments.stats_cache.clear()
+# ----------------------------------------------
+def test_distribution_sketches_merge_and_delete_in_constant_size():
+    import numpy as np
+    from server.records import sample_records
+    from server.outils.stats_engine import StatsSummary, distribution, STATS_SAMPLE_SIZE
+
+    records = sample_records(3000)
+    first, second = StatsSummary.from_records(records.slice(0, 2000)), StatsSummary.from_records(records.slice(2000, 3000))
+    full = StatsSummary.from_records(records)
+    # La muestra bottom-k de la unión es la unión de las muestras
+    assert set((first + second).sample) == set(full.sample) and len(full.sample) == STATS_SAMPLE_SIZE
+
+    dist = distribution(full)
+    exact = np.quantile(records.probabilities[:, 0], 0.9)
+    assert abs(dist["probabilities"]["toxic"]["quantiles"]["p90"] - exact) < 0.02
+    assert sum(dist["sentiment_score"]["counts"]) == 3000 and len(dist["sample"]) == STATS_SAMPLE_SIZE
+
+    # Borrar los 2000 primeros deja histogramas y muestra como si solo existieran los demás
+    after_delete = full + (StatsSummary() - StatsSummary.from_rows(records.slice(0, 2000).rows()))
+    assert (after_delete.probability_histogram == second.probability_histogram).all()
+    assert set(after_delete.sample) == set(full.sample) & set(second.sample)
+# ----------------------------------------------
+def test_estimate_mode_sample_size_and_stratified_interval():
+    from server.records import sample_records
+    from server.outils.estimation import sample_size, draw_sample, estimate_from_sample
+
+    # ±3 puntos al 95 %: ~1067 sin corrección de población finita
+    assert sample_size(10 ** 9, 0.03) == 1068 and sample_size(20000, 0.03) < 1068 and sample_size(50, 0.03) <= 50
+
+    records = sample_records(20000, seed=1)
+    comments = [{"commentId": cid, "isReply": i % 4 == 0, "publishedAtComment": f"2025-07-{1 + i // 1000:02d}T00:00:00Z"}
+                for i, cid in enumerate(records.column("comment_id"))]
+    sample, strata = draw_sample(comments, sample_size(len(comments), 0.03), seed=0)
+    assert len(strata) == 8 and sum(info["population"] for info in strata.values()) == 20000
+
+    # Solo cuentan las filas muestreadas aunque lleguen todas
+    estimate = estimate_from_sample(records, strata, error_bound=0.03)
+    true_rate = records.flags[:, 0].mean() * 100
+    toxic = estimate["toxicity_rates"]["is_toxic"]
+    assert estimate["sample_size"] == len(sample)
+    assert toxic["lower"] <= true_rate <= toxic["upper"] and estimate["achieved_margin"] <= 3.1
+# ----------------------------------------------
+def test_metrics_histograms_counters_and_prometheus_text():
+    from server.outils.metrics import Registry, Histogram, Counter, stage_timer, STAGE_SECONDS, ERRORS
+
+    registry = Registry()
+    latency = registry.register(Histogram("stage_seconds", "Latencia", ["stage"], buckets=(0.1, 1)))
+    processed = registry.register(Counter("processed_total", "Procesados", ["source"]))
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, stage="forward")
+    processed.inc(3, source="youtube")
+    registry.add_collector(lambda: [("cache_hits_total", "counter", "Aciertos", [({"cache": "analysis"}, 2)])])
+
+    text = registry.render()
+    # Buckets acumulados y +Inf = número de observaciones
+    assert 'stage_seconds_bucket{stage="forward",le="0.1"} 1' in text
+    assert 'stage_seconds_bucket{stage="forward",le="1"} 2' in text
+    assert 'stage_seconds_bucket{stage="forward",le="+Inf"} 3' in text
+    assert 'stage_seconds_count{stage="forward"} 3' in text
+    assert 'processed_total{source="youtube"} 3' in text
+    assert 'cache_hits_total{cache="analysis"} 2' in text
+
+    # stage_timer mide también las etapas que fallan y las cuenta como error
+    before = STAGE_SECONDS.count(stage="test_stage"), ERRORS.value(stage="test_stage")
+    with pytest.raises(ValueError):
+        with stage_timer("test_stage"):
+            raise ValueError("boom")
+    assert (STAGE_SECONDS.count(stage="test_stage"), ERRORS.value(stage="test_stage")) == (before[0] + 1, before[1] + 1)
+# ----------------------------------------------
+def test_profiling_samples_pool_threads_and_stores_artifacts(tmp_path, monkeypatch):
+    import time
+    import threading
+    from server.outils import profiling
+
+    monkeypatch.setattr(profiling, "PROFILE_ADMIN_TOKEN", "secret")
+    assert profiling.profile_trigger("secret", None, 0) == "header"
+    assert profiling.profile_trigger("otro", "secret", 0) == "query"
+    assert profiling.profile_trigger("otro", None, 0) is None
+
+    def busy_work():
+        started = time.perf_counter()
+        while time.perf_counter() - started < 0.2:
+            sum(range(1000))
+
+    # Sin sesión activa bind no envuelve nada
+    assert profiling.bind(busy_work) is busy_work
+    with profiling.profile_request("header", "video") as session:
+        worker = threading.Thread(target=profiling.bind(busy_work))
+        worker.start()
+        worker.join()
+    assert session.samples > 0
+    assert any("busy_work" in row["function"] for row in session.summary()["top_self"])
+
+    store = profiling.ProfileStore(tmp_path, max_artifacts=1)
+    store.save(session, {"status_code": 200})
+    assert store.get_summary(session.profile_id)["status_code"] == 200
+    assert "busy_work" in store.get_folded(session.profile_id)
+    assert store.get_summary("../etc") is None
+# ----------------------------------------------
 if __name__ == "__main__":
     import sys
     import pytest